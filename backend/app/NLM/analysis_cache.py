@@ -0,0 +1,138 @@
+import hashlib
+import os
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from NLM.instrumentation import count
+
+# Da incrementare quando cambiano modelli o regole: invalida le voci salvate
+CACHE_VERSION = "5"
+
+def normalize_text(text: str) -> str:
+    """
+    Normalizza il testo per la chiave di cache (unicode e spazi). Le maiuscole
+    restano: NER cased e parse spaCy danno risultati diversi su "Dune" e "dune".
+    """
+    return " ".join(unicodedata.normalize("NFKC", text).split())
+
+def make_cache_key(text: str, language: str, variant: str = "") -> str:
+    """
+    Chiave stabile per testo normalizzato + lingua, uguale tra processi diversi.
+    variant distingue risultati calcolati in modo diverso (es. modalità di estrazione).
+    """
+    raw = f"{CACHE_VERSION}:{language}:{variant}:{normalize_text(text)}"
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+class AnalysisCache:
+    """
+    Cache LRU in memoria con TTL per i risultati di extract_habits_ml.
+
+    Può avere un backend persistente (es. tabella Postgres) con metodi
+    get(key, language) e set(key, language, value): viene consultato sui miss
+    in memoria, così la cache sopravvive ai riavvii ed è condivisa tra worker.
+    I risultati restituiti sono condivisi: vanno trattati in sola lettura.
+    """
+
+    def __init__(self, max_size: int = 10000, ttl: Optional[float] = 3600.0, backend=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.backend = backend
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "backend_hits": 0, "evictions": 0, "expired": 0, "backend_errors": 0}
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_size > 0
+
+    def get(self, text: str, language: str, variant: str = "") -> Optional[Dict[str, Any]]:
+        if not self.enabled:
+            return None
+
+        key = make_cache_key(text, language, variant)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at is None or expires_at > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self._stats["hits"] += 1
+                    count("analysis_cache", result="hit")
+                    return self._for_text(value, text)
+                del self._entries[key]
+                self._stats["expired"] += 1
+
+        if self.backend is not None:
+            try:
+                value = self.backend.get(key, language)
+            except Exception as e:
+                print(f"⚠️ Errore lettura cache persistente: {e}")
+                value = None
+                with self._lock:
+                    self._stats["backend_errors"] += 1
+            if value is not None:
+                self._store(key, value)
+                with self._lock:
+                    self._stats["backend_hits"] += 1
+                count("analysis_cache", result="backend_hit")
+                return self._for_text(value, text)
+
+        with self._lock:
+            self._stats["misses"] += 1
+        count("analysis_cache", result="miss")
+        return None
+
+    def set(self, text: str, language: str, value: Dict[str, Any], variant: str = ""):
+        if not self.enabled:
+            return
+
+        key = make_cache_key(text, language, variant)
+        self._store(key, value)
+        if self.backend is not None:
+            try:
+                self.backend.set(key, language, value)
+            except Exception as e:
+                print(f"⚠️ Errore scrittura cache persistente: {e}")
+                with self._lock:
+                    self._stats["backend_errors"] += 1
+
+    def _store(self, key: str, value: Dict[str, Any]):
+        expires_at = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self._stats["evictions"] += 1
+
+    @staticmethod
+    def _for_text(value: Dict[str, Any], text: str) -> Dict[str, Any]:
+        # Stesso testo normalizzato, ma il risultato riporta il testo originale
+        return dict(value, text=text)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self._stats["hits"] + self._stats["backend_hits"] + self._stats["misses"]
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "ttl": self.ttl,
+                "persistent_backend": self.backend is not None,
+                "hit_rate": (self._stats["hits"] + self._stats["backend_hits"]) / lookups if lookups else 0.0,
+                **self._stats,
+            }
+
+def create_analysis_cache() -> AnalysisCache:
+    """Cache configurata da ANALYSIS_CACHE_SIZE (0 = disattivata) e ANALYSIS_CACHE_TTL_S"""
+    ttl = float(os.getenv('ANALYSIS_CACHE_TTL_S', '3600'))
+    return AnalysisCache(
+        max_size=int(os.getenv('ANALYSIS_CACHE_SIZE', '10000')),
+        ttl=ttl if ttl > 0 else None,
+    )
@@ -1,93 +1,102 @@
-import spacy
-from langdetect import detect
-import re
-from transformers import AutoTokenizer, AutoModelForTokenClassification
-from transformers.pipelines import pipeline
-from typing import Dict, List
+import os
+from typing import Dict, List, Optional
 from api.models.HabitInput import HabitDatabaseModel
+from NLM.model_registry import registry, DEFAULT_LANGUAGE
+from NLM.analysis_cache import create_analysis_cache
+from NLM.lexicon import LexiconEngine, get_lexicon
+from NLM.language_detect import get_detector
+from NLM.instrumentation import count, timed
 
-# Carica i modelli una volta sola
-try:
-    nlp_en = spacy.load("en_core_web_lg")
-except OSError:
-    nlp_en = spacy.load("en_core_web_sm")
+# Dimensioni dei batch per nlp.pipe e per i pipeline NER
+SPACY_BATCH_SIZE = int(os.getenv('NLP_SPACY_BATCH_SIZE', '32'))
+NER_BATCH_SIZE = int(os.getenv('NLP_NER_BATCH_SIZE', '16'))
 
-try:
-    nlp_it = spacy.load("it_core_news_sm")
-except OSError:
-    nlp_it = None
+# Modalità di estrazione: "full" (sempre NER transformer) o "tiered"
+# (prima spaCy/regole, transformer solo se target mancante o confidenza sotto soglia)
+EXTRACTION_MODE = os.getenv('NLP_EXTRACTION_MODE', 'full')
+TIER_CONFIDENCE_THRESHOLD = float(os.getenv('NLP_TIER_CONFIDENCE_THRESHOLD', '0.6'))
 
-# Inizializza i modelli transformer
-try:
-    # Per inglese - modello BERT fine-tuned
-    tokenizer_en = AutoTokenizer.from_pretrained("dbmdz/bert-large-cased-finetuned-conll03-english")
-    model_en = AutoModelForTokenClassification.from_pretrained("dbmdz/bert-large-cased-finetuned-conll03-english")
-    ner_pipeline_en = pipeline("ner", model=model_en, tokenizer=tokenizer_en, aggregation_strategy="simple")
-    # Per italiano - modello BERT fine-tuned
-    tokenizer_it = AutoTokenizer.from_pretrained("Davlan/bert-base-multilingual-cased-ner-hrl")
-    model_it = AutoModelForTokenClassification.from_pretrained("Davlan/bert-base-multilingual-cased-ner-hrl")
-    ner_pipeline_it = pipeline("ner", model=model_it, tokenizer=tokenizer_it, aggregation_strategy="simple")
+# Livello di dettaglio: "full" calcola tutto, "core" salta le parti che servono
+# solo alla risposta completa (elenco delle entità NER e di tutte le quantità).
+# Azione, quantità principale, target e frequenza sono identici nei due livelli;
+# extraction_tier dipende da quando gira il NER, quindi in "core" resta None.
+DETAIL_LEVELS = ("full", "core")
+FULL_DETAIL_FIELDS = frozenset({"quantities", "entities_detected", "extraction_tier"})
 
-    print("✅ Modelli transformer caricati con successo")
-except Exception as e:
-    print(f"⚠️ Errore nel caricamento dei modelli transformer: {e}")
-    ner_pipeline_en = None
-    ner_pipeline_it = None
+# I modelli spaCy e transformer vengono caricati dal registry al primo utilizzo
 
-def detect_language(text: str) -> spacy.language.Language:
+# Cache dei risultati per testo normalizzato + lingua
+analysis_cache = create_analysis_cache()
+
+def detect_language_code(text: str, hint: Optional[str] = None) -> str:
+    """
+    Lingua del testo, limitata alle lingue con un modello spaCy disponibile.
+    Se il client indica una lingua supportata il rilevamento viene saltato.
+    """
+    if hint:
+        hint = hint.strip().lower()
+        if hint in registry.supported_languages and registry.get_spacy(hint) is not None:
+            return hint
+    
     try:
-        lang = detect(text)
-        if lang == "it" and nlp_it is not None:
-            return nlp_it
-        else:
-            return nlp_en
+        lang = get_detector().detect(text)
+        if lang in registry.supported_languages and registry.get_spacy(lang) is not None:
+            return lang
+        return DEFAULT_LANGUAGE
     except Exception as e:
         print(f"Language detection error: {e}")
-        return nlp_en
+        return DEFAULT_LANGUAGE
+
+def detect_language(text: str):
+    """Restituisce la pipeline spaCy per la lingua del testo"""
+    return registry.get_spacy(detect_language_code(text))
 
 class HabitExtractorML:
-    def __init__(self):
-        self.frequency_patterns = {
-            "daily": {"frequency": 7, "period": 7},
-            "weekly": {"frequency": 1, "period": 7},
-            "monthly": {"frequency": 1, "period": 30},
-            "giornalmente": {"frequency": 7, "period": 7},
-            "settimanalmente": {"frequency": 1, "period": 7},
-            "mensilmente": {"frequency": 1, "period": 30},
-        }
+    def __init__(self, lexicon: Optional[LexiconEngine] = None):
+        # Pattern di frequenza e unità compilati una volta (vedi data/lexicon.json)
+        self.lexicon = lexicon or get_lexicon()
     
     def extract_with_transformer(self, text: str, lang_code: str) -> Dict:
         """Usa modelli transformer per estrazione entità"""
-        entities = {"PERSON": [], "ORG": [], "LOC": [], "MISC": [], "numbers": [], "temporal": []}
+        return self.extract_with_transformer_batch([text], lang_code)[0]
+    
+    def extract_with_transformer_batch(self, texts: List[str], lang_code: str) -> List[Dict]:
+        """Esegue il NER transformer su più testi della stessa lingua in un solo passaggio"""
+        results = [_empty_entities() for _ in texts]
         
         try:
             # Seleziona il pipeline giusto in base alla lingua
-            pipeline = ner_pipeline_it if lang_code == "it" else ner_pipeline_en
+            pipeline = registry.get_ner(lang_code)
             
-            if pipeline:
-                ner_results = pipeline(text)
+            if pipeline and texts:
+                # Con una lista in input il pipeline restituisce una lista di risultati per testo
+                batch_results = pipeline(list(texts), batch_size=NER_BATCH_SIZE)
                 
-                for entity in ner_results:
-                    entity_type = entity["entity_group"]
-                    entity_text = entity["word"]
-                    
-                    if entity_type in entities:
-                        entities[entity_type].append({
-                            "text": entity_text,
-                            "score": entity["score"],
-                            "start": entity["start"],
-                            "end": entity["end"]
-                        })
+                for entities, ner_results in zip(results, batch_results):
+                    for entity in ner_results:
+                        entity_type = entity["entity_group"]
+                        entity_text = entity["word"]
+                        
+                        if entity_type in entities:
+                            entities[entity_type].append({
+                                "text": entity_text,
+                                "score": entity["score"],
+                                "start": entity["start"],
+                                "end": entity["end"]
+                            })
         except Exception as e:
             print(f"Errore transformer NER: {e}")
         
-        return entities
+        return results
     
-    def extract_numbers_and_units(self, doc) -> List[Dict]:
-        """Estrae numeri e relative unità usando spaCy + pattern"""
+    def extract_numbers_and_units(self, doc, limit: Optional[int] = None) -> List[Dict]:
+        """Estrae numeri e relative unità usando spaCy + pattern (al più `limit`)"""
         quantities = []
+        lang_code = getattr(doc, "lang_", None)
         
         for token in doc:
+            if limit is not None and len(quantities) >= limit:
+                break
             if token.pos_ == "NUM" or token.like_num:
                 quantity_info = {
                     "number": token.text,
@@ -100,16 +109,8 @@ class HabitExtractorML:
                     next_token = doc[i]
                     if next_token.pos_ in ("NOUN", "PROPN", "SYM"):
                         # Classifica il tipo di unità
-                        unit_text = next_token.text.lower()
-                        
-                        if any(unit in unit_text for unit in ["km", "metri", "m", "litri", "l", "kg", "g"]):
-                            quantity_info["context"] = "physical_measure"
-                        elif any(unit in unit_text for unit in ["pagine", "page", "minuti", "minute", "ore", "hour"]):
-                            quantity_info["context"] = "time_or_quantity"
-                        elif any(unit in unit_text for unit in ["euro", "dollar", "$"]):
-                            quantity_info["context"] = "money"
-                        else:
-                            quantity_info["context"] = "general"
+                        context = self.lexicon.unit_context(next_token.text, lang_code)
+                        quantity_info["context"] = context or "general"
                         
                         quantity_info["unit"] = next_token.text
                         break
@@ -122,39 +123,18 @@ class HabitExtractorML:
         """Estrae frequenza usando pattern ML + linguistici"""
         frequency_info = {"count": None, "period": None, "confidence": 0.0}
         
-        # Pattern regex avanzati per frequenze
-        patterns = {
-            "times_per_week": r"(\d+)\s*(?:volte?|times?)\s*(?:alla|per|a)\s*settimana|week",
-            "times_per_month": r"(\d+)\s*(?:volte?|times?)\s*(?:al|per|a)\s*mese|month",
-            "daily_pattern": r"(?:tutti\s*i\s*giorni|every\s*day|al\s*giorno|per\s*day)",
-            "weekly_pattern": r"(?:ogni\s*settimana|every\s*week|alla\s*settimana)",
-            "monthly_pattern": r"(?:ogni\s*mese|every\s*month|al\s*mese)",
-        }
-        
-        text_lower = text.lower()
-        
-        for pattern_name, pattern in patterns.items():
-            match = re.search(pattern, text_lower)
-            if match:
-                if "times_per_week" in pattern_name:
-                    frequency_info = {"count": int(match.group(1)), "period": 7, "confidence": 0.9}
-                elif "times_per_month" in pattern_name:
-                    frequency_info = {"count": int(match.group(1)), "period": 30, "confidence": 0.9}
-                elif "daily" in pattern_name:
-                    frequency_info = {"count": 7, "period": 7, "confidence": 0.8}
-                elif "weekly" in pattern_name:
-                    frequency_info = {"count": 1, "period": 7, "confidence": 0.8}
-                elif "monthly" in pattern_name:
-                    frequency_info = {"count": 1, "period": 30, "confidence": 0.8}
-                break
+        # Pattern regex di frequenza, in un'unica scansione
+        match = self.lexicon.match_frequency(text.lower())
+        if match:
+            frequency_info = match
         
         # Fallback usando dependency parsing
         if frequency_info["count"] is None:
             for token in doc:
-                if token.text.lower() in self.frequency_patterns:
-                    pattern_data = self.frequency_patterns[token.text.lower()]
+                pattern_data = self.lexicon.frequency_word(token.text)
+                if pattern_data:
                     frequency_info = {
-                        "count": pattern_data["frequency"], 
+                        "count": pattern_data["count"], 
                         "period": pattern_data["period"], 
                         "confidence": 0.7
                     }
@@ -199,21 +179,24 @@ class HabitExtractorML:
         
         return action_candidates[0] if action_candidates else {"verb": None, "score": 0.0}
 
-def extract_habits_ml(text: str) -> dict:
-    """Funzione principale che usa ML per estrazione abitudini"""
-    lang = detect_language(text)
-    lang_code = "it" if lang == nlp_it else "en"
-    doc = lang(text)
-    
-    # Inizializza l'estrattore ML
-    extractor = HabitExtractorML()
-    
-    # Estrai entità con transformer
-    entities = extractor.extract_with_transformer(text, lang_code)
-    
+# Estrattore condiviso tra le richieste (è senza stato)
+_extractor: Optional[HabitExtractorML] = None
+
+def get_extractor() -> HabitExtractorML:
+    global _extractor
+    if _extractor is None:
+        _extractor = HabitExtractorML()
+    return _extractor
+
+def _empty_entities() -> Dict:
+    return {"PERSON": [], "ORG": [], "LOC": [], "MISC": [], "numbers": [], "temporal": []}
+
+def _build_analysis(text: str, lang_code: str, doc, extractor: HabitExtractorML, detail: str = "full") -> dict:
+    """Primo livello: analisi basata solo su parse spaCy e regole"""
     # Estrai componenti usando ML + NLP
-    action_info = extractor.extract_action_with_ml(doc, entities)
-    quantities = extractor.extract_numbers_and_units(doc)
+    action_info = extractor.extract_action_with_ml(doc, _empty_entities())
+    # Senza l'elenco completo basta la quantità principale
+    quantities = extractor.extract_numbers_and_units(doc, limit=None if detail == "full" else 1)
     frequency_info = extractor.extract_frequency_with_ml(text, doc)
     
     # Estrai target/oggetto
@@ -227,12 +210,6 @@ def extract_habits_ml(text: str) -> dict:
                 target = token.text
                 break
     
-    # Se non trova target, usa entità riconosciute
-    if not target and entities["ORG"]:
-        target = entities["ORG"][0]["text"]
-    elif not target and entities["LOC"]:
-        target = entities["LOC"][0]["text"]
-    
     return {
         "text": text,
         "language": lang_code,
@@ -240,20 +217,126 @@ def extract_habits_ml(text: str) -> dict:
         "action_confidence": action_info["score"],
         "quantities": quantities,
         "main_quantity": quantities[0] if quantities else None,
+        "quantity": _format_quantity(quantities[0]) if quantities else None,
         "target": target,
         "frequency_count": frequency_info["count"],
         "frequency_period": frequency_info["period"],
         "frequency_confidence": frequency_info["confidence"],
         "frequency_text": f"{frequency_info['count']} su {frequency_info['period']}" if frequency_info["count"] and frequency_info["period"] else None,
-        "entities_detected": entities,
-        "ml_confidence": (action_info["score"] + frequency_info["confidence"]) / 2
+        "entities_detected": _empty_entities(),
+        "ml_confidence": (action_info["score"] + frequency_info["confidence"]) / 2,
+        "extraction_tier": "rules" if detail == "full" else None
     }
 
-def create_habit_object(analysis: dict) -> HabitDatabaseModel:
-    """Crea un oggetto abitudine da salvare nel database"""
+def _apply_entities(analysis: dict, entities: Dict, detail: str = "full"):
+    """Secondo livello: aggiunge le entità transformer all'analisi"""
+    if detail == "full":
+        analysis["entities_detected"] = entities
+        analysis["extraction_tier"] = "transformer"
+    
+    # Se non trova target, usa entità riconosciute
+    if not analysis["target"] and entities["ORG"]:
+        analysis["target"] = entities["ORG"][0]["text"]
+    elif not analysis["target"] and entities["LOC"]:
+        analysis["target"] = entities["LOC"][0]["text"]
+
+def _needs_transformer(analysis: dict, mode: str, detail: str = "full") -> bool:
+    """
+    In modalità tiered il NER transformer serve solo se manca il target o la confidenza è bassa.
+    Senza l'elenco delle entità (detail "core") serve solo a trovare il target mancante:
+    la confidenza non dipende dal NER.
+    """
+    if detail != "full":
+        return not analysis["target"]
+    if mode != "tiered":
+        return True
+    return not analysis["target"] or analysis["ml_confidence"] < TIER_CONFIDENCE_THRESHOLD
+
+def extract_habits_ml(text: str, language: Optional[str] = None, mode: Optional[str] = None,
+                      detail: str = "full") -> dict:
+    """Funzione principale che usa ML per estrazione abitudini"""
+    return extract_habits_ml_batch([text], language=language, mode=mode, detail=detail)[0]
+
+def detail_for_fields(fields) -> str:
+    """Livello di dettaglio sufficiente per i campi richiesti"""
+    return "full" if FULL_DETAIL_FIELDS.intersection(fields) else "core"
+
+def extract_habits_ml_batch(texts: List[str], language: Optional[str] = None, mode: Optional[str] = None,
+                            detail: str = "full") -> List[dict]:
+    """
+    Analizza più testi insieme: li raggruppa per lingua e li passa come un unico
+    batch a nlp.pipe e al pipeline NER, invece di un forward pass per testo.
+    Restituisce i risultati nello stesso ordine dei testi in input.
+    
+    language: lingua indicata dal client, se supportata salta il rilevamento.
+    mode: "full" esegue sempre il NER transformer, "tiered" solo quando
+    l'analisi a regole non basta (default: NLP_EXTRACTION_MODE).
+    detail: "full" oppure "core", che restituisce al più una quantità,
+    entities_detected vuoto ed extraction_tier None, eseguendo il NER solo
+    se manca il target.
+    """
+    if detail not in DETAIL_LEVELS:
+        raise ValueError(f"Unknown detail level: {detail}")
+    mode = mode or EXTRACTION_MODE
+    # I risultati "core" sono incompleti: in cache stanno separati da quelli completi
+    variant = mode if detail == "full" else f"{mode}:{detail}"
+    results: List[dict] = [None] * len(texts)
+    groups: Dict[str, List[int]] = {}
+    with timed("extract_batch"):
+        for i, text in enumerate(texts):
+            with timed("detect_language"):
+                lang_code = detect_language_code(text, language)
+            results[i] = analysis_cache.get(text, lang_code, variant=variant)
+            if results[i] is None:
+                groups.setdefault(lang_code, []).append(i)
+        
+        extractor = get_extractor()
+        
+        for lang_code, indices in groups.items():
+            group_texts = [texts[i] for i in indices]
+            with timed("spacy_parse", language=lang_code):
+                docs = list(registry.get_spacy(lang_code).pipe(group_texts, batch_size=SPACY_BATCH_SIZE))
+            with timed("rules", language=lang_code):
+                for i, doc in zip(indices, docs):
+                    results[i] = _build_analysis(texts[i], lang_code, doc, extractor, detail)
+            
+            # Escalation al transformer solo per i testi che ne hanno bisogno
+            escalate = [i for i in indices if _needs_transformer(results[i], mode, detail)]
+            count("extraction_tier", len(indices) - len(escalate), tier="rules")
+            if escalate:
+                count("extraction_tier", len(escalate), tier="transformer")
+                with timed("transformer_ner", language=lang_code):
+                    entities_list = extractor.extract_with_transformer_batch([texts[i] for i in escalate], lang_code)
+                for i, entities in zip(escalate, entities_list):
+                    _apply_entities(results[i], entities, detail)
+            
+            for i in indices:
+                analysis_cache.set(texts[i], lang_code, results[i], variant=variant)
+    
+    return results
+
+def _clip(value, max_length: int) -> Optional[str]:
+    # Le colonne VARCHAR di habits hanno lunghezze fisse
+    return str(value)[:max_length] if value else None
+
+def _format_quantity(quantity: Optional[Dict]) -> Optional[str]:
+    if not quantity:
+        return None
+    return " ".join(part for part in (quantity.get("number"), quantity.get("unit")) if part)
+
+def create_habit_object(analysis: dict, user_id: Optional[int] = None) -> HabitDatabaseModel:
+    """Crea un oggetto abitudine da salvare nel database, con tutti i campi estratti"""
+    confidence = analysis.get("ml_confidence")
     return HabitDatabaseModel(
-        user_id="User123",  # Placeholder, should be replaced with actual user ID
-        name=analysis.get("action", "Unknown"),
+        user_id=user_id,
+        name=_clip(analysis.get("action"), 255) or "Unknown",
         description=analysis.get("text", ""),
-        frequency=analysis.get("frequency_text", "Unknown")
+        action=_clip(analysis.get("action"), 100),
+        quantity=_clip(_format_quantity(analysis.get("main_quantity")), 50),
+        target=_clip(analysis.get("target"), 100),
+        frequency_count=analysis.get("frequency_count"),
+        frequency_period=analysis.get("frequency_period"),
+        language=_clip(analysis.get("language"), 10),
+        # DECIMAL(3,2) nel database
+        ml_confidence=round(min(max(float(confidence), 0.0), 9.99), 2) if confidence is not None else None,
     )
\ No newline at end of file
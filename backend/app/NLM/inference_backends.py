@@ -0,0 +1,83 @@
+import os
+import platform
+import re
+from typing import Optional, Tuple
+
+# Backend per i pipeline NER: "torch" (default) oppure "onnx" (int8, ONNX Runtime)
+INFERENCE_BACKEND = os.getenv('NLP_INFERENCE_BACKEND', 'torch')
+
+# Dove salvare i modelli esportati e quantizzati
+ONNX_CACHE_DIR = os.getenv('NLP_ONNX_CACHE_DIR', os.path.join(os.path.expanduser("~"), ".cache", "habitforge", "onnx"))
+
+QUANTIZED_FILE_NAME = "model_quantized.onnx"
+
+def _build_pipeline(model, tokenizer):
+    from transformers.pipelines import pipeline
+
+    return pipeline("ner", model=model, tokenizer=tokenizer, aggregation_strategy="simple")
+
+def load_torch_ner(model_name: str):
+    """Pipeline NER PyTorch a precisione piena"""
+    from transformers import AutoTokenizer, AutoModelForTokenClassification
+
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    model = AutoModelForTokenClassification.from_pretrained(model_name)
+    return _build_pipeline(model, tokenizer)
+
+def onnx_model_dir(model_name: str) -> str:
+    return os.path.join(ONNX_CACHE_DIR, re.sub(r"[^\w.-]+", "__", model_name))
+
+def _quantization_config():
+    from optimum.onnxruntime.configuration import AutoQuantizationConfig
+
+    # Quantizzazione dinamica: pesi int8, attivazioni quantizzate a runtime
+    if platform.machine().lower() in ("arm64", "aarch64"):
+        return AutoQuantizationConfig.arm64(is_static=False, per_channel=False)
+    if os.getenv('NLP_ONNX_QUANTIZATION', 'avx2') == 'avx512_vnni':
+        return AutoQuantizationConfig.avx512_vnni(is_static=False, per_channel=False)
+    return AutoQuantizationConfig.avx2(is_static=False, per_channel=False)
+
+def export_quantized_onnx(model_name: str, output_dir: Optional[str] = None) -> str:
+    """Esporta il modello in ONNX e lo quantizza in int8; restituisce la cartella del modello"""
+    from transformers import AutoTokenizer
+    from optimum.onnxruntime import ORTModelForTokenClassification, ORTQuantizer
+
+    output_dir = output_dir or onnx_model_dir(model_name)
+    export_dir = os.path.join(output_dir, "fp32")
+
+    model = ORTModelForTokenClassification.from_pretrained(model_name, export=True)
+    model.save_pretrained(export_dir)
+
+    quantizer = ORTQuantizer.from_pretrained(export_dir)
+    quantizer.quantize(save_dir=output_dir, quantization_config=_quantization_config())
+    AutoTokenizer.from_pretrained(model_name).save_pretrained(output_dir)
+
+    print(f"✅ Modello '{model_name}' esportato e quantizzato in {output_dir}")
+    return output_dir
+
+def load_onnx_ner(model_name: str):
+    """Pipeline NER su ONNX Runtime, esporta il modello quantizzato se non è già in cache"""
+    from transformers import AutoTokenizer
+    from optimum.onnxruntime import ORTModelForTokenClassification
+
+    model_dir = onnx_model_dir(model_name)
+    if not os.path.exists(os.path.join(model_dir, QUANTIZED_FILE_NAME)):
+        export_quantized_onnx(model_name, model_dir)
+
+    model = ORTModelForTokenClassification.from_pretrained(model_dir, file_name=QUANTIZED_FILE_NAME)
+    tokenizer = AutoTokenizer.from_pretrained(model_dir)
+    return _build_pipeline(model, tokenizer)
+
+def load_ner_pipeline(model_name: str, backend: Optional[str] = None) -> Tuple[object, str]:
+    """
+    Carica il pipeline NER con il backend richiesto.
+    Se ONNX Runtime/optimum non sono installati o l'export fallisce, ricade su PyTorch.
+    Restituisce (pipeline, backend effettivamente usato).
+    """
+    backend = backend or INFERENCE_BACKEND
+    if backend == "onnx":
+        try:
+            return load_onnx_ner(model_name), "onnx"
+        except Exception as e:
+            print(f"⚠️ Backend ONNX non disponibile per '{model_name}', uso PyTorch: {e}")
+    return load_torch_ner(model_name), "torch"
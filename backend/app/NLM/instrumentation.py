@@ -0,0 +1,39 @@
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, List
+
+# Osservatori registrati: fn(kind, name, value, labels) con kind "duration" o "count".
+# Senza osservatori timed() non misura nulla, quindi il costo sul percorso caldo è minimo.
+_observers: List[Callable[[str, str, float, Dict[str, str]], None]] = []
+
+def add_observer(observer: Callable[[str, str, float, Dict[str, str]], None]):
+    """Registra un osservatore (es. l'esportatore Prometheus dell'API)"""
+    if observer not in _observers:
+        _observers.append(observer)
+
+def _notify(kind: str, name: str, value: float, labels: Dict[str, str]):
+    for observer in _observers:
+        try:
+            observer(kind, name, value, labels)
+        except Exception as e:
+            print(f"⚠️ Errore nell'osservatore delle metriche: {e}")
+
+def observe_duration(stage: str, seconds: float, **labels):
+    if _observers:
+        _notify("duration", stage, seconds, labels)
+
+def count(event: str, value: float = 1, **labels):
+    if _observers:
+        _notify("count", event, value, labels)
+
+@contextmanager
+def timed(stage: str, **labels):
+    """Misura la durata del blocco e la notifica come fase `stage`"""
+    if not _observers:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _notify("duration", stage, time.perf_counter() - start, labels)
@@ -0,0 +1,98 @@
+import json
+import math
+import os
+import re
+import threading
+from collections import Counter
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional
+
+# Profili per lingua: parole frequenti + testo campione per i trigrammi di caratteri
+DEFAULT_PROFILES_PATH = os.path.join(os.path.dirname(__file__), "data", "language_profiles.json")
+
+_WORD_RE = re.compile(r"[^\W\d_]+")
+
+# Peso di una parola frequente della lingua rispetto a un trigramma
+WORD_WEIGHT = 3.0
+
+def _trigrams(word: str) -> Iterable[str]:
+    padded = f" {word} "
+    return (padded[i:i + 3] for i in range(len(padded) - 2))
+
+class NgramLanguageDetector:
+    """
+    Rilevatore di lingua deterministico per testi brevi.
+
+    Il punteggio di ogni lingua è la log-probabilità dei trigrammi di caratteri
+    del testo secondo il profilo della lingua, più un bonus per le parole
+    frequenti. Stesso testo -> stessa lingua, sempre (a differenza di langdetect).
+    I risultati sono in una piccola cache LRU sul testo normalizzato.
+    """
+
+    def __init__(self, profiles: Dict[str, Dict], cache_size: int = 4096):
+        self.languages: List[str] = sorted(profiles)
+        self._words: Dict[str, frozenset] = {}
+        self._logprobs: Dict[str, Dict[str, float]] = {}
+        self._unseen: Dict[str, float] = {}
+
+        for lang, profile in profiles.items():
+            words = profile.get("words", "").lower().split()
+            self._words[lang] = frozenset(words)
+
+            counts = Counter()
+            for word in _WORD_RE.findall(profile.get("sample", "").lower()) + words:
+                counts.update(_trigrams(word))
+            # Smoothing add-one: i trigrammi mai visti hanno una probabilità piccola ma non nulla
+            total = sum(counts.values()) + len(counts) + 1
+            self._logprobs[lang] = {gram: math.log((n + 1) / total) for gram, n in counts.items()}
+            self._unseen[lang] = math.log(1 / total)
+
+        self._detect_cached = lru_cache(maxsize=cache_size)(self._detect)
+
+    @classmethod
+    def from_file(cls, path: str, cache_size: int = 4096) -> "NgramLanguageDetector":
+        with open(path, encoding="utf-8") as f:
+            return cls(json.load(f), cache_size=cache_size)
+
+    def scores(self, text: str) -> Dict[str, float]:
+        words = _WORD_RE.findall(text.lower())
+        scores = {}
+        for lang in self.languages:
+            logprobs, unseen, common = self._logprobs[lang], self._unseen[lang], self._words[lang]
+            score = 0.0
+            for word in words:
+                if word in common:
+                    score += WORD_WEIGHT
+                for gram in _trigrams(word):
+                    score += logprobs.get(gram, unseen)
+            scores[lang] = score
+        return scores
+
+    def _detect(self, normalized_text: str) -> Optional[str]:
+        if not _WORD_RE.search(normalized_text):
+            return None
+        scores = self.scores(normalized_text)
+        # A parità di punteggio vince la prima lingua in ordine alfabetico
+        return max(self.languages, key=lambda lang: (scores[lang], -self.languages.index(lang)))
+
+    def detect(self, text: str) -> Optional[str]:
+        """Codice della lingua più probabile, None se il testo non contiene lettere"""
+        return self._detect_cached(" ".join(text.lower().split()))
+
+    def cache_info(self):
+        return self._detect_cached.cache_info()
+
+_detector: Optional[NgramLanguageDetector] = None
+_detector_lock = threading.Lock()
+
+def get_detector() -> NgramLanguageDetector:
+    """Rilevatore condiviso dal processo (cache configurabile con NLP_LANGDETECT_CACHE_SIZE)"""
+    global _detector
+    if _detector is None:
+        with _detector_lock:
+            if _detector is None:
+                _detector = NgramLanguageDetector.from_file(
+                    os.getenv('NLP_LANGUAGE_PROFILES_PATH', DEFAULT_PROFILES_PATH),
+                    cache_size=int(os.getenv('NLP_LANGDETECT_CACHE_SIZE', '4096')),
+                )
+    return _detector
@@ -0,0 +1,97 @@
+import json
+import os
+import re
+import threading
+from typing import Dict, Optional
+
+# File dati con pattern di frequenza e unità di misura (sovrascrivibile con NLP_LEXICON_PATH)
+DEFAULT_LEXICON_PATH = os.path.join(os.path.dirname(__file__), "data", "lexicon.json")
+
+class LexiconEngine:
+    """
+    Pattern di frequenza e unità di misura compilati una volta sola.
+
+    - tutti i pattern di frequenza sono uniti in un'unica regex con un gruppo
+      per pattern: una sola scansione del testo invece di una re.search a testa
+    - le unità sono in un dizionario per lingua: unità -> contesto, lookup O(1)
+    """
+
+    def __init__(self, data: Dict):
+        self.frequency_words: Dict[str, Dict] = {
+            word.lower(): info for word, info in data.get("frequency_words", {}).items()
+        }
+
+        # Regex combinata: (?P<f0>...)|(?P<f1>...)|... in ordine di priorità
+        self._patterns = []
+        parts = []
+        group_index = 1
+        for priority, spec in enumerate(data.get("frequency_patterns", [])):
+            inner_groups = re.compile(spec["pattern"]).groups
+            parts.append(f"(?P<f{priority}>{spec['pattern']})")
+            self._patterns.append({
+                **spec,
+                # indice del primo gruppo interno (il numero di volte) nella regex combinata
+                "count_group": group_index + 1 if inner_groups else None,
+            })
+            group_index += 1 + inner_groups
+        self._frequency_regex = re.compile("|".join(parts)) if parts else None
+
+        # Indice delle unità per lingua, più un indice comune a tutte le lingue
+        self._units: Dict[str, Dict[str, str]] = {}
+        self._all_units: Dict[str, str] = {}
+        for context, by_language in data.get("units", {}).items():
+            for language, units in by_language.items():
+                index = self._units.setdefault(language, {})
+                for unit in units:
+                    index[unit.lower()] = context
+                    self._all_units.setdefault(unit.lower(), context)
+
+    @classmethod
+    def from_file(cls, path: str) -> "LexiconEngine":
+        with open(path, encoding="utf-8") as f:
+            return cls(json.load(f))
+
+    def match_frequency(self, text_lower: str) -> Optional[Dict]:
+        """
+        Cerca i pattern di frequenza nel testo (già in minuscolo) con una sola
+        scansione; se più pattern trovano un match vince quello con priorità più alta.
+        """
+        if self._frequency_regex is None:
+            return None
+
+        best = None
+        for match in self._frequency_regex.finditer(text_lower):
+            priority = int(match.lastgroup[1:])
+            if best is None or priority < best[0]:
+                best = (priority, match)
+                if priority == 0:
+                    break
+
+        if best is None:
+            return None
+
+        priority, match = best
+        spec = self._patterns[priority]
+        count = int(match.group(spec["count_group"])) if spec["count"] == "match" else spec["count"]
+        return {"count": count, "period": spec["period"], "confidence": spec["confidence"]}
+
+    def frequency_word(self, word: str) -> Optional[Dict]:
+        return self.frequency_words.get(word.lower())
+
+    def unit_context(self, unit_text: str, language: Optional[str] = None) -> Optional[str]:
+        """Contesto dell'unità (physical_measure, time_or_quantity, money) o None"""
+        unit_text = unit_text.lower().rstrip(".")
+        context = self._units.get(language, {}).get(unit_text) if language else None
+        return context or self._all_units.get(unit_text)
+
+_lexicon: Optional[LexiconEngine] = None
+_lexicon_lock = threading.Lock()
+
+def get_lexicon() -> LexiconEngine:
+    """Lexicon condiviso dal processo, caricato alla prima chiamata"""
+    global _lexicon
+    if _lexicon is None:
+        with _lexicon_lock:
+            if _lexicon is None:
+                _lexicon = LexiconEngine.from_file(os.getenv('NLP_LEXICON_PATH', DEFAULT_LEXICON_PATH))
+    return _lexicon
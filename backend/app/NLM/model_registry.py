@@ -0,0 +1,156 @@
+import os
+import threading
+import time
+from typing import Dict, List, Optional
+
+from NLM.inference_backends import load_ner_pipeline
+from NLM.instrumentation import observe_duration
+
+# Modelli spaCy per lingua, in ordine di preferenza
+SPACY_MODELS = {
+    "en": ["en_core_web_lg", "en_core_web_sm"],
+    "it": ["it_core_news_sm"],
+}
+
+# Modelli transformer NER per lingua
+NER_MODELS = {
+    # Per inglese - modello BERT fine-tuned
+    "en": "dbmdz/bert-large-cased-finetuned-conll03-english",
+    # Per italiano - modello BERT fine-tuned
+    "it": "Davlan/bert-base-multilingual-cased-ner-hrl",
+}
+
+DEFAULT_LANGUAGE = "en"
+
+# Dopo un caricamento fallito (download, memoria) si ritenta al primo utilizzo passati questi secondi
+MODEL_RETRY_SECONDS = float(os.getenv('NLP_MODEL_RETRY_S', '30'))
+
+class ModelRegistry:
+    """
+    Carica i modelli spaCy e transformer di ogni lingua solo al primo utilizzo
+    (o con warm_up), così l'import del modulo NLP resta immediato e una lingua
+    mai usata non occupa memoria.
+
+    Un caricamento fallito non viene memorizzato: si ritenta dopo
+    `retry_after` secondi, oppure subito con warm_up.
+    """
+
+    def __init__(self, spacy_models: Dict[str, List[str]] = SPACY_MODELS, ner_models: Dict[str, str] = NER_MODELS,
+                 retry_after: float = MODEL_RETRY_SECONDS):
+        self.spacy_models = spacy_models
+        self.ner_models = ner_models
+        self.retry_after = retry_after
+        self._spacy: Dict[str, object] = {}
+        self._ner: Dict[str, object] = {}
+        self._ner_backends: Dict[str, str] = {}
+        self._load_times: Dict[str, float] = {}
+        self._failed_at: Dict[str, float] = {}
+        self._locks = {lang: threading.Lock() for lang in set(spacy_models) | set(ner_models)}
+
+    @property
+    def supported_languages(self) -> List[str]:
+        return sorted(self._locks)
+
+    def _load_spacy(self, lang: str):
+        try:
+            import spacy
+        except ImportError as e:
+            print(f"⚠️ spaCy non disponibile: {e}")
+            return None
+
+        for model_name in self.spacy_models.get(lang, []):
+            try:
+                return spacy.load(model_name)
+            except (OSError, ImportError):
+                continue
+        print(f"⚠️ Nessun modello spaCy disponibile per '{lang}'")
+        return None
+
+    def _load_ner(self, lang: str):
+        model_name = self.ner_models.get(lang)
+        if model_name is None:
+            return None
+        try:
+            # PyTorch oppure ONNX Runtime quantizzato, vedi NLP_INFERENCE_BACKEND
+            ner_pipeline, self._ner_backends[lang] = load_ner_pipeline(model_name)
+            return ner_pipeline
+        except Exception as e:
+            print(f"⚠️ Errore nel caricamento del modello transformer '{model_name}': {e}")
+            return None
+
+    def _retry_pending(self, key: str) -> bool:
+        failed_at = self._failed_at.get(key)
+        return failed_at is not None and time.monotonic() - failed_at < self.retry_after
+
+    def _ensure_loaded(self, lang: str, kind: str):
+        models = self._spacy if kind == "spacy" else self._ner
+        key = f"{kind}:{lang}"
+        if lang in models or lang not in self._locks or self._retry_pending(key):
+            return
+
+        with self._locks[lang]:
+            if lang in models or self._retry_pending(key):
+                return
+            start = time.perf_counter()
+            model = self._load_spacy(lang) if kind == "spacy" else self._load_ner(lang)
+            self._load_times[key] = time.perf_counter() - start
+            observe_duration("model_load", self._load_times[key], kind=kind, language=lang)
+            if model is None:
+                self._failed_at[key] = time.monotonic()
+                return
+            self._failed_at.pop(key, None)
+            models[lang] = model
+            print(f"✅ Modello {kind} '{lang}' caricato in {self._load_times[key]:.1f}s")
+
+    def get_spacy(self, lang: str):
+        """Restituisce la pipeline spaCy della lingua (None se non disponibile)"""
+        self._ensure_loaded(lang, "spacy")
+        return self._spacy.get(lang)
+
+    def get_ner(self, lang: str):
+        """Restituisce il pipeline NER transformer della lingua (None se non disponibile)"""
+        self._ensure_loaded(lang, "ner")
+        return self._ner.get(lang)
+
+    def warm_up(self, languages: Optional[List[str]] = None) -> Dict[str, bool]:
+        """
+        Carica subito i modelli delle lingue indicate (default: NLP_PRELOAD_LANGUAGES),
+        ritentando anche quelli falliti da poco
+        """
+        languages = languages if languages is not None else preload_languages()
+        loaded = {}
+        for lang in languages:
+            for kind in ("spacy", "ner"):
+                self._failed_at.pop(f"{kind}:{lang}", None)
+            spacy_model = self.get_spacy(lang)
+            ner_model = self.get_ner(lang)
+            loaded[lang] = spacy_model is not None and ner_model is not None
+        return loaded
+
+    def is_ready(self, languages: Optional[List[str]] = None) -> bool:
+        """True quando i modelli delle lingue indicate sono caricati (un caricamento fallito non conta)"""
+        languages = languages if languages is not None else preload_languages()
+        return all(
+            self._spacy.get(lang) is not None and self._ner.get(lang) is not None
+            for lang in languages if lang in self._locks
+        )
+
+    def status(self) -> Dict[str, Dict]:
+        return {
+            lang: {
+                "spacy_loaded": self._spacy.get(lang) is not None,
+                "ner_loaded": self._ner.get(lang) is not None,
+                "ner_backend": self._ner_backends.get(lang),
+                "spacy_load_seconds": self._load_times.get(f"spacy:{lang}"),
+                "ner_load_seconds": self._load_times.get(f"ner:{lang}"),
+            }
+            for lang in self.supported_languages
+        }
+
+def preload_languages() -> List[str]:
+    """Lingue da caricare all'avvio, da NLP_PRELOAD_LANGUAGES (es. "en,it"; vuoto = nessuna)"""
+    value = os.getenv('NLP_PRELOAD_LANGUAGES', 'en,it')
+    return [lang.strip() for lang in value.split(',') if lang.strip()]
+
+# Registry condiviso dal processo
+registry = ModelRegistry()
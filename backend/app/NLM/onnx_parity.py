@@ -0,0 +1,90 @@
+"""
+Confronta le entità NER prodotte dal backend PyTorch e da quello ONNX quantizzato
+su un corpus di frasi campione.
+
+Uso (dalla cartella backend):
+    python -m app.NLM.onnx_parity [--corpus PATH] [--score-tolerance 0.05] [--max-mismatch-rate 0.1]
+
+Esce con codice 1 se la percentuale di frasi con entità diverse supera la soglia.
+"""
+
+import argparse
+import json
+import os
+import sys
+
+# Il modulo NLM importa i suoi pacchetti relativamente alla cartella app
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from NLM.inference_backends import load_ner_pipeline
+from NLM.model_registry import NER_MODELS
+
+DEFAULT_CORPUS_PATH = os.path.join(os.path.dirname(__file__), "data", "ner_parity_corpus.json")
+
+def _entity_key(entity: dict) -> tuple:
+    return (entity["entity_group"], entity["start"], entity["end"])
+
+def compare_entities(reference: list, candidate: list, score_tolerance: float) -> list:
+    """Differenze tra due liste di entità: mancanti, in più e con score troppo diversi"""
+    ref = {_entity_key(e): float(e["score"]) for e in reference}
+    cand = {_entity_key(e): float(e["score"]) for e in candidate}
+
+    problems = []
+    for key in ref.keys() - cand.keys():
+        problems.append({"type": "missing", "entity": key})
+    for key in cand.keys() - ref.keys():
+        problems.append({"type": "extra", "entity": key})
+    for key in ref.keys() & cand.keys():
+        if abs(ref[key] - cand[key]) > score_tolerance:
+            problems.append({"type": "score", "entity": key, "torch": ref[key], "onnx": cand[key]})
+    return problems
+
+def run_parity(corpus: dict, score_tolerance: float) -> dict:
+    report = {}
+    for lang, texts in corpus.items():
+        model_name = NER_MODELS.get(lang)
+        if model_name is None:
+            continue
+
+        torch_pipeline, _ = load_ner_pipeline(model_name, backend="torch")
+        onnx_pipeline, backend = load_ner_pipeline(model_name, backend="onnx")
+        if backend != "onnx":
+            raise RuntimeError(f"ONNX backend not available for '{model_name}'")
+
+        mismatches = []
+        for text, ref, cand in zip(texts, torch_pipeline(texts), onnx_pipeline(texts)):
+            problems = compare_entities(ref, cand, score_tolerance)
+            if problems:
+                mismatches.append({"text": text, "problems": problems})
+
+        report[lang] = {
+            "model": model_name,
+            "texts": len(texts),
+            "mismatched_texts": len(mismatches),
+            "mismatch_rate": len(mismatches) / len(texts) if texts else 0.0,
+            "mismatches": mismatches,
+        }
+    return report
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="NER parity check: PyTorch vs ONNX Runtime int8")
+    parser.add_argument("--corpus", default=DEFAULT_CORPUS_PATH)
+    parser.add_argument("--score-tolerance", type=float, default=0.05)
+    parser.add_argument("--max-mismatch-rate", type=float, default=0.1)
+    args = parser.parse_args()
+
+    with open(args.corpus, encoding="utf-8") as f:
+        corpus = json.load(f)
+
+    report = run_parity(corpus, args.score_tolerance)
+    print(json.dumps(report, indent=2, ensure_ascii=False, default=str))
+
+    failed = [lang for lang, result in report.items() if result["mismatch_rate"] > args.max_mismatch_rate]
+    if failed:
+        print(f"❌ Parity check failed for: {', '.join(failed)}")
+        return 1
+    print("✅ Parity check passed")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
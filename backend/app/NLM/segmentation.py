@@ -0,0 +1,157 @@
+"""
+Segmentazione dei testi lunghi con più abitudini.
+
+Il testo viene diviso in frasi (doc.sents del parse spaCy) e ogni frase nelle
+proposizioni coordinate con un proprio verbo ("corro 5km e leggo 20 pagine").
+Le frasi nominali ("Meditazione 10 minuti la sera.") restano un segmento.
+Ogni segmento viene poi analizzato come un testo a sé, in batch con gli altri:
+il NER transformer (limite di 512 token) vede solo segmenti brevi, e il costo
+di ogni analisi dipende dalla lunghezza del segmento, non del testo intero.
+"""
+
+import os
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from NLM.habit_nalyze import detect_language_code, extract_habits_ml_batch
+from NLM.instrumentation import count, timed
+from NLM.model_registry import registry
+
+# Lunghezza massima di un segmento in token spaCy: i segmenti più lunghi vengono spezzati
+MAX_SEGMENT_TOKENS = int(os.getenv('NLP_MAX_SEGMENT_TOKENS', '64'))
+# Numero massimo di abitudini in un testo
+MAX_SEGMENTS = int(os.getenv('NLP_MAX_SEGMENTS', '32'))
+
+_CLAUSE_POS = ("VERB", "AUX")
+
+class TooManySegments(ValueError):
+    pass
+
+class Segment(NamedTuple):
+    text: str
+    sentence: int  # indice della frase di provenienza
+
+def _sentences(doc):
+    # Senza parser né senter il documento è un'unica frase
+    if doc.has_annotation("SENT_START"):
+        return list(doc.sents)
+    return [doc[:]]
+
+def _clause_starts(sent) -> List[int]:
+    """Inizio delle proposizioni coordinate: verbi in relazione conj con un altro verbo"""
+    starts = [sent.start]
+    for token in sent:
+        if token.dep_ == "conj" and token.pos_ in _CLAUSE_POS and token.head.pos_ in _CLAUSE_POS:
+            start = token.left_edge.i
+            if start > sent.start:
+                starts.append(start)
+    return sorted(set(starts))
+
+def _is_edge_noise(token) -> bool:
+    return token.is_punct or token.is_space or token.pos_ in ("PUNCT", "SPACE") or token.dep_ == "cc"
+
+def _trim(span):
+    """Toglie congiunzioni e punteggiatura ai bordi del segmento"""
+    start, end = span.start, span.end
+    doc = span.doc
+    while start < end and _is_edge_noise(doc[start]):
+        start += 1
+    while end > start and _is_edge_noise(doc[end - 1]):
+        end -= 1
+    return doc[start:end]
+
+def _has_verb(span) -> bool:
+    return any(token.pos_ in _CLAUSE_POS for token in span)
+
+def _clauses(sent) -> List[Tuple[int, int]]:
+    """
+    Proposizioni della frase come intervalli di token. Un pezzo senza verbo si
+    unisce alla proposizione che segue (o alla precedente se è l'ultimo), così
+    una frase nominale resta intera invece di andare persa.
+    """
+    doc = sent.doc
+    starts = _clause_starts(sent) + [sent.end]
+    spans = [_trim(doc[start:end]) for start, end in zip(starts, starts[1:])]
+    clauses: List[Tuple[int, int]] = []
+    pending: Optional[int] = None
+    for span in spans:
+        if not len(span):
+            continue
+        start = span.start if pending is None else pending
+        if not _has_verb(span):
+            pending = start
+            continue
+        clauses.append((start, span.end))
+        pending = None
+    if pending is not None:
+        last_end = max(span.end for span in spans if len(span))
+        if clauses:
+            clauses[-1] = (clauses[-1][0], last_end)
+        else:
+            clauses.append((pending, last_end))
+    return clauses
+
+def segment_doc(doc, max_tokens: int = MAX_SEGMENT_TOKENS) -> List[Segment]:
+    """Segmenti del documento (proposizioni o frasi nominali), lunghi al più max_tokens"""
+    segments: List[Segment] = []
+    for sentence_index, sent in enumerate(_sentences(doc)):
+        for start, end in _clauses(sent):
+            # Proposizioni troppo lunghe: finestre consecutive di max_tokens token
+            for chunk_start in range(start, end, max_tokens):
+                chunk = doc[chunk_start:min(chunk_start + max_tokens, end)]
+                segments.append(Segment(chunk.text, sentence_index))
+    return segments
+
+def segment_text(text: str, language: Optional[str] = None) -> Tuple[str, List[Segment]]:
+    """
+    Lingua del testo e suoi segmenti. Un testo fatto solo di punteggiatura
+    resta un unico segmento. Più di MAX_SEGMENTS segmenti sono un errore.
+    """
+    lang_code = detect_language_code(text, language)
+    with timed("segment", language=lang_code):
+        segments = segment_doc(registry.get_spacy(lang_code)(text))
+    if not segments:
+        segments = [Segment(text, 0)]
+    if len(segments) > MAX_SEGMENTS:
+        raise TooManySegments(f"Text contains {len(segments)} habits, at most {MAX_SEGMENTS} are allowed")
+    count("segments", len(segments), language=lang_code)
+    return lang_code, segments
+
+def share_sentence_frequency(segments: List[Segment], analyses: List[dict]) -> List[dict]:
+    """
+    "Corro 5km e leggo 20 pagine ogni giorno": la frequenza è solo nell'ultima
+    proposizione ma vale per tutta la frase. Se nella frase c'è una sola
+    frequenza, i segmenti che non ne hanno una la ereditano (con la confidenza
+    ridotta). Le analisi possono essere condivise con la cache: vengono copiate.
+    """
+    by_sentence: Dict[int, List[int]] = {}
+    for i, segment in enumerate(segments):
+        by_sentence.setdefault(segment.sentence, []).append(i)
+
+    results = list(analyses)
+    for indices in by_sentence.values():
+        found = {
+            (analyses[i]["frequency_count"], analyses[i]["frequency_period"])
+            for i in indices if analyses[i].get("frequency_count")
+        }
+        if len(found) != 1:
+            continue
+        source = next(analyses[i] for i in indices if analyses[i].get("frequency_count"))
+        for i in indices:
+            if not analyses[i].get("frequency_count"):
+                results[i] = dict(
+                    analyses[i],
+                    frequency_count=source["frequency_count"],
+                    frequency_period=source["frequency_period"],
+                    frequency_text=source.get("frequency_text"),
+                    frequency_confidence=source["frequency_confidence"] / 2,
+                )
+    return results
+
+def extract_habits_segmented(text: str, language: Optional[str] = None, mode: Optional[str] = None,
+                             detail: str = "full") -> List[dict]:
+    """Un'analisi per ogni abitudine del testo, con i segmenti analizzati in un unico batch"""
+    lang_code, segments = segment_text(text, language)
+    # La lingua è quella del testo intero: sui segmenti brevi il rilevamento è meno affidabile
+    analyses = extract_habits_ml_batch([segment.text for segment in segments], language=lang_code,
+                                       mode=mode, detail=detail)
+    return share_sentence_frequency(segments, analyses)
@@ -0,0 +1,145 @@
+# admission.py
+
+import asyncio
+import math
+import os
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional
+
+
+class AdmissionRejected(Exception):
+    """Raised when accepting a request would exceed the in-flight limit."""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class DeadlineExceeded(Exception):
+    """Raised when the client's deadline passes before the result is ready."""
+
+
+class _Flight:
+    """One running analysis and the number of requests waiting for it."""
+
+    __slots__ = ("task", "waiters")
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class AdmissionController:
+    """
+    Guards the analysis path in front of the micro-batcher.
+
+    - Single-flight: concurrent requests for the same text and options share
+      one analysis instead of queueing it several times.
+    - Admission: at most `max_inflight` distinct analyses run or wait at the
+      same time; beyond that requests are rejected immediately with
+      AdmissionRejected (503 + Retry-After) instead of piling up until the
+      clients time out. Requests joining a running analysis are always
+      admitted, since they add no work.
+    - Deadlines: each request waits at most until its deadline (event loop
+      time). When the last request waiting for an analysis goes away, the
+      analysis is cancelled and the batcher drops it from the queue.
+    """
+
+    def __init__(
+        self,
+        submit_fn: Callable[..., Awaitable[Any]],
+        max_inflight: int = 256,
+        retry_after: float = 1.0,
+    ):
+        self.submit_fn = submit_fn
+        self.max_inflight = max_inflight
+        self.retry_after = retry_after
+        self._flights: Dict[Hashable, _Flight] = {}
+        self._stats = {
+            "admitted": 0,
+            "coalesced": 0,
+            "rejected": 0,
+            "deadline_exceeded": 0,
+            "cancelled": 0,
+        }
+
+    @property
+    def retry_after_header(self) -> str:
+        # Retry-After is a whole number of seconds
+        return str(max(1, math.ceil(self.retry_after)))
+
+    async def submit(self, text: str, deadline: Optional[float] = None, **options) -> Any:
+        """Analyzes one text, sharing the work with identical concurrent requests."""
+        return (await self.submit_many([text], deadline=deadline, **options))[0]
+
+    async def submit_many(self, texts: List[str], deadline: Optional[float] = None, **options) -> List[Any]:
+        """
+        Analyzes several texts. The texts are admitted all together or not at
+        all, so a rejected batch never leaves part of its work behind.
+        """
+        option_key = tuple(sorted(options.items()))
+        keys = [(text, option_key) for text in texts]
+        new = {key for key in keys if key not in self._flights}
+        if len(self._flights) + len(new) > self.max_inflight:
+            self._stats["rejected"] += 1
+            raise AdmissionRejected(
+                f"Too many analyses in flight ({len(self._flights)} running, {len(new)} requested, "
+                f"limit {self.max_inflight})", self.retry_after)
+
+        timeout = None
+        if deadline is not None:
+            timeout = deadline - asyncio.get_running_loop().time()
+            if timeout <= 0:
+                self._stats["deadline_exceeded"] += 1
+                raise DeadlineExceeded("Deadline already expired")
+
+        flights = [self._join(key, text, options) for key, text in zip(keys, texts)]
+        self._stats["admitted"] += len(new)
+        self._stats["coalesced"] += len(keys) - len(new)
+        try:
+            # shield: a request that gives up must not cancel the analysis for the others
+            return list(await asyncio.wait_for(
+                asyncio.gather(*(asyncio.shield(flight.task) for flight in flights)), timeout))
+        except asyncio.TimeoutError:
+            self._stats["deadline_exceeded"] += 1
+            raise DeadlineExceeded(f"Deadline exceeded after {timeout:.3f}s")
+        finally:
+            for key, flight in zip(keys, flights):
+                self._leave(key, flight)
+
+    def _join(self, key: Hashable, text: str, options: Dict[str, Any]) -> _Flight:
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = _Flight(asyncio.ensure_future(self.submit_fn(text, **options)))
+            self._flights[key] = flight
+            flight.task.add_done_callback(lambda _, key=key, flight=flight: self._finish(key, flight))
+        flight.waiters += 1
+        return flight
+
+    def _finish(self, key: Hashable, flight: _Flight):
+        # Completed analyses stop counting as in flight; later requests start a new one
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+
+    def _leave(self, key: Hashable, flight: _Flight):
+        flight.waiters -= 1
+        if flight.waiters == 0 and not flight.task.done():
+            # Nobody is waiting anymore: drop the queued work
+            flight.task.cancel()
+            self._stats["cancelled"] += 1
+            self._finish(key, flight)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "in_flight": len(self._flights),
+            "max_inflight": self.max_inflight,
+            **self._stats,
+        }
+
+
+def create_admission_controller(submit_fn: Callable[..., Awaitable[Any]]) -> AdmissionController:
+    """Builds an admission controller configured from the environment."""
+    return AdmissionController(
+        submit_fn,
+        max_inflight=int(os.getenv('NLP_ADMISSION_MAX_INFLIGHT', '256')),
+        retry_after=float(os.getenv('NLP_ADMISSION_RETRY_AFTER_S', '1')),
+    )
@@ -0,0 +1,162 @@
+# batching.py
+
+import asyncio
+import os
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from .executor import BoundedExecutor, WorkerPoolFull, WorkerTimeout
+
+
+def run_groups(batch_fn: Callable[..., List[Any]], groups: List[Tuple[tuple, List[str]]]) -> List[List[Any]]:
+    """Runs `batch_fn(texts, **options)` once per group of texts sharing the same options."""
+    return [batch_fn(texts, **dict(options)) for options, texts in groups]
+
+
+class MicroBatcher:
+    """
+    Collects concurrent analysis requests for a short window and runs them
+    through the NLP pipeline as a single batch.
+
+    Requests can carry keyword options (e.g. a language hint): texts with the
+    same options are passed together as `batch_fn(texts, **options)`.
+
+    Batches run on the executor, at most one per worker at a time. While all
+    workers are busy, new requests keep accumulating in the queue, so the
+    batch size grows with load and stays at 1 when the server is idle.
+    """
+
+    def __init__(
+        self,
+        batch_fn: Callable[..., List[Any]],
+        executor: Optional[BoundedExecutor] = None,
+        max_batch_size: int = 16,
+        max_wait_ms: float = 5.0,
+        max_queue: int = 1024,
+        timeout: Optional[float] = None,
+    ):
+        self.batch_fn = batch_fn
+        self.executor = executor
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._batches = set()
+
+    async def start(self):
+        """Starts the background task that drains the queue."""
+        if self._task is None:
+            self._queue = asyncio.Queue()
+            self._slots = asyncio.Semaphore(self.executor.max_workers if self.executor else 1)
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stops the background task and fails any request still waiting."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+        # Let the batches already running complete
+        if self._batches:
+            await asyncio.gather(*self._batches, return_exceptions=True)
+
+        while self._queue is not None and not self._queue.empty():
+            _, _, future = self._queue.get_nowait()
+            if not future.done():
+                future.set_exception(RuntimeError("Batcher stopped"))
+
+    async def submit(self, text: str, **options) -> Any:
+        """Queues a single text and waits for its analysis."""
+        if self._task is None:
+            await self.start()
+        if self._queue.qsize() >= self.max_queue:
+            raise WorkerPoolFull(f"Analysis queue is full ({self._queue.qsize()} waiting requests)")
+
+        future = asyncio.get_running_loop().create_future()
+        # Options must be hashable to group requests; None values are left to the defaults
+        key = tuple(sorted((name, value) for name, value in options.items() if value is not None))
+        self._queue.put_nowait((text, key, future))
+        try:
+            # On timeout the future is cancelled and skipped when its batch is formed
+            return await asyncio.wait_for(future, self.timeout)
+        except asyncio.TimeoutError:
+            raise WorkerTimeout(f"Analysis timed out after {self.timeout}s")
+
+    async def submit_many(self, texts: List[str], **options) -> List[Any]:
+        """Queues several texts at once, they can share batches with other requests."""
+        return list(await asyncio.gather(*(self.submit(text, **options) for text in texts)))
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.max_wait
+
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            # Wait for a free worker, then take whatever queued up in the meantime
+            await self._slots.acquire()
+            while len(batch) < self.max_batch_size and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+
+            task = asyncio.create_task(self._dispatch(batch))
+            self._batches.add(task)
+            task.add_done_callback(self._batches.discard)
+
+    async def _dispatch(self, batch: List[Tuple[str, tuple, asyncio.Future]]):
+        try:
+            await self._run_batch(batch)
+        finally:
+            self._slots.release()
+
+    async def _run_batch(self, batch: List[Tuple[str, tuple, asyncio.Future]]):
+        # Skip requests whose client has already gone away
+        batch = [item for item in batch if not item[2].done()]
+        if not batch:
+            return
+
+        grouped: Dict[tuple, List[Tuple[str, asyncio.Future]]] = {}
+        for text, key, future in batch:
+            grouped.setdefault(key, []).append((text, future))
+        groups = [(key, [text for text, _ in items]) for key, items in grouped.items()]
+
+        try:
+            if self.executor:
+                results = await self.executor.run(run_groups, self.batch_fn, groups)
+            else:
+                results = await asyncio.get_running_loop().run_in_executor(None, run_groups, self.batch_fn, groups)
+        except Exception as e:
+            for _, _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for items, group_results in zip(grouped.values(), results):
+            for (_, future), result in zip(items, group_results):
+                if not future.done():
+                    future.set_result(result)
+
+
+def create_batcher(batch_fn: Callable[..., List[Any]], executor: Optional[BoundedExecutor] = None) -> MicroBatcher:
+    """Builds a batcher configured from the environment."""
+    return MicroBatcher(
+        batch_fn,
+        executor=executor,
+        max_batch_size=int(os.getenv('NLP_BATCH_MAX_SIZE', '16')),
+        max_wait_ms=float(os.getenv('NLP_BATCH_MAX_WAIT_MS', '5')),
+        max_queue=int(os.getenv('NLP_BATCH_MAX_QUEUE', '1024')),
+        timeout=executor.timeout if executor else None,
+    )
@@ -0,0 +1,162 @@
+# checkins.py
+
+import csv
+import datetime
+import io
+import json
+import os
+import tempfile
+from typing import Any, AsyncIterator, BinaryIO, Dict, List, Optional, Tuple
+
+ENTRY_STATUSES = ("completed", "missed", "partial")
+CSV_COLUMNS = ("habit_id", "entry_date", "status", "notes")
+
+# Upper bound on the rows accepted by one upload (they are buffered before the COPY)
+MAX_CHECKIN_ROWS = int(os.getenv('CHECKIN_BULK_MAX_ROWS', '50000'))
+# Upper bound on the size of one upload, checked while the body is received
+MAX_CHECKIN_BYTES = int(os.getenv('CHECKIN_BULK_MAX_BYTES', str(16 * 1024 * 1024)))
+
+
+class CheckinUploadTooLarge(Exception):
+    """Raised when an upload has more rows than MAX_CHECKIN_ROWS or more bytes than MAX_CHECKIN_BYTES."""
+
+
+def validate_entry(record: Any) -> Tuple[Optional[tuple], Optional[str]]:
+    """
+    Checks one check-in record and returns (row, None) with
+    row = (habit_id, entry_date, status, notes), or (None, error).
+    """
+    if not isinstance(record, dict):
+        return None, "expected an object"
+
+    try:
+        habit_id = int(record.get("habit_id"))
+    except (TypeError, ValueError):
+        return None, "habit_id must be an integer"
+    if habit_id <= 0 or habit_id > 2**31 - 1:
+        return None, "habit_id out of range"
+
+    try:
+        entry_date = datetime.date.fromisoformat(str(record.get("entry_date", "")).strip())
+    except ValueError:
+        return None, "entry_date must be an ISO date (YYYY-MM-DD)"
+
+    status = str(record.get("status") or "").strip().lower()
+    if status not in ENTRY_STATUSES:
+        return None, f"status must be one of {', '.join(ENTRY_STATUSES)}"
+
+    notes = record.get("notes")
+    if notes is not None and not isinstance(notes, str):
+        notes = str(notes)
+    return (habit_id, entry_date, status, notes or None), None
+
+
+async def spool_upload(chunks: AsyncIterator[bytes]) -> BinaryIO:
+    """
+    Receives a streamed body into a spooled temporary file (in memory up to
+    1 MiB, then on disk), so the parsing can run off the event loop.
+    """
+    body = tempfile.SpooledTemporaryFile(max_size=1024 * 1024)
+    size = 0
+    try:
+        async for chunk in chunks:
+            size += len(chunk)
+            if size > MAX_CHECKIN_BYTES:
+                raise CheckinUploadTooLarge(f"At most {MAX_CHECKIN_BYTES} bytes per upload")
+            body.write(chunk)
+    except BaseException:
+        body.close()
+        raise
+    body.seek(0)
+    return body
+
+
+class ParsedUpload:
+    """Valid rows (tagged with their 1-based row number) and per-row rejects."""
+
+    def __init__(self):
+        self.rows: List[tuple] = []
+        self.rejected: List[Dict[str, Any]] = []
+        self.received = 0
+
+    def add(self, row_no: int, record: Any):
+        self.received += 1
+        if self.received > MAX_CHECKIN_ROWS:
+            raise CheckinUploadTooLarge(f"At most {MAX_CHECKIN_ROWS} check-ins per upload")
+        row, error = validate_entry(record)
+        if error:
+            self.rejected.append({"row": row_no, "error": error})
+        else:
+            self.rows.append((row_no, *row))
+
+
+def _text(body: BinaryIO) -> io.TextIOWrapper:
+    # newline="" leaves the line endings to the parsers (csv needs them inside quoted fields)
+    return io.TextIOWrapper(body, encoding="utf-8-sig", newline="")
+
+
+def parse_ndjson(body: BinaryIO) -> ParsedUpload:
+    """One JSON object per line; blank lines are ignored. Blocking: run it on an executor."""
+    upload = ParsedUpload()
+    row_no = 0
+    for line in _text(body):
+        if not line.strip():
+            continue
+        row_no += 1
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            upload.received += 1
+            upload.rejected.append({"row": row_no, "error": f"invalid JSON: {e}"})
+            continue
+        upload.add(row_no, record)
+    return upload
+
+
+def parse_csv(body: BinaryIO) -> ParsedUpload:
+    """
+    CSV with a header row naming at least habit_id, entry_date and status.
+    Quoted fields may contain newlines. Blocking: run it on an executor.
+    """
+    upload = ParsedUpload()
+    header: Optional[List[str]] = None
+    row_no = 0
+    for values in csv.reader(_text(body)):
+        if not any(value.strip() for value in values):
+            continue
+        if header is None:
+            header = [value.strip().lower() for value in values]
+            missing = [column for column in CSV_COLUMNS[:3] if column not in header]
+            if missing:
+                raise ValueError(f"CSV header is missing: {', '.join(missing)}")
+            continue
+        row_no += 1
+        if len(values) > len(header):
+            upload.received += 1
+            upload.rejected.append({"row": row_no, "error": "too many columns"})
+            continue
+        upload.add(row_no, dict(zip(header, values)))
+    return upload
+
+
+def parse_upload(body: BinaryIO, upload_format: str) -> ParsedUpload:
+    """
+    Parses a spooled upload ("csv" or "ndjson") and closes it. Blocking: run it
+    on an executor, which owns the body from then on. A task that times out
+    may still be reading it, so the caller must not close it.
+    """
+    try:
+        parser = parse_csv if upload_format == "csv" else parse_ndjson
+        return parser(body)
+    finally:
+        body.close()
+
+
+def detect_format(content_type: Optional[str], requested: Optional[str] = None) -> str:
+    """Chooses the parser from ?format= or the Content-Type header."""
+    if requested:
+        return requested.lower()
+    content_type = (content_type or "").split(";")[0].strip().lower()
+    if content_type in ("text/csv", "application/csv"):
+        return "csv"
+    return "ndjson"
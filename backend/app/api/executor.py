@@ -0,0 +1,130 @@
+# executor.py
+
+import asyncio
+import os
+import threading
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Optional
+
+
+class WorkerPoolFull(Exception):
+    """Raised when a pool already has as many queued tasks as it accepts."""
+
+
+class WorkerTimeout(Exception):
+    """Raised when a task does not finish within its timeout."""
+
+
+class BoundedExecutor:
+    """
+    Runs blocking functions (NLP inference, psycopg2 calls) outside the
+    asyncio event loop, on a thread or process pool with a bounded queue.
+
+    Tasks beyond `max_pending` are rejected right away with WorkerPoolFull
+    instead of piling up, and each task waits at most `timeout` seconds.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        kind: str = "thread",
+        max_workers: Optional[int] = None,
+        max_pending: int = 64,
+        timeout: Optional[float] = None,
+    ):
+        if kind not in ("thread", "process"):
+            raise ValueError(f"Unknown executor kind: {kind}")
+
+        self.name = name
+        self.kind = kind
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self._executor: Optional[Executor] = None
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            if self.kind == "process":
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+            else:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers,
+                    thread_name_prefix=f"{self.name}-worker",
+                )
+        return self._executor
+
+    @property
+    def pending(self) -> int:
+        """Number of tasks queued or running."""
+        return self._pending
+
+    async def run(self, fn: Callable[..., Any], *args, timeout: Optional[float] = None) -> Any:
+        """Runs `fn(*args)` on the pool and waits for the result."""
+        with self._lock:
+            if self._pending >= self.max_pending:
+                raise WorkerPoolFull(f"{self.name} pool is full ({self._pending} pending tasks)")
+            self._pending += 1
+
+        try:
+            concurrent_future = self._get_executor().submit(fn, *args)
+        except Exception:
+            self._task_done(None)
+            raise
+        # Released from the worker side, when the task really finishes or is dropped
+        concurrent_future.add_done_callback(self._task_done)
+        future = asyncio.wrap_future(concurrent_future)
+
+        timeout = timeout if timeout is not None else self.timeout
+        try:
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            # A task that has not started yet is dropped from the queue,
+            # one already running cannot be interrupted and just finishes
+            raise WorkerTimeout(f"{self.name} task timed out after {timeout}s")
+
+    def _task_done(self, _future):
+        with self._lock:
+            self._pending -= 1
+
+    def stats(self) -> dict:
+        return {
+            "kind": self.kind,
+            "max_workers": self.max_workers,
+            "max_pending": self.max_pending,
+            "pending": self._pending,
+            "timeout": self.timeout,
+        }
+
+    def shutdown(self, wait: bool = True):
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait)
+            self._executor = None
+
+
+def _env_timeout(name: str, default: str) -> Optional[float]:
+    value = float(os.getenv(name, default))
+    return value if value > 0 else None
+
+
+def create_inference_executor() -> BoundedExecutor:
+    """Pool for CPU-bound NLP work, configured from the environment."""
+    return BoundedExecutor(
+        "inference",
+        kind=os.getenv('NLP_EXECUTOR_KIND', 'thread'),
+        max_workers=int(os.getenv('NLP_EXECUTOR_WORKERS', '0')) or None,
+        max_pending=int(os.getenv('NLP_EXECUTOR_MAX_PENDING', '64')),
+        timeout=_env_timeout('NLP_EXECUTOR_TIMEOUT_S', '30'),
+    )
+
+
+def create_db_executor() -> BoundedExecutor:
+    """Pool for blocking database calls (always threads, psycopg2 releases the GIL)."""
+    return BoundedExecutor(
+        "db",
+        kind="thread",
+        max_workers=int(os.getenv('DB_EXECUTOR_WORKERS', '8')),
+        max_pending=int(os.getenv('DB_EXECUTOR_MAX_PENDING', '128')),
+        timeout=_env_timeout('DB_EXECUTOR_TIMEOUT_S', '10'),
+    )
@@ -0,0 +1,110 @@
+# metrics.py
+
+import os
+from typing import Callable, Dict, Optional
+
+from prometheus_client import CollectorRegistry, Counter, Gauge, Histogram, generate_latest, CONTENT_TYPE_LATEST
+from prometheus_client import multiprocess
+from prometheus_client.core import GaugeMetricFamily
+
+# Dedicated registry: only HabitForge metrics, no default process collectors
+REGISTRY = CollectorRegistry()
+# In-memory stats of this process (pool, executors, caches), see register_stats
+STATS_REGISTRY = CollectorRegistry()
+
+# Set by gunicorn.conf.py: every worker writes its samples to files in this
+# directory and /metrics aggregates them, whichever worker serves the scrape
+MULTIPROCESS = "PROMETHEUS_MULTIPROC_DIR" in os.environ
+
+# Latency buckets from 0.5ms (regex, cache lookups) to 30s (cold model loads)
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+HTTP_REQUEST_SECONDS = Histogram(
+    "habitforge_http_request_duration_seconds", "HTTP request latency",
+    ["method", "route", "status"], buckets=LATENCY_BUCKETS, registry=REGISTRY,
+)
+NLP_STAGE_SECONDS = Histogram(
+    "habitforge_nlp_stage_duration_seconds", "Latency of each stage of extract_habits_ml",
+    ["stage", "language"], buckets=LATENCY_BUCKETS, registry=REGISTRY,
+)
+NLP_EVENTS = Counter(
+    "habitforge_nlp_events_total", "NLP events (cache lookups, extraction tiers)",
+    ["event", "result"], registry=REGISTRY,
+)
+MODEL_LOAD_SECONDS = Gauge(
+    "habitforge_model_load_seconds", "Time spent loading each model",
+    ["kind", "language"], registry=REGISTRY, multiprocess_mode="max",
+)
+DB_OPERATION_SECONDS = Histogram(
+    "habitforge_db_operation_duration_seconds", "Latency of DatabaseConnection operations",
+    ["operation"], buckets=LATENCY_BUCKETS, registry=REGISTRY,
+)
+DB_OPERATION_ERRORS = Counter(
+    "habitforge_db_operation_errors_total", "Failed DatabaseConnection operations",
+    ["operation"], registry=REGISTRY,
+)
+
+
+def nlp_observer(kind: str, name: str, value: float, labels: Dict[str, str]):
+    """Receives the timing hooks of the NLM module."""
+    if kind == "duration":
+        if name == "model_load":
+            MODEL_LOAD_SECONDS.labels(labels.get("kind", ""), labels.get("language", "")).set(value)
+        else:
+            NLP_STAGE_SECONDS.labels(name, labels.get("language", "")).observe(value)
+    else:
+        result = labels.get("result") or labels.get("tier") or ""
+        NLP_EVENTS.labels(name, result).inc(value)
+
+
+def db_observer(operation: str, seconds: float, failed: bool):
+    """Receives the timing hooks of DatabaseConnection."""
+    DB_OPERATION_SECONDS.labels(operation).observe(seconds)
+    if failed:
+        DB_OPERATION_ERRORS.labels(operation).inc()
+
+
+class StatsCollector:
+    """
+    Exposes in-memory stats (pool, executors, caches) as gauges, read at scrape time.
+
+    These live in the memory of a single process: with multiple workers they
+    carry a pid label and describe only the worker that served the scrape.
+    """
+
+    def __init__(self, name: str, stats_fn: Callable[[], Optional[Dict]], documentation: str):
+        self.name = name
+        self.stats_fn = stats_fn
+        self.documentation = documentation
+
+    def collect(self):
+        try:
+            stats = self.stats_fn() or {}
+        except Exception as e:
+            print(f"⚠️ Could not collect {self.name} stats: {e}")
+            return
+        for key, value in stats.items():
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                continue
+            name, documentation = f"habitforge_{self.name}_{key}", f"{self.documentation}: {key}"
+            if not MULTIPROCESS:
+                yield GaugeMetricFamily(name, documentation, value=value)
+                continue
+            gauge = GaugeMetricFamily(name, documentation, labels=["pid"])
+            gauge.add_metric([str(os.getpid())], value)
+            yield gauge
+
+
+def register_stats(name: str, stats_fn: Callable[[], Optional[Dict]], documentation: str):
+    STATS_REGISTRY.register(StatsCollector(name, stats_fn, documentation))
+
+
+def render_metrics():
+    """Returns the metrics in Prometheus text format and their content type."""
+    if MULTIPROCESS:
+        # A fresh registry per scrape: the collector reads every worker's files
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry) + generate_latest(STATS_REGISTRY), CONTENT_TYPE_LATEST
@@ -0,0 +1,56 @@
+from pydantic import BaseModel, Field
+from typing import List, Optional
+import datetime
+
+class GroupInput(BaseModel):
+    """
+    Model for creating a social group.
+    """
+    name: str = Field(..., min_length=1, max_length=100)
+    description: Optional[str] = None
+    created_by: Optional[int] = None
+
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "name": "Runners",
+                "description": "Chi corre di più questo mese?",
+                "created_by": 1
+            }
+        }
+
+class GroupMemberInput(BaseModel):
+    user_id: int
+
+class GroupResponse(BaseModel):
+    """
+    Model for a social group.
+    """
+    id: int
+    name: str
+    description: Optional[str] = None
+    created_by: Optional[int] = None
+    created_at: Optional[datetime.datetime] = None
+    member_count: int = 0
+
+class LeaderboardEntry(BaseModel):
+    """
+    A member's row in a group leaderboard. The score is the number of
+    completed check-ins in the rolling window, summed over the member's habits.
+    """
+    rank: int
+    user_id: int
+    username: str
+    habits: int
+    score: int
+    total_completed: int
+    best_current_streak: int
+    longest_streak: int
+    completion_rate: float
+    updated_at: Optional[datetime.datetime] = None
+
+class LeaderboardResponse(BaseModel):
+    group_id: int
+    limit: int
+    offset: int
+    entries: List[LeaderboardEntry]
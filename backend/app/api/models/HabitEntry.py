@@ -0,0 +1,32 @@
+from pydantic import BaseModel
+from typing import List
+
+class HabitEntryReject(BaseModel):
+    """
+    A check-in row that was not saved, with its 1-based row number in the upload.
+    """
+    row: int
+    error: str
+
+class HabitEntryBulkResponse(BaseModel):
+    """
+    Model for the response of a bulk check-in upload.
+    """
+    status: str
+    message: str
+    received: int
+    inserted: int
+    updated: int
+    rejected: List[HabitEntryReject]
+
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "status": "partial",
+                "message": "2 check-ins saved, 1 rejected",
+                "received": 3,
+                "inserted": 1,
+                "updated": 1,
+                "rejected": [{"row": 3, "error": "habit not found"}]
+            }
+        }
@@ -1,12 +1,12 @@
-from pydantic import BaseModel
-from typing import Optional
+from pydantic import BaseModel, Field
+from typing import Any, Dict, List, Optional
 
 class HabitInput(BaseModel):
     """
     Model for habit text input from user.
     """
     text: str
-    user_id: Optional[str] = None
+    user_id: Optional[int] = None
     language: Optional[str] = None
 
     class Config:
@@ -14,11 +14,32 @@ class HabitInput(BaseModel):
         json_schema_extra = {
             "example": {
                 "text": "Voglio correre 5km tutti i giorni",
-                "user_id": "user123",
+                "user_id": 123,
                 "language": "it"
             }
         }
 
+class HabitAnalysis(BaseModel):
+    """
+    Model for the result of a habit analysis. Only the fields selected with
+    `fields` or `verbosity` are present in a response.
+    """
+    action: Optional[str] = None
+    quantity: Optional[str] = None
+    frequency_count: Optional[int] = None
+    frequency_period: Optional[int] = None
+    target: Optional[str] = None
+    language: Optional[str] = None
+    frequency_text: Optional[str] = None
+    ml_confidence: Optional[float] = None
+    extraction_tier: Optional[str] = None
+    text: Optional[str] = None
+    action_confidence: Optional[float] = None
+    frequency_confidence: Optional[float] = None
+    main_quantity: Optional[Dict[str, Any]] = None
+    quantities: Optional[List[Dict[str, Any]]] = None
+    entities_detected: Optional[Dict[str, List[Dict[str, Any]]]] = None
+
 class HabitAnalysisResponse(BaseModel):
     """
     Model for the analyzed habit response.
@@ -26,7 +47,7 @@ class HabitAnalysisResponse(BaseModel):
     status: str
     message: str
     original_text: str
-    analysis: Optional[dict] = None
+    analysis: Optional[HabitAnalysis] = None
     
     class Config:
         json_schema_extra = {
@@ -36,29 +57,86 @@ class HabitAnalysisResponse(BaseModel):
                 "original_text": "Voglio correre 5km tutti i giorni",
                 "analysis": {
                     "action": "correre",
-                    "quantity": "5km",
-                    "frequency": 7,
-                    "period": 7
+                    "quantity": "5 km",
+                    "frequency_count": 7,
+                    "frequency_period": 7
                 }
             }
         }
 
+class HabitBatchInput(BaseModel):
+    """
+    Model for several habit texts submitted together.
+    """
+    texts: List[str] = Field(..., min_length=1, max_length=100)
+    user_id: Optional[int] = None
+    language: Optional[str] = None
+
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "texts": [
+                    "Voglio correre 5km tutti i giorni",
+                    "Read 20 pages every day"
+                ],
+                "user_id": 123
+            }
+        }
+
+class HabitBatchAnalysisResponse(BaseModel):
+    """
+    Model for the response of a batch analysis, one result per input text.
+    """
+    status: str
+    message: str
+    results: List[HabitAnalysisResponse]
+
+class HabitListResponse(BaseModel):
+    """
+    Model for a page of habits. Pass next_cursor as `cursor` to get the
+    next page; it is null on the last page.
+    """
+    items: List[dict]
+    next_cursor: Optional[str] = None
+
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "items": [
+                    {"id": 42, "created_at": "2024-05-20T08:30:00", "name": "correre", "frequency_count": 7}
+                ],
+                "next_cursor": "WyIyMDI0LTA1LTIwVDA4OjMwOjAwIiwgNDJd"
+            }
+        }
+
 class HabitDatabaseModel(BaseModel):
     """
     Model for the habit database.
     """
-    user_id: int
+    user_id: Optional[int] = None
     name: str
     description: str
-    frequency: str
+    action: Optional[str] = Field(None, max_length=100)
+    quantity: Optional[str] = Field(None, max_length=50)
+    target: Optional[str] = Field(None, max_length=100)
+    frequency_count: Optional[int] = None
+    frequency_period: Optional[int] = None
+    language: Optional[str] = Field(None, max_length=10)
+    ml_confidence: Optional[float] = Field(None, ge=0, le=9.99)
 
     class Config:
         orm_mode = True
         json_schema_extra = {
             "example": {
-                "user_id": "123",
-                "name": "Correre",
+                "user_id": 123,
+                "name": "correre",
                 "description": "correre 5km ogni giorno",
-                "frequency": "daily"
+                "action": "correre",
+                "quantity": "5 km",
+                "target": None,
+                "frequency_count": 7,
+                "frequency_period": 7,
+                "language": "it",
+                "ml_confidence": 0.85
             }
         }
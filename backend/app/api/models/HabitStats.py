@@ -0,0 +1,50 @@
+from pydantic import BaseModel
+from typing import List, Optional
+import datetime
+
+class HabitStats(BaseModel):
+    """
+    Model for the streak and completion statistics of a habit.
+    Streaks count consecutive periods of `period_days` days in which the
+    habit was completed at least `required_count` times.
+    """
+    habit_id: int
+    required_count: int
+    period_days: int
+    current_streak: int
+    longest_streak: int
+    completion_rate: float
+    window_days: int
+    window_completed: int
+    total_completed: int
+    current_period_completed: int
+    last_entry_date: Optional[datetime.date] = None
+    updated_at: Optional[datetime.datetime] = None
+
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "habit_id": 1,
+                "required_count": 1,
+                "period_days": 1,
+                "current_streak": 12,
+                "longest_streak": 30,
+                "completion_rate": 0.8333,
+                "window_days": 30,
+                "window_completed": 25,
+                "total_completed": 140,
+                "current_period_completed": 1,
+                "last_entry_date": "2024-05-20",
+                "updated_at": "2024-05-20T08:30:00"
+            }
+        }
+
+class HabitStatsRecomputeInput(BaseModel):
+    """
+    Model for a statistics recompute request (all habits when habit_ids is omitted).
+    """
+    habit_ids: Optional[List[int]] = None
+
+class HabitStatsRecomputeResponse(BaseModel):
+    status: str
+    recomputed: int
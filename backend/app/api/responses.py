@@ -0,0 +1,87 @@
+# responses.py
+
+import os
+from typing import Any, Dict, List, Optional, Tuple
+
+import orjson
+from fastapi.responses import JSONResponse
+
+from .models.HabitInput import HabitAnalysis
+
+
+class FastJSONResponse(JSONResponse):
+    """
+    JSON response rendered with orjson. Numpy scalars and arrays (e.g. the
+    float32 scores of the transformer pipelines) are serialized natively,
+    without converting each value in Python first.
+    """
+
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS)
+
+
+# Analysis fields returned at each verbosity level
+ANALYSIS_FIELDS: Tuple[str, ...] = tuple(HabitAnalysis.model_fields)
+VERBOSITY_FIELDS: Dict[str, Tuple[str, ...]] = {
+    "compact": ("action", "quantity", "frequency_count", "frequency_period"),
+    "standard": ("action", "quantity", "frequency_count", "frequency_period",
+                 "target", "language", "frequency_text", "ml_confidence", "extraction_tier"),
+    "full": ANALYSIS_FIELDS,
+}
+DEFAULT_VERBOSITY = os.getenv('ANALYSIS_DEFAULT_VERBOSITY', 'full')
+
+
+def resolve_analysis_fields(fields: Optional[str], verbosity: Optional[str]) -> Tuple[str, ...]:
+    """
+    Analysis fields to return: the comma-separated `fields` if given,
+    otherwise the preset of `verbosity`. Raises ValueError on unknown names.
+    """
+    if fields:
+        selected = tuple(dict.fromkeys(field.strip() for field in fields.split(",") if field.strip()))
+        unknown = [field for field in selected if field not in ANALYSIS_FIELDS]
+        if unknown:
+            raise ValueError(f"Unknown analysis fields: {', '.join(unknown)}")
+        return selected
+    verbosity = verbosity or DEFAULT_VERBOSITY
+    if verbosity not in VERBOSITY_FIELDS:
+        raise ValueError(f"verbosity must be one of: {', '.join(VERBOSITY_FIELDS)}")
+    return VERBOSITY_FIELDS[verbosity]
+
+
+def project_analysis(analysis: Optional[Dict[str, Any]], fields: Tuple[str, ...]) -> Optional[Dict[str, Any]]:
+    """Keeps only the selected fields of an analysis (a new dict, cached results stay untouched)."""
+    if analysis is None:
+        return None
+    return {field: analysis.get(field) for field in fields}
+
+
+def analysis_payload(status: str, message: str, original_text: str,
+                     analysis: Optional[Dict[str, Any]], fields: Tuple[str, ...]) -> Dict[str, Any]:
+    """
+    HabitAnalysisResponse as a plain dict, ready for FastJSONResponse.
+    FastAPI does not validate a Response returned directly, so the endpoints'
+    response_model only documents the schema: tests/test_responses.py checks
+    that these payloads still match it.
+    """
+    return {
+        "status": status,
+        "message": message,
+        "original_text": original_text,
+        "analysis": project_analysis(analysis, fields),
+    }
+
+
+def analysis_payloads(texts: List[str], analyses: List[Dict[str, Any]], fields: Tuple[str, ...]) -> List[Dict[str, Any]]:
+    return [
+        analysis_payload("success", "Habit analyzed successfully", text, analysis, fields)
+        for text, analysis in zip(texts, analyses)
+    ]
+
+
+def batch_analysis_payload(texts: List[str], analyses: List[Dict[str, Any]], fields: Tuple[str, ...]) -> Dict[str, Any]:
+    """HabitBatchAnalysisResponse as a plain dict, ready for FastJSONResponse."""
+    return {
+        "status": "success",
+        "message": f"{len(analyses)} habits analyzed successfully",
+        "results": analysis_payloads(texts, analyses, fields),
+    }
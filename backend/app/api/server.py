@@ -1,20 +1,44 @@
 # server.py
 
-from random import randint
-from fastapi import FastAPI, HTTPException
-from .models.HabitInput import HabitInput, HabitAnalysisResponse,
-from app.db.database import HabitRepository
+import asyncio
+from typing import List, Optional
+import decimal
+import time
+import orjson
+from fastapi import FastAPI, Header, HTTPException, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from .models.HabitInput import HabitInput, HabitAnalysisResponse, HabitBatchInput, HabitBatchAnalysisResponse, HabitListResponse
+from .batching import create_batcher
+from .admission import create_admission_controller, AdmissionRejected, DeadlineExceeded
+from .executor import create_inference_executor, create_db_executor, WorkerPoolFull, WorkerTimeout
+from .models.HabitEntry import HabitEntryBulkResponse
+from .models.HabitStats import HabitStats, HabitStatsRecomputeInput, HabitStatsRecomputeResponse
+from .models.Group import GroupInput, GroupMemberInput, GroupResponse, LeaderboardResponse
+from .responses import FastJSONResponse, resolve_analysis_fields, analysis_payload, batch_analysis_payload
+from .checkins import spool_upload, parse_upload, detect_format, CheckinUploadTooLarge
+from .metrics import HTTP_REQUEST_SECONDS, nlp_observer, db_observer, register_stats, render_metrics
+from app.db.database import habit_repo, entry_repo, group_repo, close_pool, AnalysisCacheRepository, MissingReference, add_query_observer
+from app.db.leaderboards import leaderboard_cache
+from app.db.write_behind import create_habit_writer, create_analysis_cache_writer, write_behind_enabled, WriteQueueFull
 import sys
 import os
 
-# Aggiungi il path per importare il modulo NLM
-sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'NLM'))
+# Aggiungi il path per importare il modulo NLM (che importa a sua volta api.models)
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
 
-extract_habits_ml = None
+extract_habits_ml_batch = None
 create_habit_object = None
+detail_for_fields = None
+segment_text = None
+registry = None
 
 try:
-    from NLM.habit_nalyze import extract_habits_ml, create_habit_object
+    # Import is cheap: models are loaded by the registry on first use or warm-up
+    from NLM.habit_nalyze import extract_habits_ml_batch, create_habit_object, analysis_cache, detail_for_fields
+    from NLM.segmentation import segment_text, share_sentence_frequency, TooManySegments
+    from NLM.model_registry import registry, preload_languages
+    from NLM.language_detect import get_detector
+    from NLM.instrumentation import add_observer
     NLP_AVAILABLE = True
 except ImportError as e:
     print(f"⚠️ NLP module not available: {e}")
@@ -27,6 +51,192 @@ app = FastAPI(
     version="0.1.0",
 )
 
+# Worker pools: blocking NLP and database work never runs on the event loop
+inference_executor = create_inference_executor()
+db_executor = create_db_executor()
+
+# Micro-batcher: groups concurrent analysis requests into a single NLP batch
+batcher = create_batcher(extract_habits_ml_batch, inference_executor) if NLP_AVAILABLE else None
+
+# Admission control in front of the batcher: in-flight limit, single-flight coalescing, deadlines
+admission = create_admission_controller(batcher.submit) if batcher else None
+
+# Prometheus metrics: stage timings are pushed by the hooks, stats are read at scrape time.
+# With NLP_EXECUTOR_KIND=process the NLP stages run in child processes and are not seen here.
+add_query_observer(db_observer)
+if NLP_AVAILABLE:
+    add_observer(nlp_observer)
+    register_stats("analysis_cache", analysis_cache.stats, "Analysis cache")
+register_stats("leaderboard_cache", leaderboard_cache.stats, "Group leaderboard cache")
+register_stats("habit_cache", lambda: habit_repo.cache.stats(), "Habit read-through cache")
+register_stats("db_pool", lambda: habit_repo.db.pool_stats(), "Database connection pool")
+if admission:
+    register_stats("admission", admission.stats, "Analysis admission control")
+register_stats("inference_executor", inference_executor.stats, "Inference worker pool")
+register_stats("db_executor", db_executor.stats, "Database worker pool")
+
+@app.middleware("http")
+async def record_request_latency(request: Request, call_next):
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        # Label by route template (not raw path) to keep the label cardinality bounded
+        route = request.scope.get("route")
+        path = route.path if route else "unmatched"
+        HTTP_REQUEST_SECONDS.labels(request.method, path, str(status)).observe(time.perf_counter() - start)
+
+# Background warm-up of the preloaded languages (see NLP_PRELOAD_LANGUAGES)
+warm_up_task = None
+
+# Write-behind queue for analyzed habits (DB_WRITE_MODE=write_behind), created at startup
+habit_writer = None
+
+# Shared analysis cache tier (ANALYSIS_CACHE_BACKEND=postgres): its write queue
+analysis_cache_writer = None
+
+# Maintenance tasks started at startup (see run_periodically)
+maintenance_tasks: List[asyncio.Task] = []
+
+
+async def run_periodically(action: str, fn, interval: float):
+    """Runs a blocking maintenance job on the db pool at startup and then every `interval` seconds."""
+    while True:
+        try:
+            count = await db_executor.run(fn)
+            if count:
+                print(f"🧹 {action}: {count}")
+        except Exception as e:
+            print(f"⚠️ {action} failed: {e}")
+        await asyncio.sleep(interval)
+
+
+@app.on_event("startup")
+async def start_batcher():
+    global warm_up_task, habit_writer, analysis_cache_writer
+    if batcher:
+        await batcher.start()
+    if write_behind_enabled():
+        if habit_writer is None:
+            habit_writer = create_habit_writer(habit_repo)
+            register_stats("write_behind", habit_writer.stats, "Habit write-behind queue")
+        habit_writer.start()
+    if NLP_AVAILABLE and os.getenv('ANALYSIS_CACHE_BACKEND', 'memory') == 'postgres':
+        # Memory misses fall back to the shared Postgres table. Writes go through
+        # a write-behind queue, so the inference threads never wait for the INSERT.
+        cache_repo = AnalysisCacheRepository(ttl=analysis_cache.ttl)
+        if analysis_cache_writer is None:
+            analysis_cache_writer = create_analysis_cache_writer(cache_repo)
+            register_stats("analysis_cache_writes", analysis_cache_writer.stats, "Shared analysis cache write queue")
+        cache_repo.writer = analysis_cache_writer
+        analysis_cache_writer.start()
+        analysis_cache.backend = cache_repo
+        if cache_repo.ttl:
+            interval = float(os.getenv('ANALYSIS_CACHE_PURGE_INTERVAL_S', '3600'))
+            maintenance_tasks.append(asyncio.create_task(run_periodically(
+                "Expired analyses purged from the shared cache", cache_repo.purge_expired, interval)))
+    # Leaderboard scores and streaks depend on the day: recompute the groups not refreshed today
+    interval = float(os.getenv('LEADERBOARD_REFRESH_INTERVAL_S', '3600'))
+    if interval > 0:
+        maintenance_tasks.append(asyncio.create_task(run_periodically(
+            "Leaderboards refreshed for the new day", group_repo.refresh_stale_leaderboards, interval)))
+    if registry:
+        # Don't block startup: /ready reports when the models are loaded
+        warm_up_task = asyncio.get_running_loop().run_in_executor(None, registry.warm_up)
+    try:
+        # Open the minimum number of pooled connections up front
+        await db_executor.run(habit_repo.db.pool.fill)
+    except Exception as e:
+        print(f"⚠️ Database pool warm-up failed: {e}")
+
+@app.on_event("shutdown")
+async def stop_batcher():
+    if batcher:
+        await batcher.stop()
+    if habit_writer:
+        # Drain the queued habits before the pool is closed
+        timeout = float(os.getenv('DB_WRITE_BEHIND_DRAIN_TIMEOUT_S', '30'))
+        await asyncio.get_running_loop().run_in_executor(None, habit_writer.stop, timeout)
+    for task in maintenance_tasks:
+        task.cancel()
+    maintenance_tasks.clear()
+    if analysis_cache_writer:
+        # Cache entries are cheap to lose: a short drain is enough
+        await asyncio.get_running_loop().run_in_executor(None, analysis_cache_writer.stop, 2.0)
+    inference_executor.shutdown(wait=False)
+    db_executor.shutdown(wait=False)
+    close_pool()
+
+# Errors of an overloaded or too slow analysis path
+OVERLOAD_ERRORS = (AdmissionRejected, DeadlineExceeded, WorkerPoolFull, WorkerTimeout, WriteQueueFull)
+
+def overloaded_error(e: Exception) -> HTTPException:
+    """Maps worker pool errors to the HTTP status the load balancer expects."""
+    if isinstance(e, (AdmissionRejected, WorkerPoolFull, WriteQueueFull)):
+        retry_after = admission.retry_after_header if admission else "1"
+        return HTTPException(status_code=503, detail=f"Server busy: {str(e)}", headers={"Retry-After": retry_after})
+    return HTTPException(status_code=504, detail=f"Timed out: {str(e)}")
+
+def request_deadline(deadline_ms: Optional[float]) -> Optional[float]:
+    """
+    Converts the X-Deadline-Ms header (milliseconds the client is willing to
+    wait, counted from arrival) to an event loop deadline.
+    """
+    if deadline_ms is None:
+        return None
+    if deadline_ms <= 0:
+        raise HTTPException(status_code=400, detail="X-Deadline-Ms must be positive")
+    return asyncio.get_running_loop().time() + deadline_ms / 1000.0
+
+def check_deadline(deadline: Optional[float]):
+    """Skips the remaining work (e.g. saving) once the client has given up."""
+    if deadline is not None and asyncio.get_running_loop().time() >= deadline:
+        raise DeadlineExceeded("Deadline exceeded before saving")
+
+def save_habit(analysis: dict, user_id: Optional[int] = None) -> Optional[int]:
+    """
+    Builds the habit object from an analysis and saves it to the database.
+    In write-behind mode the habit is only queued and no ID is returned.
+    """
+    habitObj = create_habit_object(analysis, user_id=user_id)
+
+    if habit_writer:
+        habit_writer.submit(habitObj.model_dump())
+        return None
+
+    habit_id = habit_repo.create_habit(**habitObj.model_dump())
+    print(f"✅ Habit saved to database with ID: {habit_id}")
+    return habit_id
+
+def save_habits(analyses: List[dict], user_id: Optional[int] = None) -> List[int]:
+    """Saves several analyses with a single multi-row INSERT (or queues them)."""
+    rows = [create_habit_object(analysis, user_id=user_id).model_dump() for analysis in analyses]
+
+    if habit_writer:
+        habit_writer.submit_many(rows)
+        return []
+
+    habit_ids = habit_repo.create_habits(rows)
+    print(f"✅ {len(habit_ids)} habits saved to database")
+    return habit_ids
+
+async def check_user(user_id: Optional[int]):
+    """
+    Rejects an unknown user_id (404) before any analysis work is done.
+    In write-behind mode the insert happens later, so this is the only check.
+    """
+    if user_id is None:
+        return
+    try:
+        exists = await db_executor.run(habit_repo.user_exists, user_id)
+    except Exception as e:
+        raise database_error("Checking user", e)
+    if not exists:
+        raise HTTPException(status_code=404, detail=f"User {user_id} not found")
+
 # Health check endpoint
 @app.get("/health")
 async def health_check():
@@ -36,55 +246,452 @@ async def health_check():
         "version": "0.1.0"
     }
 
+# Readiness endpoint: unlike /health, it fails until the preloaded models are in memory
+@app.get("/ready")
+async def readiness_check():
+    ready = NLP_AVAILABLE and registry.is_ready()
+    return JSONResponse(
+        status_code=200 if ready else 503,
+        content={
+            "ready": ready,
+            "preload_languages": preload_languages() if NLP_AVAILABLE else [],
+            "models": registry.status() if NLP_AVAILABLE else {},
+        }
+    )
+
+@app.post("/models/warmup")
+async def warm_up_models(languages: Optional[str] = None):
+    """
+    Loads the models of the given comma-separated languages
+    (default: the configured preload list) and waits until they are ready.
+    """
+    if not NLP_AVAILABLE:
+        raise HTTPException(status_code=503, detail="NLP module not available")
+
+    langs = [lang.strip() for lang in languages.split(',') if lang.strip()] if languages else None
+    loaded = await asyncio.get_running_loop().run_in_executor(None, registry.warm_up, langs)
+    return {"loaded": loaded, "models": registry.status()}
+
+# Runtime statistics (in-memory only, never touches the database)
+@app.get("/stats")
+async def runtime_stats():
+    return {
+        "db_pool": habit_repo.db.pool_stats(),
+        "analysis_cache": analysis_cache.stats() if NLP_AVAILABLE else None,
+        "language_detector_cache": get_detector().cache_info()._asdict() if NLP_AVAILABLE else None,
+        "executors": {
+            "inference": inference_executor.stats(),
+            "db": db_executor.stats(),
+        },
+        "write_behind": habit_writer.stats() if habit_writer else None,
+        "leaderboard_cache": leaderboard_cache.stats(),
+        "habit_cache": habit_repo.cache.stats(),
+        "admission": admission.stats() if admission else None,
+    }
+
+# Prometheus scrape endpoint
+@app.get("/metrics")
+async def metrics():
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
+
+def analysis_fields(fields: Optional[str], verbosity: Optional[str]):
+    """Resolves the `fields`/`verbosity` query parameters of the analyze endpoints."""
+    try:
+        return resolve_analysis_fields(fields, verbosity)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
 # Post ENDPOINT
 @app.post("/habits/analyze", response_model=HabitAnalysisResponse)
-async def analyze_habit_text(request: HabitInput):
+async def analyze_habit_text(request: HabitInput, fields: Optional[str] = None, verbosity: Optional[str] = None,
+                             x_deadline_ms: Optional[float] = Header(None)):
     """
     This endpoint receives the natural language text of a new habit
     and analyzes it to extract action, quantity, frequency, etc.
+    `fields` (comma-separated) or `verbosity` (compact, standard, full)
+    select the analysis fields; parts nobody asked for are not computed.
+    With an X-Deadline-Ms header the work is dropped (504) once the client
+    would no longer wait for it.
     """
     
     print(f"--> Text received from client: '{request.text}'")
+    selected = analysis_fields(fields, verbosity)
+    deadline = request_deadline(x_deadline_ms)
+    await check_user(request.user_id)
     
     try:
-        if NLP_AVAILABLE and extract_habits_ml and create_habit_object:
-            # Usa il modulo NLP per analizzare il testo
-            analysis = extract_habits_ml(request.text)
-            habitObj = create_habit_object(analysis)
-
+        if NLP_AVAILABLE and admission and create_habit_object:
+            # Usa il modulo NLP per analizzare il testo (in batch con le richieste concorrenti)
+            analysis = await admission.submit(
+                request.text, deadline=deadline, language=request.language, detail=detail_for_fields(selected))
 
             # Save to database
-            habit_repo = HabitRepository()
-            habit_id = habit_repo.create_habit(
-                name=habitObj.name,
-                description=habitObj.description,
-                frequency=habitObj.frequency,
-                user_id=habitObj.user_id
-            )
-            print(f"✅ Habit saved to database with ID: {habit_id}")   
-
-            return HabitAnalysisResponse(
-                status="success",
-                message="Habit analyzed successfully",
-                original_text=request.text,
-                analysis=analysis
-            )
+            check_deadline(deadline)
+            await db_executor.run(save_habit, analysis, request.user_id)
+
+            return FastJSONResponse(analysis_payload(
+                "success", "Habit analyzed successfully", request.text, analysis, selected))
         else:
             print("⚠️ NLP module not available, returning default response")
-            return HabitAnalysisResponse(
-                status="error",
-                message="NLP module not available",
-                original_text=request.text,
-                analysis=None
-            )
-        
-
-        
-
-            
+            return FastJSONResponse(analysis_payload(
+                "error", "NLP module not available", request.text, None, selected))
+    except OVERLOAD_ERRORS as e:
+        print(f"⚠️ Habit analysis rejected: {e}")
+        raise overloaded_error(e)
+    except MissingReference as e:
+        raise HTTPException(status_code=404, detail=str(e))
     except Exception as e:
         print(f"❌ Error analyzing habit: {e}")
         raise HTTPException(
             status_code=500, 
             detail=f"Error analyzing habit: {str(e)}"
-        )
\ No newline at end of file
+        )
+
+@app.post("/habits/analyze/batch", response_model=HabitBatchAnalysisResponse)
+async def analyze_habit_batch(request: HabitBatchInput, fields: Optional[str] = None, verbosity: Optional[str] = None,
+                              x_deadline_ms: Optional[float] = Header(None)):
+    """
+    This endpoint receives several habit texts at once and analyzes them
+    together, running the NLP models over the whole batch.
+    `fields`, `verbosity` and X-Deadline-Ms work as in /habits/analyze.
+    """
+
+    print(f"--> Batch of {len(request.texts)} texts received from client")
+    selected = analysis_fields(fields, verbosity)
+    deadline = request_deadline(x_deadline_ms)
+    await check_user(request.user_id)
+
+    if not (NLP_AVAILABLE and admission and create_habit_object):
+        print("⚠️ NLP module not available, returning default response")
+        return HabitBatchAnalysisResponse(
+            status="error",
+            message="NLP module not available",
+            results=[]
+        )
+
+    try:
+        analyses = await admission.submit_many(
+            request.texts, deadline=deadline, language=request.language, detail=detail_for_fields(selected))
+
+        check_deadline(deadline)
+        await db_executor.run(save_habits, analyses, request.user_id)
+
+        return FastJSONResponse(batch_analysis_payload(request.texts, analyses, selected))
+    except OVERLOAD_ERRORS as e:
+        print(f"⚠️ Habit batch rejected: {e}")
+        raise overloaded_error(e)
+    except MissingReference as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except Exception as e:
+        print(f"❌ Error analyzing habit batch: {e}")
+        raise HTTPException(
+            status_code=500,
+            detail=f"Error analyzing habit batch: {str(e)}"
+        )
+
+@app.post("/habits/analyze/segmented", response_model=HabitBatchAnalysisResponse)
+async def analyze_habit_paragraph(request: HabitInput, fields: Optional[str] = None, verbosity: Optional[str] = None,
+                                  x_deadline_ms: Optional[float] = Header(None)):
+    """
+    This endpoint receives a longer text describing several habits, splits
+    it into sentences and coordinated clauses and returns one analysis per
+    habit. The segments are analyzed in parallel batches, so the latency
+    depends on the segment size rather than on the length of the text.
+    `fields`, `verbosity` and X-Deadline-Ms work as in /habits/analyze.
+    """
+
+    print(f"--> Text of {len(request.text)} characters received for segmentation")
+    selected = analysis_fields(fields, verbosity)
+    deadline = request_deadline(x_deadline_ms)
+    await check_user(request.user_id)
+
+    if not (NLP_AVAILABLE and admission and create_habit_object):
+        print("⚠️ NLP module not available, returning default response")
+        return HabitBatchAnalysisResponse(
+            status="error",
+            message="NLP module not available",
+            results=[]
+        )
+
+    try:
+        # The parse of the whole text is CPU work: it runs on the inference pool too
+        lang_code, segments = await inference_executor.run(segment_text, request.text, request.language)
+        texts = [segment.text for segment in segments]
+        analyses = await admission.submit_many(
+            texts, deadline=deadline, language=lang_code, detail=detail_for_fields(selected))
+        analyses = share_sentence_frequency(segments, analyses)
+
+        check_deadline(deadline)
+        await db_executor.run(save_habits, analyses, request.user_id)
+
+        return FastJSONResponse(batch_analysis_payload(texts, analyses, selected))
+    except TooManySegments as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except OVERLOAD_ERRORS as e:
+        print(f"⚠️ Segmented analysis rejected: {e}")
+        raise overloaded_error(e)
+    except MissingReference as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except Exception as e:
+        print(f"❌ Error analyzing segmented text: {e}")
+        raise HTTPException(
+            status_code=500,
+            detail=f"Error analyzing segmented text: {str(e)}"
+        )
+
+@app.post("/habits/entries/bulk", response_model=HabitEntryBulkResponse)
+async def bulk_checkin(request: Request, format: Optional[str] = None):
+    """
+    This endpoint receives many check-ins at once (e.g. an offline sync from
+    the mobile app) as NDJSON or CSV (habit_id, entry_date, status, notes)
+    and saves them with a single COPY + upsert. Invalid rows are reported
+    one by one and don't prevent the others from being saved.
+    """
+
+    upload_format = detect_format(request.headers.get("content-type"), format)
+    if upload_format not in ("ndjson", "csv"):
+        raise HTTPException(status_code=415, detail=f"Unsupported format: {upload_format}")
+
+    try:
+        body = await spool_upload(request.stream())
+    except CheckinUploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+
+    try:
+        # Up to MAX_CHECKIN_ROWS rows of parsing and validation: off the event loop.
+        # parse_upload closes the body: after a timeout the parser may still be reading it,
+        # and a task dropped before starting releases it when the file is garbage-collected
+        upload = await db_executor.run(parse_upload, body, upload_format)
+    except CheckinUploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except WorkerPoolFull as e:
+        # Never submitted: the body is still ours
+        body.close()
+        print(f"⚠️ Check-in upload rejected: {e}")
+        raise overloaded_error(e)
+    except WorkerTimeout as e:
+        print(f"⚠️ Check-in upload rejected: {e}")
+        raise overloaded_error(e)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid upload: {str(e)}")
+
+    print(f"--> {upload.received} check-ins received from client ({upload_format})")
+
+    try:
+        result = await db_executor.run(entry_repo.bulk_upsert_entries, upload.rows)
+    except (WorkerPoolFull, WorkerTimeout) as e:
+        print(f"⚠️ Check-in upload rejected: {e}")
+        raise overloaded_error(e)
+    except Exception as e:
+        print(f"❌ Error saving check-ins: {e}")
+        raise HTTPException(
+            status_code=500,
+            detail=f"Error saving check-ins: {str(e)}"
+        )
+
+    rejected = sorted(upload.rejected + result["rejected"], key=lambda reject: reject["row"])
+    saved = result["inserted"] + result["updated"]
+    return HabitEntryBulkResponse(
+        status="success" if not rejected else "partial",
+        message=f"{saved} check-ins saved, {len(rejected)} rejected",
+        received=upload.received,
+        inserted=result["inserted"],
+        updated=result["updated"],
+        rejected=rejected
+    )
+
+def database_error(action: str, e: Exception) -> HTTPException:
+    if isinstance(e, (WorkerPoolFull, WorkerTimeout)):
+        print(f"⚠️ {action} rejected: {e}")
+        return overloaded_error(e)
+    if isinstance(e, MissingReference):
+        return HTTPException(status_code=404, detail=str(e))
+    print(f"❌ Error {action.lower()}: {e}")
+    return HTTPException(status_code=500, detail=f"Error {action.lower()}: {str(e)}")
+
+@app.get("/habits/stats", response_model=List[HabitStats])
+async def get_habits_stats(habit_ids: str):
+    """
+    Returns the streak and completion statistics of several habits
+    (comma-separated IDs), read from the habit_stats summary table.
+    """
+    try:
+        ids = [int(habit_id) for habit_id in habit_ids.split(",") if habit_id.strip()]
+    except ValueError:
+        raise HTTPException(status_code=400, detail="habit_ids must be comma-separated integers")
+    if not ids or len(ids) > 500:
+        raise HTTPException(status_code=400, detail="Between 1 and 500 habit_ids are required")
+
+    try:
+        stats = await db_executor.run(habit_repo.get_habit_stats, ids)
+    except Exception as e:
+        raise database_error("Reading habit stats", e)
+    return [stats[habit_id] for habit_id in ids if habit_id in stats]
+
+@app.get("/habits/{habit_id}/stats", response_model=HabitStats)
+async def get_habit_stats(habit_id: int):
+    """
+    Returns the current streak, longest streak and rolling completion rate of a habit.
+    """
+    try:
+        stats = await db_executor.run(habit_repo.get_habit_stats, [habit_id])
+    except Exception as e:
+        raise database_error("Reading habit stats", e)
+    if habit_id not in stats:
+        raise HTTPException(status_code=404, detail=f"Habit {habit_id} not found")
+    return stats[habit_id]
+
+@app.post("/habits/stats/recompute", response_model=HabitStatsRecomputeResponse)
+async def recompute_habit_stats(request: HabitStatsRecomputeInput):
+    """
+    Rebuilds the statistics from habit_entries (backfills and repairs),
+    for the given habits or for all of them.
+    """
+    try:
+        # Can scan the whole habit_entries table: no worker pool timeout
+        recomputed = await asyncio.get_running_loop().run_in_executor(
+            None, habit_repo.recompute_habit_stats, request.habit_ids)
+    except Exception as e:
+        raise database_error("Recomputing habit stats", e)
+    return HabitStatsRecomputeResponse(status="success", recomputed=recomputed)
+
+@app.post("/groups", response_model=GroupResponse)
+async def create_group(request: GroupInput):
+    """Creates a social group; its creator becomes the first member."""
+    try:
+        group_id = await db_executor.run(group_repo.create_group, request.name, request.description, request.created_by)
+        return await db_executor.run(group_repo.get_group, group_id)
+    except Exception as e:
+        raise database_error("Creating group", e)
+
+@app.get("/groups/{group_id}", response_model=GroupResponse)
+async def get_group(group_id: int):
+    try:
+        group = await db_executor.run(group_repo.get_group, group_id)
+    except Exception as e:
+        raise database_error("Reading group", e)
+    if group is None:
+        raise HTTPException(status_code=404, detail=f"Group {group_id} not found")
+    return group
+
+@app.post("/groups/{group_id}/members")
+async def add_group_member(group_id: int, request: GroupMemberInput):
+    try:
+        added = await db_executor.run(group_repo.add_member, group_id, request.user_id)
+    except Exception as e:
+        raise database_error("Adding group member", e)
+    return {"group_id": group_id, "user_id": request.user_id, "added": added}
+
+@app.delete("/groups/{group_id}/members/{user_id}")
+async def remove_group_member(group_id: int, user_id: int):
+    try:
+        removed = await db_executor.run(group_repo.remove_member, group_id, user_id)
+    except Exception as e:
+        raise database_error("Removing group member", e)
+    if not removed:
+        raise HTTPException(status_code=404, detail=f"User {user_id} is not a member of group {group_id}")
+    return {"group_id": group_id, "user_id": user_id, "removed": True}
+
+@app.get("/groups/{group_id}/leaderboard", response_model=LeaderboardResponse)
+async def get_group_leaderboard(group_id: int, limit: int = 50, offset: int = 0):
+    """
+    Returns a page of the group leaderboard, read from the precomputed
+    group_leaderboard table through the in-memory leaderboard cache.
+    """
+    if not 1 <= limit <= 200 or offset < 0:
+        raise HTTPException(status_code=400, detail="limit must be between 1 and 200 and offset not negative")
+    try:
+        entries = await db_executor.run(group_repo.get_leaderboard, group_id, limit, offset)
+    except Exception as e:
+        raise database_error("Reading leaderboard", e)
+    return LeaderboardResponse(group_id=group_id, limit=limit, offset=offset, entries=entries)
+
+@app.post("/groups/{group_id}/leaderboard/refresh")
+async def refresh_group_leaderboard(group_id: int):
+    """Rebuilds the leaderboard of a group from the habit statistics (repairs)."""
+    try:
+        await db_executor.run(group_repo.refresh_leaderboards, [group_id])
+    except Exception as e:
+        raise database_error("Refreshing leaderboard", e)
+    return {"group_id": group_id, "status": "success"}
+
+def parse_fields(fields: Optional[str]) -> Optional[List[str]]:
+    return [field.strip() for field in fields.split(",") if field.strip()] if fields else None
+
+@app.get("/habits", response_model=HabitListResponse)
+async def list_habits(user_id: Optional[int] = None, limit: int = 50, cursor: Optional[str] = None,
+                      fields: Optional[str] = None, fresh: bool = False):
+    """
+    Returns a page of habits, newest first, optionally only for one user.
+    `fields` selects the columns (comma-separated); `cursor` is the
+    next_cursor of the previous page; `fresh` skips the habit cache.
+    """
+    if not 1 <= limit <= 500:
+        raise HTTPException(status_code=400, detail="limit must be between 1 and 500")
+    try:
+        items, next_cursor = await db_executor.run(
+            habit_repo.get_habits_page, user_id, limit, cursor, parse_fields(fields), not fresh)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise database_error("Listing habits", e)
+    return HabitListResponse(items=items, next_cursor=next_cursor)
+
+def _export_default(value):
+    # orjson serializes dates natively; NUMERIC columns come back as Decimal
+    if isinstance(value, decimal.Decimal):
+        return float(value)
+    raise TypeError(f"Cannot serialize {type(value).__name__}")
+
+def _export_chunks(rows, ndjson: bool, rows_per_chunk: int = 500):
+    """Serializes the rows with orjson into chunks of bytes: a JSON array or one object per line."""
+    buffer = [] if ndjson else [b"["]
+    first = True
+    for count, row in enumerate(rows, start=1):
+        line = orjson.dumps(row, default=_export_default, option=orjson.OPT_NON_STR_KEYS)
+        if ndjson:
+            buffer.append(line + b"\n")
+        else:
+            buffer.append(line if first else b"," + line)
+        first = False
+        if count % rows_per_chunk == 0:
+            yield b"".join(buffer)
+            buffer = []
+    if not ndjson:
+        buffer.append(b"]")
+    if buffer:
+        yield b"".join(buffer)
+
+@app.get("/habits/export")
+async def export_habits(user_id: Optional[int] = None, fields: Optional[str] = None, format: str = "json"):
+    """
+    Streams all habits (or those of one user) as a JSON array or NDJSON,
+    read through a server-side cursor so memory stays flat for any table size.
+    """
+    if format not in ("json", "ndjson"):
+        raise HTTPException(status_code=400, detail="format must be json or ndjson")
+    columns = parse_fields(fields)
+    try:
+        # Validate the columns before the response starts
+        habit_repo.select_columns(columns)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    # The generator blocks on the database: StreamingResponse iterates it in a worker thread
+    rows = habit_repo.iter_habits(user_id, columns)
+    return StreamingResponse(
+        _export_chunks(rows, ndjson=format == "ndjson"),
+        media_type="application/x-ndjson" if format == "ndjson" else "application/json",
+    )
+
+@app.get("/habits/{habit_id}")
+async def get_habit(habit_id: int, fresh: bool = False):
+    """Returns a single habit (from the habit cache unless `fresh` is set)."""
+    try:
+        habit = await db_executor.run(habit_repo.get_habit_by_id, habit_id, not fresh)
+    except Exception as e:
+        raise database_error("Reading habit", e)
+    if habit is None:
+        raise HTTPException(status_code=404, detail=f"Habit {habit_id} not found")
+    return habit
@@ -1,8 +1,262 @@
 import psycopg2
+import psycopg2.errors
+import psycopg2.extensions
+import psycopg2.extras
+import base64
+import csv
+import datetime
+import io
+import json
 import os
-from typing import Optional, List, Dict, Any
+import threading
+import time
+from collections import deque
+from typing import Optional, List, Dict, Any, Callable, Iterator, Tuple
 from contextlib import contextmanager
 
+from . import habit_stats, leaderboards
+from .habit_cache import HabitCache, create_habit_cache
+from .write_behind import WriteQueueFull
+
+class PoolTimeout(Exception):
+    """Nessuna connessione disponibile entro il timeout di checkout"""
+
+class MissingReference(psycopg2.IntegrityError):
+    """Il record referenziato (utente, gruppo) non esiste: violazione di una foreign key"""
+
+@contextmanager
+def references_checked():
+    """Converte le violazioni di foreign key in MissingReference"""
+    try:
+        yield
+    except psycopg2.errors.ForeignKeyViolation as e:
+        raise MissingReference(e.diag.message_detail or str(e)) from e
+
+class ConnectionPool:
+    """
+    Pool di connessioni thread-safe condiviso da tutto il processo.
+    
+    - mantiene almeno `min_size` connessioni aperte e mai più di `max_size`
+    - al checkout verifica che la connessione sia viva (SELECT 1 se è rimasta
+      inattiva più di `health_check_after` secondi)
+    - chiude le connessioni inattive da più di `max_idle` secondi oltre il minimo
+      e quelle più vecchie di `max_lifetime` secondi
+    """
+    
+    def __init__(self, connection_params: Dict[str, Any], min_size: int = 1, max_size: int = 10,
+                 checkout_timeout: float = 5.0, health_check_after: float = 30.0,
+                 max_idle: float = 300.0, max_lifetime: float = 3600.0):
+        self.connection_params = connection_params
+        self.min_size = min_size
+        self.max_size = max_size
+        self.checkout_timeout = checkout_timeout
+        self.health_check_after = health_check_after
+        self.max_idle = max_idle
+        self.max_lifetime = max_lifetime
+        
+        self._idle = deque()  # (conn, last_used)
+        self._created_at: Dict[int, float] = {}
+        self._size = 0
+        self._cond = threading.Condition()
+        self._stats = {
+            "checkouts": 0,
+            "connections_created": 0,
+            "connections_closed": 0,
+            "health_check_failures": 0,
+            "checkout_timeouts": 0,
+            "waits": 0,
+        }
+    
+    def _connect(self):
+        conn = psycopg2.connect(**self.connection_params)
+        self._created_at[id(conn)] = time.monotonic()
+        return conn
+    
+    def _close(self, conn):
+        self._created_at.pop(id(conn), None)
+        self._stats["connections_closed"] += 1
+        try:
+            conn.close()
+        except Exception:
+            pass
+    
+    def _is_healthy(self, conn, last_used: float) -> bool:
+        if conn.closed:
+            return False
+        if time.monotonic() - self._created_at.get(id(conn), 0) > self.max_lifetime:
+            return False
+        if time.monotonic() - last_used > self.health_check_after:
+            try:
+                with conn.cursor() as cursor:
+                    cursor.execute("SELECT 1")
+                conn.rollback()
+            except Exception:
+                return False
+        return True
+    
+    def _recycle_idle(self):
+        """Chiude le connessioni inattive in eccesso (da chiamare con il lock)"""
+        now = time.monotonic()
+        kept = deque()
+        while self._idle:
+            conn, last_used = self._idle.popleft()
+            if self._size > self.min_size and now - last_used > self.max_idle:
+                self._size -= 1
+                self._close(conn)
+            else:
+                kept.append((conn, last_used))
+        self._idle = kept
+    
+    def getconn(self):
+        """Preleva una connessione dal pool, aprendone una nuova se serve"""
+        deadline = time.monotonic() + self.checkout_timeout
+        while True:
+            conn = None
+            with self._cond:
+                self._recycle_idle()
+                while True:
+                    if self._idle:
+                        # LIFO: riusa la connessione usata più di recente
+                        conn, last_used = self._idle.pop()
+                        break
+                    if self._size < self.max_size:
+                        self._size += 1
+                        break
+                    
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._stats["checkout_timeouts"] += 1
+                        raise PoolTimeout(f"No database connection available after {self.checkout_timeout}s")
+                    self._stats["waits"] += 1
+                    self._cond.wait(remaining)
+            
+            if conn is None:
+                # La connessione nuova si apre fuori dal lock
+                try:
+                    conn = self._connect()
+                except Exception:
+                    with self._cond:
+                        self._size -= 1
+                        self._cond.notify()
+                    raise
+                with self._cond:
+                    self._stats["connections_created"] += 1
+                    self._stats["checkouts"] += 1
+                return conn
+            
+            # Health check fuori dal lock, per non bloccare gli altri checkout
+            if self._is_healthy(conn, last_used):
+                with self._cond:
+                    self._stats["checkouts"] += 1
+                return conn
+            
+            with self._cond:
+                self._stats["health_check_failures"] += 1
+                self._size -= 1
+                self._close(conn)
+                self._cond.notify()
+    
+    def putconn(self, conn, discard: bool = False):
+        """Restituisce una connessione al pool (o la chiude se non è riutilizzabile)"""
+        if not discard and not conn.closed:
+            try:
+                # Non lasciare transazioni aperte sulle connessioni in pool
+                if conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+            except Exception:
+                discard = True
+        
+        with self._cond:
+            if discard or conn.closed:
+                self._size -= 1
+                self._close(conn)
+            else:
+                self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+    
+    def fill(self):
+        """Apre le connessioni fino a min_size"""
+        conns = []
+        try:
+            # getconn conta già in _size le connessioni nuove
+            while self._size < self.min_size:
+                conns.append(self.getconn())
+        finally:
+            for conn in conns:
+                self.putconn(conn)
+    
+    def closeall(self):
+        with self._cond:
+            while self._idle:
+                conn, _ = self._idle.popleft()
+                self._size -= 1
+                self._close(conn)
+            self._cond.notify_all()
+    
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                "min_size": self.min_size,
+                "max_size": self.max_size,
+                "size": self._size,
+                "idle": len(self._idle),
+                "in_use": self._size - len(self._idle),
+                **self._stats,
+            }
+
+# Pool unico per processo, creato alla prima richiesta.
+# È legato al PID: dopo un fork il processo figlio ne crea uno suo.
+_pool: Optional[ConnectionPool] = None
+_pool_pid: Optional[int] = None
+_pool_lock = threading.Lock()
+
+def get_pool(connection_params: Dict[str, Any]) -> ConnectionPool:
+    global _pool, _pool_pid
+    if _pool is None or _pool_pid != os.getpid():
+        with _pool_lock:
+            if _pool is None or _pool_pid != os.getpid():
+                _pool = ConnectionPool(
+                    connection_params,
+                    min_size=int(os.getenv('DB_POOL_MIN_SIZE', '1')),
+                    max_size=int(os.getenv('DB_POOL_MAX_SIZE', '10')),
+                    checkout_timeout=float(os.getenv('DB_POOL_CHECKOUT_TIMEOUT_S', '5')),
+                    health_check_after=float(os.getenv('DB_POOL_HEALTH_CHECK_AFTER_S', '30')),
+                    max_idle=float(os.getenv('DB_POOL_MAX_IDLE_S', '300')),
+                    max_lifetime=float(os.getenv('DB_POOL_MAX_LIFETIME_S', '3600')),
+                )
+                _pool_pid = os.getpid()
+    return _pool
+
+def close_pool():
+    """Chiude tutte le connessioni inattive del pool (es. allo shutdown)"""
+    if _pool is not None and _pool_pid == os.getpid():
+        _pool.closeall()
+
+# Osservatori delle query: fn(operation, secondi, errore). Usati per le metriche dell'API.
+_query_observers: List[Callable[[str, float, bool], None]] = []
+
+def add_query_observer(observer: Callable[[str, float, bool], None]):
+    if observer not in _query_observers:
+        _query_observers.append(observer)
+
+@contextmanager
+def observed(operation: str):
+    """Misura la durata del blocco per gli osservatori (nessun costo se non ce ne sono)"""
+    if not _query_observers:
+        yield
+        return
+    start = time.perf_counter()
+    failed = False
+    try:
+        yield
+    except Exception:
+        failed = True
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        for observer in _query_observers:
+            observer(operation, elapsed, failed)
+
 class DatabaseConnection:
     def __init__(self):
         self.connection_params = {
@@ -13,24 +267,36 @@ class DatabaseConnection:
             'database': os.getenv('DB_NAME', 'habitforge_db')
         }
     
+    @property
+    def pool(self) -> ConnectionPool:
+        return get_pool(self.connection_params)
+    
     @contextmanager
     def get_connection(self):
-        """Context manager per connessioni al database"""
-        conn = None
+        """Context manager per connessioni al database (prese dal pool)"""
+        with observed("checkout"):
+            conn = self.pool.getconn()
+        broken = False
         try:
-            conn = psycopg2.connect(**self.connection_params)
             yield conn
         except Exception as e:
-            if conn:
+            try:
                 conn.rollback()
+            except Exception:
+                broken = True
+            if isinstance(e, (psycopg2.OperationalError, psycopg2.InterfaceError)):
+                broken = True
             raise e
         finally:
-            if conn:
-                conn.close()
+            self.pool.putconn(conn, discard=broken)
+    
+    def pool_stats(self) -> Dict[str, Any]:
+        """Statistiche del pool di connessioni"""
+        return self.pool.stats()
     
     def execute_query(self, query: str, params: tuple = ()) -> List[Dict[str, Any]]:
         """Esegue una query e restituisce i risultati"""
-        with self.get_connection() as conn:
+        with observed("query"), self.get_connection() as conn:
             with conn.cursor() as cursor:
                 cursor.execute(query, params)
                 if cursor.description:
@@ -41,7 +307,7 @@ class DatabaseConnection:
     
     def execute_insert(self, query: str, params: tuple = ()) -> Optional[int]:
         """Esegue un INSERT e restituisce l'ID del record inserito"""
-        with self.get_connection() as conn:
+        with observed("insert"), self.get_connection() as conn:
             with conn.cursor() as cursor:
                 cursor.execute(query, params)
                 conn.commit()
@@ -49,9 +315,24 @@ class DatabaseConnection:
                     return cursor.fetchone()[0]
                 return cursor.rowcount
     
+    def execute_values(self, query: str, rows: List[tuple], fetch: bool = False,
+                       synchronous_commit: bool = True) -> List[Any]:
+        """
+        Esegue un INSERT multi-riga (un solo VALUES %s, un solo commit).
+        Con fetch=True restituisce la prima colonna di RETURNING per ogni riga.
+        """
+        with observed("insert_many"), self.get_connection() as conn:
+            with conn.cursor() as cursor:
+                if not synchronous_commit:
+                    cursor.execute("SET LOCAL synchronous_commit TO OFF")
+                results = psycopg2.extras.execute_values(
+                    cursor, query, rows, page_size=max(len(rows), 1), fetch=fetch)
+                conn.commit()
+                return [row[0] for row in results] if fetch else []
+    
     def execute_update(self, query: str, params: tuple = ()) -> int:
         """Esegue un UPDATE e restituisce il numero di righe modificate"""
-        with self.get_connection() as conn:
+        with observed("update"), self.get_connection() as conn:
             with conn.cursor() as cursor:
                 cursor.execute(query, params)
                 conn.commit()
@@ -68,34 +349,203 @@ class DatabaseConnection:
             print(f"Database connection failed: {e}")
             return False
 
+# Colonne di habits scritte dall'API, nell'ordine usato dagli INSERT
+HABIT_COLUMNS = (
+    "user_id", "name", "description", "action", "quantity", "target",
+    "frequency_count", "frequency_period", "language", "ml_confidence",
+)
+
+# Colonne riscritte dalla ri-analisi offline (backfill.py): name e description restano dell'utente
+BACKFILL_COLUMNS = (
+    "action", "quantity", "target", "frequency_count", "frequency_period", "language", "ml_confidence",
+)
+BACKFILL_COLUMN_TYPES = {
+    "action": "varchar", "quantity": "varchar", "target": "varchar", "frequency_count": "integer",
+    "frequency_period": "integer", "language": "varchar", "ml_confidence": "numeric",
+}
+
+# Colonne leggibili dagli endpoint di elenco/esportazione
+HABIT_SELECTABLE_COLUMNS = ("id", "created_at", "updated_at") + HABIT_COLUMNS
+
+DEFAULT_PAGE_SIZE = 50
+
+def encode_cursor(created_at: datetime.datetime, habit_id: int) -> str:
+    """Cursore opaco per get_habits_page: (created_at, id) dell'ultima riga restituita"""
+    payload = json.dumps([created_at.isoformat(), habit_id]).encode()
+    return base64.urlsafe_b64encode(payload).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> Tuple[datetime.datetime, int]:
+    try:
+        payload = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        created_at, habit_id = json.loads(payload)
+        return datetime.datetime.fromisoformat(created_at), int(habit_id)
+    except (ValueError, TypeError) as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+def _habit_values(row: Dict[str, Any]) -> tuple:
+    return tuple(row.get(column) for column in HABIT_COLUMNS)
+
 # Classe per operazioni specifiche sulle abitudini
 class HabitRepository:
-    def __init__(self):
+    """
+    Le letture (get_habit_by_id, get_habits_page) passano da una cache
+    read-through (vedi habit_cache) invalidata da ogni scrittura di questa
+    classe; use_cache=False legge sempre da Postgres.
+    """
+    
+    def __init__(self, cache: Optional[HabitCache] = None):
         self.db = DatabaseConnection()
+        self.cache = cache or create_habit_cache()
     
-    def create_habit(self, name: str, description: str, frequency: str, user_id: Optional[int] = None) -> int:
-        """Crea una nuova abitudine"""
-        query = """
-        INSERT INTO habits (name, description, frequency, user_id)
-        VALUES (%s, %s, %s, %s)
+    def create_habit(self, name: str, description: str, user_id: Optional[int] = None, **fields) -> int:
+        """Crea una nuova abitudine (campi opzionali: quelli di HABIT_COLUMNS)"""
+        row = {"name": name, "description": description, "user_id": user_id, **fields}
+        query = f"""
+        INSERT INTO habits ({', '.join(HABIT_COLUMNS)})
+        VALUES ({', '.join(['%s'] * len(HABIT_COLUMNS))})
         RETURNING id
         """
-        return self.db.execute_insert(query, (name, description, frequency, user_id))
+        with observed("insert"), references_checked(), self.db.get_connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(query, _habit_values(row))
+                habit_id = cursor.fetchone()[0]
+                # Il numero di abitudini nelle classifiche dei gruppi del proprietario
+                groups = leaderboards.refresh_users(cursor, [user_id])
+                conn.commit()
+        self.cache.invalidate(user_ids=[user_id])
+        leaderboards.leaderboard_cache.invalidate(groups)
+        return habit_id
     
-    def get_habits(self, user_id: Optional[int] = None) -> List[Dict[str, Any]]:
-        """Recupera tutte le abitudini dell'utente"""
-        if user_id:
-            query = "SELECT * FROM habits WHERE user_id = %s ORDER BY created_at DESC"
-            return self.db.execute_query(query, (user_id,))
-        else:
-            query = "SELECT * FROM habits ORDER BY created_at DESC"
-            return self.db.execute_query(query)
+    def create_habits(self, rows: List[Dict[str, Any]], returning: bool = True,
+                      synchronous_commit: bool = True) -> List[int]:
+        """
+        Crea più abitudini con un unico INSERT multi-riga e un solo commit.
+        Con synchronous_commit=False il commit non attende il flush del WAL:
+        un crash del server può perdere le ultime transazioni, mai corromperle.
+        """
+        if not rows:
+            return []
+        query = f"INSERT INTO habits ({', '.join(HABIT_COLUMNS)}) VALUES %s"
+        if returning:
+            query += " RETURNING id"
+        user_ids = {row.get("user_id") for row in rows}
+        with observed("insert_many"), references_checked(), self.db.get_connection() as conn:
+            with conn.cursor() as cursor:
+                if not synchronous_commit:
+                    cursor.execute("SET LOCAL synchronous_commit TO OFF")
+                results = psycopg2.extras.execute_values(
+                    cursor, query, [_habit_values(row) for row in rows],
+                    page_size=len(rows), fetch=returning)
+                # Un solo ricalcolo delle classifiche per tutto il batch
+                groups = leaderboards.refresh_users(cursor, user_ids)
+                conn.commit()
+        self.cache.invalidate(user_ids=user_ids)
+        leaderboards.leaderboard_cache.invalidate(groups)
+        return [row[0] for row in results] if returning else []
+    
+    def user_exists(self, user_id: int) -> bool:
+        """True se l'utente proprietario delle abitudini esiste"""
+        return bool(self.db.execute_query("SELECT 1 FROM users WHERE id = %s", (user_id,)))
     
-    def get_habit_by_id(self, habit_id: int) -> Optional[Dict[str, Any]]:
+    def select_columns(self, columns: Optional[List[str]]) -> List[str]:
+        """Colonne richieste, validate con HABIT_SELECTABLE_COLUMNS (id e created_at servono al cursore)"""
+        if not columns:
+            return list(HABIT_SELECTABLE_COLUMNS)
+        unknown = [column for column in columns if column not in HABIT_SELECTABLE_COLUMNS]
+        if unknown:
+            raise ValueError(f"Unknown habit columns: {', '.join(unknown)}")
+        return list(dict.fromkeys(["id", "created_at", *columns]))
+    
+    def get_habits_page(self, user_id: Optional[int] = None, limit: int = DEFAULT_PAGE_SIZE,
+                        cursor: Optional[str] = None, columns: Optional[List[str]] = None,
+                        use_cache: bool = True) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """
+        Una pagina di abitudini, dalle più recenti, con paginazione keyset su
+        (created_at, id): la pagina successiva parte dopo l'ultima riga letta
+        invece di usare OFFSET, quindi costa uguale a qualunque profondità.
+        Restituisce (righe, cursore della pagina successiva o None).
+        """
+        select = self.select_columns(columns)
+        key = None
+        if use_cache and self.cache.enabled:
+            key = self.cache.list_key(user_id, (limit, cursor, tuple(select)))
+            found, page = self.cache.get(key)
+            if found:
+                return [dict(row) for row in page[0]], page[1]
+        elif not use_cache:
+            self.cache.record_bypass()
+        version = self.cache.version()
+        
+        conditions, params = [], []
+        if user_id is not None:
+            conditions.append("user_id = %s")
+            params.append(user_id)
+        if cursor:
+            created_at, last_id = decode_cursor(cursor)
+            conditions.append("(created_at, id) < (%s, %s)")
+            params.extend([created_at, last_id])
+        
+        query = f"SELECT {', '.join(select)} FROM habits"
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        # Una riga in più per sapere se esiste una pagina successiva
+        query += " ORDER BY created_at DESC, id DESC LIMIT %s"
+        params.append(limit + 1)
+        
+        rows = self.db.execute_query(query, tuple(params))
+        next_cursor = encode_cursor(rows[limit - 1]["created_at"], rows[limit - 1]["id"]) if len(rows) > limit else None
+        rows = rows[:limit]
+        if key is not None:
+            self.cache.set(key, ([dict(row) for row in rows], next_cursor), version)
+        return rows, next_cursor
+    
+    def get_habits(self, user_id: Optional[int] = None, limit: int = DEFAULT_PAGE_SIZE,
+                   cursor: Optional[str] = None, columns: Optional[List[str]] = None,
+                   use_cache: bool = True) -> List[Dict[str, Any]]:
+        """Recupera le abitudini dell'utente (una pagina, vedi get_habits_page)"""
+        return self.get_habits_page(user_id, limit, cursor, columns, use_cache)[0]
+    
+    def iter_habits(self, user_id: Optional[int] = None, columns: Optional[List[str]] = None,
+                    batch_size: int = 1000) -> Iterator[Dict[str, Any]]:
+        """
+        Tutte le abitudini (dell'utente o della tabella) lette con un cursore
+        lato server a blocchi di `batch_size`: la memoria resta costante
+        qualunque sia la dimensione della tabella. Tiene una connessione del
+        pool finché il generatore non è esaurito o chiuso.
+        """
+        select = self.select_columns(columns)
+        query = f"SELECT {', '.join(select)} FROM habits"
+        params: tuple = ()
+        if user_id is not None:
+            query += " WHERE user_id = %s"
+            params = (user_id,)
+        query += " ORDER BY created_at DESC, id DESC"
+        
+        with observed("stream"), self.db.get_connection() as conn:
+            with conn.cursor(name=f"habits_export_{id(conn)}") as cursor:
+                cursor.itersize = batch_size
+                cursor.execute(query, params)
+                for row in cursor:
+                    yield dict(zip(select, row))
+    
+    def get_habit_by_id(self, habit_id: int, use_cache: bool = True) -> Optional[Dict[str, Any]]:
         """Recupera una singola abitudine per ID"""
+        key = self.cache.habit_key(habit_id)
+        caching = use_cache and self.cache.enabled
+        if caching:
+            found, habit = self.cache.get(key)
+            if found:
+                return dict(habit)
+        elif not use_cache:
+            self.cache.record_bypass()
+        version = self.cache.version(habit_id) if caching else None
+        
         query = "SELECT * FROM habits WHERE id = %s"
         results = self.db.execute_query(query, (habit_id,))
-        return results[0] if results else None
+        habit = results[0] if results else None
+        if habit is not None and caching:
+            self.cache.set(key, dict(habit), version)
+        return habit
     
     def update_habit(self, habit_id: int, **kwargs) -> int:
         """Aggiorna una abitudine"""
@@ -103,26 +553,405 @@ class HabitRepository:
         params = []
         
         for key, value in kwargs.items():
-            if key in ['name', 'description', 'frequency']:
+            # Il proprietario non si cambia da qui
+            if key in HABIT_COLUMNS and key != 'user_id':
                 set_clauses.append(f"{key} = %s")
                 params.append(value)
         
         if not set_clauses:
             return 0
         
-        query = f"UPDATE habits SET {', '.join(set_clauses)}, updated_at = CURRENT_TIMESTAMP WHERE id = %s"
+        query = f"UPDATE habits SET {', '.join(set_clauses)}, updated_at = CURRENT_TIMESTAMP WHERE id = %s RETURNING user_id"
         params.append(habit_id)
         
-        return self.db.execute_update(query, tuple(params))
+        with observed("update"), self.db.get_connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(query, tuple(params))
+                owners = [row[0] for row in cursor.fetchall()]
+                conn.commit()
+        updated = len(owners)
+        if updated:
+            self.cache.invalidate(habit_ids=[habit_id], user_ids=owners)
+        if updated and ({'frequency_count', 'frequency_period'} & kwargs.keys()):
+            # Cambia l'obiettivo: le streak vanno ricalcolate
+            self.recompute_habit_stats([habit_id])
+        return updated
     
     def delete_habit(self, habit_id: int) -> int:
-        """Elimina una abitudine"""
-        query = "DELETE FROM habits WHERE id = %s"
-        return self.db.execute_update(query, (habit_id,))
+        """Elimina una abitudine (e la toglie dalle classifiche del proprietario)"""
+        with self.db.get_connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute("DELETE FROM habits WHERE id = %s RETURNING user_id", (habit_id,))
+                deleted = cursor.fetchall()
+                groups = leaderboards.refresh_users(cursor, [row[0] for row in deleted])
+                conn.commit()
+        self.cache.invalidate(habit_ids=[habit_id], user_ids=[row[0] for row in deleted])
+        leaderboards.leaderboard_cache.invalidate(groups)
+        return len(deleted)
+    
+    def get_habit_stats(self, habit_ids: List[int]) -> Dict[int, Dict[str, Any]]:
+        """
+        Streak e tasso di completamento dalla tabella habit_stats.
+        Le abitudini senza riga (mai ricalcolate) vengono calcolate al volo;
+        quelle inesistenti non compaiono nel risultato.
+        """
+        today = datetime.date.today()
+        stats = self._read_habit_stats(habit_ids, today)
+        
+        missing = [habit_id for habit_id in habit_ids if habit_id not in stats]
+        if missing:
+            self.recompute_habit_stats(missing)
+            stats.update(self._read_habit_stats(missing, today))
+        return stats
+    
+    def _read_habit_stats(self, habit_ids: List[int], today: datetime.date) -> Dict[int, Dict[str, Any]]:
+        with observed("query"), self.db.get_connection() as conn:
+            with conn.cursor() as cursor:
+                return habit_stats.read_stats(cursor, habit_ids, today)
+    
+    def recompute_habit_stats(self, habit_ids: Optional[List[int]] = None) -> int:
+        """
+        Ricalcola da zero le statistiche (tutte le abitudini se habit_ids è None),
+        con il percorso vettoriale NumPy. Per backfill e riparazioni.
+        """
+        with observed("recompute_stats"), self.db.get_connection() as conn:
+            with conn.cursor() as cursor:
+                count = habit_stats.recompute(cursor, habit_ids, datetime.date.today())
+                if habit_ids is None:
+                    groups = leaderboards.refresh_groups(cursor)
+                else:
+                    groups = leaderboards.refresh_habits(cursor, habit_ids)
+                conn.commit()
+        leaderboards.leaderboard_cache.invalidate(None if habit_ids is None else groups)
+        return count
+
+    # --- ri-analisi offline (backfill.py) ---
+    
+    def _backfill_condition(self, after_id: int, only_missing: bool) -> Tuple[str, tuple]:
+        condition = "id > %s AND description IS NOT NULL AND description <> ''"
+        if only_missing:
+            condition += " AND (action IS NULL OR frequency_count IS NULL)"
+        return condition, (after_id,)
+    
+    def count_habit_texts(self, after_id: int = 0, only_missing: bool = False) -> int:
+        """Numero di abitudini da ri-analizzare dopo `after_id`"""
+        condition, params = self._backfill_condition(after_id, only_missing)
+        return self.db.execute_query(f"SELECT count(*) AS n FROM habits WHERE {condition}", params)[0]["n"]
+    
+    def iter_habit_texts(self, after_id: int = 0, only_missing: bool = False,
+                         batch_size: int = 5000) -> Iterator[Tuple[int, str]]:
+        """
+        (id, description) delle abitudini con id > after_id, in ordine di id,
+        lette con un cursore lato server: l'ultimo id elaborato basta come
+        checkpoint per riprendere.
+        """
+        condition, params = self._backfill_condition(after_id, only_missing)
+        query = f"SELECT id, description FROM habits WHERE {condition} ORDER BY id"
+        with observed("stream"), self.db.get_connection() as conn:
+            with conn.cursor(name=f"habits_backfill_{id(conn)}") as cursor:
+                cursor.itersize = batch_size
+                cursor.execute(query, params)
+                for row in cursor:
+                    yield row[0], row[1]
+    
+    def update_analyses(self, rows: List[tuple]) -> Dict[str, int]:
+        """
+        Scrive i campi estratti di molte abitudini con un solo UPDATE ... FROM (VALUES ...).
+        `rows` sono tuple (id, *BACKFILL_COLUMNS). Le righe già uguali non vengono
+        riscritte; quelle con la frequenza cambiata hanno le statistiche ricalcolate.
+        """
+        if not rows:
+            return {"updated": 0, "unchanged": 0}
+        columns = ", ".join(BACKFILL_COLUMNS)
+        values = ", ".join(f"v.{column}" for column in BACKFILL_COLUMNS)
+        # `old` è la stessa tabella letta prima dell'UPDATE: serve a sapere se la frequenza è cambiata
+        query = f"""
+        UPDATE habits h
+        SET {', '.join(f"{column} = v.{column}" for column in BACKFILL_COLUMNS)},
+            updated_at = CURRENT_TIMESTAMP
+        FROM (VALUES %s) AS v(id, {columns}), habits old
+        WHERE h.id = v.id AND old.id = v.id
+          AND ({', '.join(f"old.{column}" for column in BACKFILL_COLUMNS)}) IS DISTINCT FROM ({values})
+        RETURNING h.id, h.user_id,
+                  (old.frequency_count, old.frequency_period) IS DISTINCT FROM (v.frequency_count, v.frequency_period)
+        """
+        template = "(%s::integer, " + ", ".join(f"%s::{BACKFILL_COLUMN_TYPES[column]}" for column in BACKFILL_COLUMNS) + ")"
+        with observed("update_many"), self.db.get_connection() as conn:
+            with conn.cursor() as cursor:
+                updated = psycopg2.extras.execute_values(
+                    cursor, query, rows, template=template, page_size=len(rows), fetch=True)
+                conn.commit()
+        if updated:
+            self.cache.invalidate(habit_ids=[row[0] for row in updated], user_ids={row[1] for row in updated})
+        frequency_changed = [row[0] for row in updated if row[2]]
+        if frequency_changed:
+            self.recompute_habit_stats(frequency_changed)
+        return {"updated": len(updated), "unchanged": len(rows) - len(updated)}
+
+# Check-in giornalieri (habit_entries)
+class HabitEntryRepository:
+    def __init__(self):
+        self.db = DatabaseConnection()
+    
+    def bulk_upsert_entries(self, rows: List[tuple]) -> Dict[str, Any]:
+        """
+        Carica molte entry in un'unica transazione: COPY in una tabella di
+        staging temporanea, poi un solo INSERT ... ON CONFLICT (habit_id, entry_date).
+        `rows` sono tuple (row_no, habit_id, entry_date, status, notes).
+        Aggiorna anche habit_stats e le classifiche dei gruppi dei proprietari.
+        Restituisce i conteggi di inserite/aggiornate e gli scarti per riga:
+        abitudine inesistente o data ripetuta nello stesso caricamento
+        (vince l'ultima riga).
+        """
+        result = {"inserted": 0, "updated": 0, "rejected": []}
+        if not rows:
+            return result
+        
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for row_no, habit_id, entry_date, status, notes in rows:
+            # Nel formato CSV di COPY un campo vuoto non quotato è NULL
+            writer.writerow((row_no, habit_id, entry_date.isoformat(), status, notes))
+        buffer.seek(0)
+        
+        with observed("copy"), self.db.get_connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute("""
+                CREATE TEMP TABLE habit_entries_staging (
+                    row_no INTEGER NOT NULL,
+                    habit_id INTEGER NOT NULL,
+                    entry_date DATE NOT NULL,
+                    status VARCHAR(20) NOT NULL,
+                    notes TEXT
+                ) ON COMMIT DROP
+                """)
+                cursor.copy_expert(
+                    "COPY habit_entries_staging (row_no, habit_id, entry_date, status, notes) FROM STDIN WITH (FORMAT csv)",
+                    buffer,
+                )
+                
+                # Scarti: abitudini inesistenti e duplicati superati da una riga successiva
+                cursor.execute("""
+                SELECT s.row_no, 'habit not found' AS error
+                FROM habit_entries_staging s
+                WHERE NOT EXISTS (SELECT 1 FROM habits h WHERE h.id = s.habit_id)
+                UNION ALL
+                SELECT s.row_no, 'duplicate habit_id/entry_date, superseded by row ' || s.last_row_no
+                FROM (
+                    SELECT row_no, max(row_no) OVER (PARTITION BY habit_id, entry_date) AS last_row_no
+                    FROM habit_entries_staging
+                    WHERE habit_id IN (SELECT id FROM habits)
+                ) s
+                WHERE s.row_no < s.last_row_no
+                """)
+                result["rejected"] = [{"row": row_no, "error": error} for row_no, error in cursor.fetchall()]
+                
+                # xmax = 0 solo per le righe appena inserite (non per quelle aggiornate)
+                cursor.execute("""
+                INSERT INTO habit_entries (habit_id, entry_date, status, notes)
+                SELECT DISTINCT ON (s.habit_id, s.entry_date) s.habit_id, s.entry_date, s.status, s.notes
+                FROM habit_entries_staging s
+                JOIN habits h ON h.id = s.habit_id
+                ORDER BY s.habit_id, s.entry_date, s.row_no DESC
+                ON CONFLICT (habit_id, entry_date) DO UPDATE
+                SET status = EXCLUDED.status, notes = EXCLUDED.notes
+                RETURNING habit_id, entry_date, status, (xmax = 0) AS inserted
+                """)
+                upserted = cursor.fetchall()
+                
+                # Statistiche aggiornate nella stessa transazione delle entry
+                habit_stats.apply_entries(cursor, upserted, datetime.date.today())
+                groups = leaderboards.refresh_habits(cursor, {row[0] for row in upserted}) if upserted else []
+                conn.commit()
+        leaderboards.leaderboard_cache.invalidate(groups)
+        
+        result["inserted"] = sum(1 for row in upserted if row[3])
+        result["updated"] = len(upserted) - result["inserted"]
+        result["rejected"].sort(key=lambda reject: reject["row"])
+        return result
+    
+# Gruppi sociali, membri e classifiche
+class GroupRepository:
+    def __init__(self, cache: Optional[leaderboards.LeaderboardCache] = None):
+        self.db = DatabaseConnection()
+        self.cache = cache or leaderboards.leaderboard_cache
+    
+    def create_group(self, name: str, description: Optional[str] = None, created_by: Optional[int] = None) -> int:
+        """Crea un gruppo; il creatore ne diventa il primo membro"""
+        with observed("insert"), references_checked(), self.db.get_connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(
+                    "INSERT INTO social_groups (name, description, created_by) VALUES (%s, %s, %s) RETURNING id",
+                    (name, description, created_by),
+                )
+                group_id = cursor.fetchone()[0]
+                if created_by is not None:
+                    cursor.execute(
+                        "INSERT INTO group_members (group_id, user_id) VALUES (%s, %s)", (group_id, created_by))
+                    leaderboards.refresh_groups(cursor, [group_id])
+                conn.commit()
+                return group_id
+    
+    def get_group(self, group_id: int) -> Optional[Dict[str, Any]]:
+        """Recupera un gruppo con il numero di membri"""
+        query = """
+        SELECT g.*, (SELECT count(*) FROM group_members gm WHERE gm.group_id = g.id) AS member_count
+        FROM social_groups g WHERE g.id = %s
+        """
+        results = self.db.execute_query(query, (group_id,))
+        return results[0] if results else None
+    
+    def add_member(self, group_id: int, user_id: int) -> bool:
+        """
+        Aggiunge un membro (False se lo era già) e la sua riga di classifica.
+        Gruppo o utente inesistenti: MissingReference.
+        """
+        with observed("insert"), references_checked(), self.db.get_connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(
+                    "INSERT INTO group_members (group_id, user_id) VALUES (%s, %s) ON CONFLICT DO NOTHING",
+                    (group_id, user_id),
+                )
+                added = cursor.rowcount > 0
+                if added:
+                    leaderboards.refresh_member(cursor, group_id, user_id)
+                conn.commit()
+        if added:
+            self.cache.invalidate([group_id])
+        return added
+    
+    def remove_member(self, group_id: int, user_id: int) -> bool:
+        with observed("update"), self.db.get_connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute("DELETE FROM group_members WHERE group_id = %s AND user_id = %s", (group_id, user_id))
+                removed = cursor.rowcount > 0
+                cursor.execute("DELETE FROM group_leaderboard WHERE group_id = %s AND user_id = %s", (group_id, user_id))
+                conn.commit()
+        if removed:
+            self.cache.invalidate([group_id])
+        return removed
+    
+    def get_leaderboard(self, group_id: int, limit: int = 50, offset: int = 0, use_cache: bool = True) -> List[Dict[str, Any]]:
+        """
+        Classifica del gruppo dalla tabella precalcolata (nessun join con le entry).
+        Ordine: punteggio, poi streak corrente migliore; il rank è 1-based.
+        """
+        if use_cache:
+            cached = self.cache.get(group_id, limit, offset)
+            if cached is not None:
+                return cached
+        generation = self.cache.generation(group_id)
+        query = """
+        SELECT gl.user_id, u.username, gl.habits, gl.score, gl.total_completed,
+               gl.best_current_streak, gl.longest_streak, gl.completion_rate, gl.updated_at
+        FROM group_leaderboard gl JOIN users u ON u.id = gl.user_id
+        WHERE gl.group_id = %s
+        ORDER BY gl.score DESC, gl.best_current_streak DESC, gl.user_id
+        LIMIT %s OFFSET %s
+        """
+        rows = self.db.execute_query(query, (group_id, limit, offset))
+        for rank, row in enumerate(rows, start=offset + 1):
+            row["rank"] = rank
+            row["completion_rate"] = float(row["completion_rate"])
+        self.cache.set(group_id, limit, offset, rows, generation)
+        return rows
+    
+    def refresh_stale_leaderboards(self) -> int:
+        """Ricalcola i gruppi non ancora aggiornati oggi (finestra e streak cambiano col giorno)"""
+        with observed("update"), self.db.get_connection() as conn:
+            with conn.cursor() as cursor:
+                groups = leaderboards.refresh_stale(cursor, datetime.date.today())
+                conn.commit()
+        self.cache.invalidate(groups)
+        return len(groups)
+    
+    def refresh_leaderboards(self, group_ids: Optional[List[int]] = None) -> int:
+        """Ricostruisce le classifiche (tutte se group_ids è None) da habit_stats"""
+        with observed("update"), self.db.get_connection() as conn:
+            with conn.cursor() as cursor:
+                groups = leaderboards.refresh_groups(cursor, group_ids)
+                conn.commit()
+        self.cache.invalidate(group_ids)
+        return len(groups)
+
+def _json_default(value):
+    # Gli score dei pipeline transformer sono float numpy
+    if hasattr(value, "item"):
+        return value.item()
+    return str(value)
+
+# Backend persistente per la cache delle analisi NLP
+class AnalysisCacheRepository:
+    """
+    Backend persistente di NLM.analysis_cache. Con `writer` (una
+    WriteBehindQueue su set_many) set() accoda la voce invece di scriverla:
+    il thread di inferenza non attende il database.
+    """
+    
+    def __init__(self, ttl: Optional[float] = None, writer=None):
+        self.db = DatabaseConnection()
+        self.ttl = ttl
+        self.writer = writer
+    
+    def get(self, cache_key: str, language: str) -> Optional[Dict[str, Any]]:
+        """Recupera un'analisi salvata, se non è scaduta"""
+        if self.ttl:
+            query = """
+            SELECT analysis FROM analysis_cache
+            WHERE cache_key = %s AND language = %s
+              AND created_at > CURRENT_TIMESTAMP - make_interval(secs => %s)
+            """
+            results = self.db.execute_query(query, (cache_key, language, self.ttl))
+        else:
+            query = "SELECT analysis FROM analysis_cache WHERE cache_key = %s AND language = %s"
+            results = self.db.execute_query(query, (cache_key, language))
+        return results[0]["analysis"] if results else None
+    
+    def set(self, cache_key: str, language: str, analysis: Dict[str, Any]) -> int:
+        """Salva (o aggiorna) un'analisi; con il writer la accoda e restituisce 0"""
+        row = {"cache_key": cache_key, "language": language, "analysis": analysis}
+        if self.writer is None:
+            return self.set_many([row])
+        try:
+            self.writer.submit(row)
+        except WriteQueueFull:
+            # È solo una cache: con la coda piena la voce si perde (conteggiata in "rejected")
+            pass
+        return 0
+    
+    def set_many(self, rows: List[Dict[str, Any]]) -> int:
+        """Salva (o aggiorna) più analisi con un unico INSERT multi-riga"""
+        # ON CONFLICT non accetta due volte la stessa chiave nello stesso INSERT: vince l'ultima
+        latest = {row["cache_key"]: row for row in rows}
+        if not latest:
+            return 0
+        query = """
+        INSERT INTO analysis_cache (cache_key, language, analysis)
+        VALUES %s
+        ON CONFLICT (cache_key) DO UPDATE
+        SET language = EXCLUDED.language, analysis = EXCLUDED.analysis, created_at = CURRENT_TIMESTAMP
+        """
+        dumps = lambda obj: json.dumps(obj, default=_json_default)
+        values = [
+            (row["cache_key"], row["language"], psycopg2.extras.Json(row["analysis"], dumps=dumps))
+            for row in latest.values()
+        ]
+        # Una voce persa in un crash si ricalcola: il commit non attende il WAL
+        self.db.execute_values(query, values, synchronous_commit=False)
+        return len(values)
+    
+    def purge_expired(self) -> int:
+        """Elimina le voci scadute"""
+        if not self.ttl:
+            return 0
+        query = "DELETE FROM analysis_cache WHERE created_at <= CURRENT_TIMESTAMP - make_interval(secs => %s)"
+        return self.db.execute_update(query, (self.ttl,))
 
 # Istanza globale per uso semplificato
 db = DatabaseConnection()
 habit_repo = HabitRepository()
+entry_repo = HabitEntryRepository()
+group_repo = GroupRepository()
 
 if __name__ == "__main__":
     # Test della connessione
@@ -0,0 +1,356 @@
+"""
+Cache read-through delle letture di HabitRepository.
+
+Due livelli:
+- una LRU in memoria per processo (sempre presente)
+- un backend condiviso opzionale tra i worker (Redis, o LocalCacheBackend
+  che ne fa le veci in sviluppo e nei test), con la stessa piccola interfaccia
+  get/set/delete/incr
+
+Le pagine di elenco sono indicizzate con un numero di generazione per
+ambito (un utente, o "all" per l'elenco completo): una scrittura incrementa
+la generazione dell'ambito e tutte le pagine vecchie smettono di essere lette.
+Ogni abitudine ha invece una versione (habits:ver:id:<id>) incrementata a
+ogni invalidazione: una lettura dal database iniziata prima di una scrittura
+in un altro processo non può salvare la riga vecchia, perché il backend la
+accetta solo se la versione è ancora quella letta prima della query (set_if,
+atomico). Con un backend condiviso generazioni e versioni vivono nel backend,
+quindi valgono per tutti i processi; le abitudini nella LRU locale possono
+restare vecchie al più `local_ttl` secondi negli altri processi.
+
+Nel backend condiviso i valori sono JSON (date, datetime e Decimal delle
+righe psycopg2 sono codificati con un tag), mai pickle.
+"""
+
+import datetime
+import decimal
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, NamedTuple, Optional, Tuple
+
+def _encode(value: Any) -> Any:
+    if isinstance(value, datetime.datetime):
+        return {"__type__": "datetime", "value": value.isoformat()}
+    if isinstance(value, datetime.date):
+        return {"__type__": "date", "value": value.isoformat()}
+    if isinstance(value, decimal.Decimal):
+        return {"__type__": "decimal", "value": str(value)}
+    raise TypeError(f"Cannot cache value of type {type(value).__name__}")
+
+_DECODERS = {
+    "datetime": datetime.datetime.fromisoformat,
+    "date": datetime.date.fromisoformat,
+    "decimal": decimal.Decimal,
+}
+
+def _decode(obj: Dict[str, Any]) -> Any:
+    if len(obj) == 2 and obj.get("__type__") in _DECODERS and "value" in obj:
+        return _DECODERS[obj["__type__"]](obj["value"])
+    return obj
+
+def dumps(value: Any) -> bytes:
+    return json.dumps(value, default=_encode, separators=(",", ":")).encode()
+
+def loads(payload: bytes) -> Any:
+    return json.loads(payload, object_hook=_decode)
+
+class CacheVersion(NamedTuple):
+    """Stato letto prima di una query, da passare a HabitCache.set"""
+    sequence: int                      # invalidazioni in questo processo
+    shared_key: Optional[str] = None   # chiave di versione nel backend condiviso
+    shared: Optional[int] = None       # suo valore (None se non è stato possibile leggerlo)
+
+class LocalCacheBackend:
+    """Backend in memoria con l'interfaccia di quello condiviso (sostituto di Redis)"""
+
+    def __init__(self):
+        self._data: Dict[str, Tuple[Optional[float], bytes]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            expires_at, value = item
+            if expires_at is not None and time.monotonic() > expires_at:
+                del self._data[key]
+                return None
+            return value
+
+    def set(self, key: str, value: bytes, ttl: Optional[float] = None):
+        with self._lock:
+            self._data[key] = (time.monotonic() + ttl if ttl else None, value)
+
+    def delete(self, *keys: str):
+        with self._lock:
+            for key in keys:
+                self._data.pop(key, None)
+
+    def incr(self, key: str) -> int:
+        with self._lock:
+            _, value = self._data.get(key, (None, b"0"))
+            value = str(int(value) + 1).encode()
+            self._data[key] = (None, value)
+            return int(value)
+
+    def set_if(self, version_key: str, version: int, key: str, value: bytes, ttl: Optional[float] = None) -> bool:
+        """Salva il valore solo se version_key vale ancora `version` (assente = 0)"""
+        with self._lock:
+            _, current = self._data.get(version_key, (None, b"0"))
+            if int(current) != version:
+                return False
+            self._data[key] = (time.monotonic() + ttl if ttl else None, value)
+            return True
+
+# Controllo della versione e SET nello stesso script: atomico sul server Redis
+_REDIS_SET_IF = """
+if (redis.call('GET', KEYS[1]) or '0') ~= ARGV[1] then
+    return 0
+end
+if tonumber(ARGV[3]) > 0 then
+    redis.call('SET', KEYS[2], ARGV[2], 'PX', ARGV[3])
+else
+    redis.call('SET', KEYS[2], ARGV[2])
+end
+return 1
+"""
+
+class RedisCacheBackend:
+    """Backend condiviso su Redis (dipendenza opzionale: pip install redis)"""
+
+    def __init__(self, url: str):
+        import redis
+        self.client = redis.Redis.from_url(url)
+        self._set_if = self.client.register_script(_REDIS_SET_IF)
+
+    def get(self, key: str) -> Optional[bytes]:
+        return self.client.get(key)
+
+    def set(self, key: str, value: bytes, ttl: Optional[float] = None):
+        self.client.set(key, value, px=int(ttl * 1000) if ttl else None)
+
+    def delete(self, *keys: str):
+        if keys:
+            self.client.delete(*keys)
+
+    def incr(self, key: str) -> int:
+        return int(self.client.incr(key))
+
+    def set_if(self, version_key: str, version: int, key: str, value: bytes, ttl: Optional[float] = None) -> bool:
+        return bool(self._set_if(keys=[version_key, key], args=[str(version), value, int(ttl * 1000) if ttl else 0]))
+
+class HabitCache:
+    def __init__(self, max_size: int = 10000, ttl: float = 300.0, backend=None, local_ttl: float = 5.0):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.backend = backend
+        self.local_ttl = local_ttl
+        self._entries: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._generations: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        # Incrementato a ogni invalidazione: una lettura iniziata prima non viene salvata nella LRU locale
+        self._sequence = 0
+        self._stats = {
+            "local_hits": 0,
+            "shared_hits": 0,
+            "misses": 0,
+            "sets": 0,
+            "invalidations": 0,
+            "stale_sets": 0,
+            "bypassed": 0,
+            "backend_errors": 0,
+        }
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_size > 0
+
+    # --- chiavi ---
+
+    @staticmethod
+    def habit_key(habit_id: int) -> str:
+        return f"habits:id:{habit_id}"
+
+    @staticmethod
+    def habit_version_key(habit_id: int) -> str:
+        return f"habits:ver:id:{habit_id}"
+
+    @staticmethod
+    def scope(user_id: Optional[int]) -> str:
+        return "all" if user_id is None else f"user:{user_id}"
+
+    def list_key(self, user_id: Optional[int], params: Tuple) -> str:
+        scope = self.scope(user_id)
+        return f"habits:list:{scope}:{self._generation(scope)}:{params!r}"
+
+    def _generation(self, scope: str) -> int:
+        if self.backend is not None:
+            try:
+                value = self.backend.get(f"habits:gen:{scope}")
+                return int(value) if value is not None else 0
+            except Exception as e:
+                self._backend_error(e)
+        with self._lock:
+            return self._generations.get(scope, 0)
+
+    # --- lettura e scrittura ---
+
+    def version(self, habit_id: Optional[int] = None) -> CacheVersion:
+        """
+        Da leggere prima della query e passare a set(). Per una singola
+        abitudine comprende la sua versione condivisa; le pagine di elenco
+        sono già protette dalla generazione contenuta nella chiave.
+        """
+        with self._lock:
+            sequence = self._sequence
+        if habit_id is None or self.backend is None:
+            return CacheVersion(sequence)
+        shared_key = self.habit_version_key(habit_id)
+        try:
+            value = self.backend.get(shared_key)
+            shared = int(value) if value is not None else 0
+        except Exception as e:
+            self._backend_error(e)
+            shared = None
+        return CacheVersion(sequence, shared_key, shared)
+
+    def get(self, key: str) -> Tuple[bool, Any]:
+        """(trovato, valore)"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if now <= entry[0]:
+                    self._entries.move_to_end(key)
+                    self._stats["local_hits"] += 1
+                    return True, entry[1]
+                del self._entries[key]
+
+        if self.backend is not None:
+            try:
+                payload = self.backend.get(key)
+            except Exception as e:
+                payload = None
+                self._backend_error(e)
+            if payload is not None:
+                value = loads(payload)
+                self._store_local(key, value)
+                with self._lock:
+                    self._stats["shared_hits"] += 1
+                return True, value
+
+        with self._lock:
+            self._stats["misses"] += 1
+        return False, None
+
+    def set(self, key: str, value: Any, version: Optional[CacheVersion] = None):
+        with self._lock:
+            if version is not None and version.sequence != self._sequence:
+                return
+        if self.backend is not None:
+            try:
+                if version is None or version.shared_key is None:
+                    self.backend.set(key, dumps(value), self.ttl)
+                elif version.shared is not None and not self.backend.set_if(
+                        version.shared_key, version.shared, key, dumps(value), self.ttl):
+                    # Invalidata da un altro processo durante la query: la riga letta può essere vecchia
+                    with self._lock:
+                        self._stats["stale_sets"] += 1
+                    return
+            except Exception as e:
+                self._backend_error(e)
+        with self._lock:
+            self._stats["sets"] += 1
+        self._store_local(key, value)
+
+    def _store_local(self, key: str, value: Any):
+        # Con un backend condiviso la copia locale vive poco: le invalidazioni degli altri processi non la raggiungono
+        ttl = min(self.ttl, self.local_ttl) if self.backend is not None else self.ttl
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def record_bypass(self):
+        with self._lock:
+            self._stats["bypassed"] += 1
+
+    # --- invalidazione ---
+
+    def invalidate(self, habit_ids: Iterable[int] = (), user_ids: Iterable[Optional[int]] = ()):
+        """
+        Rimuove le abitudini indicate e rende vecchie le pagine di elenco dei
+        loro proprietari e dell'elenco completo.
+        """
+        keys = [self.habit_key(habit_id) for habit_id in habit_ids]
+        scopes = {self.scope(user_id) for user_id in user_ids if user_id is not None}
+        scopes.add("all")
+        with self._lock:
+            self._sequence += 1
+            self._stats["invalidations"] += 1
+            for key in keys:
+                self._entries.pop(key, None)
+            for scope in scopes:
+                self._generations[scope] = self._generations.get(scope, 0) + 1
+        if self.backend is not None:
+            try:
+                # Prima le versioni, poi i valori: un set_if in corso o fallisce o viene cancellato
+                for habit_id in habit_ids:
+                    self.backend.incr(self.habit_version_key(habit_id))
+                if keys:
+                    self.backend.delete(*keys)
+                for scope in scopes:
+                    self.backend.incr(f"habits:gen:{scope}")
+            except Exception as e:
+                self._backend_error(e)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._sequence += 1
+
+    def _backend_error(self, e: Exception):
+        # Il backend condiviso è un'ottimizzazione: se non risponde si legge da Postgres
+        with self._lock:
+            self._stats["backend_errors"] += 1
+        print(f"⚠️ Habit cache backend error: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            hits = self._stats["local_hits"] + self._stats["shared_hits"]
+            lookups = hits + self._stats["misses"]
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "ttl_s": self.ttl,
+                "backend": type(self.backend).__name__ if self.backend is not None else None,
+                **self._stats,
+                "hit_rate": hits / lookups if lookups else 0.0,
+            }
+
+def create_habit_cache() -> HabitCache:
+    """
+    Cache delle abitudini configurata da variabili d'ambiente:
+    HABIT_CACHE_SIZE (0 la disattiva), HABIT_CACHE_TTL_S, HABIT_CACHE_LOCAL_TTL_S
+    e HABIT_CACHE_BACKEND = none | local | redis (con HABIT_CACHE_REDIS_URL).
+    """
+    backend_name = os.getenv('HABIT_CACHE_BACKEND', 'none')
+    backend = None
+    if backend_name == 'local':
+        backend = LocalCacheBackend()
+    elif backend_name == 'redis':
+        try:
+            backend = RedisCacheBackend(os.getenv('HABIT_CACHE_REDIS_URL', 'redis://localhost:6379/0'))
+        except ImportError:
+            print("⚠️ redis not installed, habit cache falls back to in-process only")
+    return HabitCache(
+        max_size=int(os.getenv('HABIT_CACHE_SIZE', '10000')),
+        ttl=float(os.getenv('HABIT_CACHE_TTL_S', '300')),
+        backend=backend,
+        local_ttl=float(os.getenv('HABIT_CACHE_LOCAL_TTL_S', '5')),
+    )
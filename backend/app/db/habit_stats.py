@@ -0,0 +1,348 @@
+"""
+Statistiche per abitudine (streak attuale, streak più lunga, tasso di completamento)
+mantenute nella tabella riassuntiva habit_stats.
+
+Ogni abitudine ha un obiettivo di `frequency_count` completamenti ogni
+`frequency_period` giorni. Il tempo è diviso in periodi consecutivi di
+`period_days` giorni (allineati al lunedì, così i periodi di 7 giorni sono
+settimane ISO) e un periodo è "raggiunto" con almeno `required_count` entry
+completed. Le streak contano periodi raggiunti consecutivi: giorni per le
+abitudini quotidiane, settimane per quelle settimanali.
+
+Le entry nuove aggiornano lo stato in modo incrementale (apply_entries);
+le entry fuori ordine o modificate fanno ricalcolare l'abitudine con il
+percorso vettoriale NumPy (compute_stats), usato anche per backfill e riparazioni.
+"""
+
+import datetime
+import os
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+import psycopg2.extras
+
+# Giorno 0 dei periodi: un lunedì
+BUCKET_ANCHOR = datetime.date(1970, 1, 5)
+
+# Finestra del tasso di completamento (giorni, fino a oggi compreso)
+COMPLETION_WINDOW_DAYS = int(os.getenv('HABIT_STATS_WINDOW_DAYS', '30'))
+
+STATS_COLUMNS = (
+    "habit_id", "required_count", "period_days", "current_streak", "longest_streak",
+    "last_met_bucket", "open_bucket", "open_bucket_count", "total_completed",
+    "window_completed", "completion_rate", "last_entry_date",
+)
+
+def bucket_rule(frequency_count: Optional[int], frequency_period: Optional[int]) -> Tuple[int, int]:
+    """
+    (required_count, period_days) di un'abitudine; senza frequenza vale "ogni giorno".
+    Un multiplo esatto del periodo diventa un obiettivo giornaliero (7 su 7 → 1 al giorno).
+    """
+    count = frequency_count if frequency_count and frequency_count > 0 else 1
+    period = frequency_period if frequency_period and frequency_period > 0 else 1
+    if count % period == 0:
+        return count // period, 1
+    return count, period
+
+def day_number(day: datetime.date) -> int:
+    return (day - BUCKET_ANCHOR).days
+
+def expected_in_window(required_count: int, period_days: int, window_days: int = COMPLETION_WINDOW_DAYS) -> float:
+    return max(required_count * window_days / period_days, 1.0)
+
+def completion_rate(window_completed: int, required_count: int, period_days: int) -> float:
+    return round(min(window_completed / expected_in_window(required_count, period_days), 1.0), 4)
+
+def window_start(today: datetime.date) -> datetime.date:
+    """Primo giorno della finestra del tasso di completamento che finisce oggi"""
+    return today - datetime.timedelta(days=COMPLETION_WINDOW_DAYS - 1)
+
+def set_window(row: Dict[str, Any], window_completed: int):
+    row["window_completed"] = window_completed
+    row["completion_rate"] = completion_rate(window_completed, row["required_count"], row["period_days"])
+
+def empty_stats(habit_id: int, required_count: int, period_days: int) -> Dict[str, Any]:
+    return {
+        "habit_id": habit_id,
+        "required_count": required_count,
+        "period_days": period_days,
+        "current_streak": 0,
+        "longest_streak": 0,
+        "last_met_bucket": None,
+        "open_bucket": None,
+        "open_bucket_count": 0,
+        "total_completed": 0,
+        "window_completed": 0,
+        "completion_rate": 0.0,
+        "last_entry_date": None,
+    }
+
+def compute_stats(
+    habits: Dict[int, Tuple[int, int]],
+    entry_habit_ids: np.ndarray,
+    entry_days: np.ndarray,
+    today: datetime.date,
+    last_entry_dates: Optional[Dict[int, datetime.date]] = None,
+) -> Dict[int, Dict[str, Any]]:
+    """
+    Ricalcolo completo e vettoriale per molte abitudini insieme.
+    `habits` è {habit_id: (required_count, period_days)}; entry_habit_ids ed
+    entry_days (numeri di giorno, vedi day_number) descrivono le sole entry
+    completed, una per (abitudine, giorno).
+    """
+    stats = {habit_id: empty_stats(habit_id, *rule) for habit_id, rule in habits.items()}
+    for habit_id, last_date in (last_entry_dates or {}).items():
+        if habit_id in stats:
+            stats[habit_id]["last_entry_date"] = last_date
+    if len(entry_days) == 0:
+        return stats
+
+    habit_ids = np.asarray(entry_habit_ids, dtype=np.int64)
+    days = np.asarray(entry_days, dtype=np.int64)
+
+    # Regola di ogni entry tramite l'indice della sua abitudine
+    known = np.array(sorted(habits), dtype=np.int64)
+    rules = np.array([habits[habit_id] for habit_id in known], dtype=np.int64).reshape(-1, 2)
+    index = np.searchsorted(known, habit_ids)
+    required, period = rules[index, 0], rules[index, 1]
+    buckets = np.floor_divide(days, period)
+
+    # Totali e completamenti nella finestra
+    window_start = day_number(today) - COMPLETION_WINDOW_DAYS + 1
+    totals = np.bincount(index, minlength=len(known))
+    in_window = np.bincount(index, weights=(days >= window_start) & (days <= day_number(today)), minlength=len(known))
+
+    # Completamenti per (abitudine, periodo)
+    order = np.lexsort((buckets, index))
+    index, buckets, required = index[order], buckets[order], required[order]
+    new_group = np.ones(len(index), dtype=bool)
+    new_group[1:] = (index[1:] != index[:-1]) | (buckets[1:] != buckets[:-1])
+    starts = np.flatnonzero(new_group)
+    group_index, group_bucket, group_required = index[starts], buckets[starts], required[starts]
+    group_count = np.diff(np.append(starts, len(index)))
+
+    # Ultimo periodo con completamenti di ogni abitudine ("periodo aperto")
+    last_group = np.ones(len(starts), dtype=bool)
+    last_group[:-1] = group_index[1:] != group_index[:-1]
+
+    # Periodi raggiunti e loro run di periodi consecutivi
+    met = group_count >= group_required
+    met_index, met_bucket = group_index[met], group_bucket[met]
+    longest = np.zeros(len(known), dtype=np.int64)
+    current = np.zeros(len(known), dtype=np.int64)
+    last_met = np.full(len(known), np.iinfo(np.int64).min)
+    if len(met_index):
+        new_run = np.ones(len(met_index), dtype=bool)
+        new_run[1:] = (met_index[1:] != met_index[:-1]) | (met_bucket[1:] != met_bucket[:-1] + 1)
+        run_id = np.cumsum(new_run) - 1
+        run_length = np.bincount(run_id)
+        run_index = met_index[new_run]
+        np.maximum.at(longest, run_index, run_length)
+        # L'ultima run di ogni abitudine è la streak corrente
+        last_run = np.ones(len(run_index), dtype=bool)
+        last_run[:-1] = run_index[1:] != run_index[:-1]
+        current[run_index[last_run]] = run_length[last_run]
+        ends = np.append(np.flatnonzero(new_run)[1:], len(met_index)) - 1
+        last_met[run_index[last_run]] = met_bucket[ends[last_run]]
+
+    for i, habit_id in enumerate(known.tolist()):
+        row = stats[habit_id]
+        if totals[i] == 0:
+            continue
+        row["total_completed"] = int(totals[i])
+        set_window(row, int(in_window[i]))
+        row["longest_streak"] = int(longest[i])
+        row["current_streak"] = int(current[i])
+        row["last_met_bucket"] = int(last_met[i]) if current[i] else None
+
+    open_groups = np.flatnonzero(last_group)
+    for g in open_groups.tolist():
+        row = stats[int(known[group_index[g]])]
+        row["open_bucket"] = int(group_bucket[g])
+        row["open_bucket_count"] = int(group_count[g])
+    return stats
+
+def apply_completion(row: Dict[str, Any], day: int) -> bool:
+    """
+    Aggiorna lo stato con una nuova entry completed del giorno `day`.
+    Restituisce False se l'entry è precedente al periodo aperto
+    (serve allora un ricalcolo completo dell'abitudine).
+    """
+    bucket = day // row["period_days"]
+    if row["open_bucket"] is not None and bucket < row["open_bucket"]:
+        return False
+    if row["open_bucket"] is None or bucket > row["open_bucket"]:
+        row["open_bucket"] = bucket
+        row["open_bucket_count"] = 0
+    row["open_bucket_count"] += 1
+    row["total_completed"] += 1
+
+    # Periodo appena raggiunto: allunga la streak o ne inizia una nuova
+    if row["open_bucket_count"] == row["required_count"]:
+        if row["last_met_bucket"] is not None and row["last_met_bucket"] == bucket - 1:
+            row["current_streak"] += 1
+        else:
+            row["current_streak"] = 1
+        row["last_met_bucket"] = bucket
+        row["longest_streak"] = max(row["longest_streak"], row["current_streak"])
+    return True
+
+def public_stats(row: Dict[str, Any], today: datetime.date) -> Dict[str, Any]:
+    """
+    Statistiche come le vede il client: la streak corrente è ancora viva se
+    l'ultimo periodo raggiunto è quello attuale o il precedente
+    (il periodo in corso non è ancora perso).
+    """
+    today_bucket = day_number(today) // row["period_days"]
+    alive = row["last_met_bucket"] is not None and row["last_met_bucket"] >= today_bucket - 1
+    return {
+        "habit_id": row["habit_id"],
+        "required_count": row["required_count"],
+        "period_days": row["period_days"],
+        "current_streak": row["current_streak"] if alive else 0,
+        "longest_streak": row["longest_streak"],
+        "completion_rate": float(row["completion_rate"]),
+        "window_days": COMPLETION_WINDOW_DAYS,
+        "window_completed": row["window_completed"],
+        "total_completed": row["total_completed"],
+        "current_period_completed": row["open_bucket_count"] if row["open_bucket"] == today_bucket else 0,
+        "last_entry_date": row["last_entry_date"],
+        "updated_at": row.get("updated_at"),
+    }
+
+def read_stats(cursor, habit_ids: Iterable[int], today: datetime.date) -> Dict[int, Dict[str, Any]]:
+    """
+    Statistiche pubbliche delle abitudini che hanno una riga in habit_stats.
+    La finestra salvata vale per il giorno dell'ultima scrittura: qui viene
+    ricontata su oggi (scansione per indice, saltata se l'ultima entry è già
+    fuori dalla finestra), così un'abitudine ferma da settimane ha tasso 0.
+    """
+    columns = STATS_COLUMNS + ("updated_at",)
+    start = window_start(today)
+    cursor.execute(
+        f"""
+        SELECT {', '.join(f'hs.{column}' for column in columns)},
+               CASE WHEN hs.last_entry_date >= %s THEN (
+                   SELECT count(*) FROM habit_entries e
+                   WHERE e.habit_id = hs.habit_id AND e.status = 'completed' AND e.entry_date BETWEEN %s AND %s
+               ) ELSE 0 END
+        FROM habit_stats hs
+        WHERE hs.habit_id = ANY(%s)
+        """,
+        (start, start, today, list(habit_ids)),
+    )
+    stats = {}
+    for values in cursor.fetchall():
+        row = dict(zip(columns, values))
+        set_window(row, int(values[-1]))
+        stats[row["habit_id"]] = public_stats(row, today)
+    return stats
+
+def load_rows(cursor, habit_ids: Iterable[int]) -> Dict[int, Dict[str, Any]]:
+    """Stato salvato delle abitudini richieste, bloccato fino al commit (FOR UPDATE)"""
+    cursor.execute(
+        f"SELECT {', '.join(STATS_COLUMNS)} FROM habit_stats WHERE habit_id = ANY(%s) FOR UPDATE",
+        (list(habit_ids),),
+    )
+    return {row[0]: dict(zip(STATS_COLUMNS, row)) for row in cursor.fetchall()}
+
+def save_rows(cursor, rows: List[Dict[str, Any]]):
+    """Upsert multi-riga nella tabella habit_stats"""
+    if not rows:
+        return
+    updates = ", ".join(f"{column} = EXCLUDED.{column}" for column in STATS_COLUMNS[1:])
+    psycopg2.extras.execute_values(
+        cursor,
+        f"""
+        INSERT INTO habit_stats ({', '.join(STATS_COLUMNS)}) VALUES %s
+        ON CONFLICT (habit_id) DO UPDATE SET {updates}, updated_at = CURRENT_TIMESTAMP
+        """,
+        [tuple(row[column] for column in STATS_COLUMNS) for row in rows],
+        page_size=max(len(rows), 1),
+    )
+
+def recompute(cursor, habit_ids: Optional[List[int]], today: datetime.date) -> int:
+    """
+    Ricalcolo completo dalle habit_entries (tutte le abitudini se habit_ids è None).
+    Una query per le regole, una per le entry, un upsert per i risultati.
+    """
+    if habit_ids is None:
+        cursor.execute("SELECT id, frequency_count, frequency_period FROM habits")
+    else:
+        cursor.execute(
+            "SELECT id, frequency_count, frequency_period FROM habits WHERE id = ANY(%s)", (list(habit_ids),))
+    habits = {habit_id: bucket_rule(count, period) for habit_id, count, period in cursor.fetchall()}
+    if not habits:
+        return 0
+
+    cursor.execute(
+        """
+        SELECT habit_id, entry_date - %s AS day
+        FROM habit_entries
+        WHERE habit_id = ANY(%s) AND status = 'completed'
+        """,
+        (BUCKET_ANCHOR, list(habits)),
+    )
+    entries = np.array(cursor.fetchall(), dtype=np.int64).reshape(-1, 2)
+    cursor.execute(
+        "SELECT habit_id, max(entry_date) FROM habit_entries WHERE habit_id = ANY(%s) GROUP BY habit_id",
+        (list(habits),),
+    )
+    last_entry_dates = dict(cursor.fetchall())
+
+    stats = compute_stats(habits, entries[:, 0], entries[:, 1], today, last_entry_dates)
+    save_rows(cursor, list(stats.values()))
+    return len(stats)
+
+def apply_entries(cursor, entries: List[Tuple[int, datetime.date, str, bool]], today: datetime.date) -> int:
+    """
+    Aggiorna habit_stats dopo un upsert di entry, nella stessa transazione.
+    `entries` sono tuple (habit_id, entry_date, status, inserted). Le entry
+    nuove e in ordine aggiornano lo stato salvato; le abitudini con entry
+    modificate, fuori ordine o senza stato salvato vengono ricalcolate.
+    """
+    by_habit: Dict[int, List[Tuple[datetime.date, str, bool]]] = {}
+    for habit_id, entry_date, status, inserted in entries:
+        by_habit.setdefault(habit_id, []).append((entry_date, status, inserted))
+    if not by_habit:
+        return 0
+
+    rows = load_rows(cursor, by_habit)
+    to_recompute = [habit_id for habit_id in by_habit if habit_id not in rows]
+    updated = []
+    for habit_id, row in rows.items():
+        items = sorted(by_habit[habit_id])
+        # Una entry modificata può aver tolto un completamento: serve il ricalcolo
+        if not all(inserted for _, _, inserted in items):
+            to_recompute.append(habit_id)
+            continue
+        in_order = True
+        for entry_date, status, _ in items:
+            if row["last_entry_date"] is None or entry_date > row["last_entry_date"]:
+                row["last_entry_date"] = entry_date
+            if status == "completed" and not apply_completion(row, day_number(entry_date)):
+                in_order = False
+                break
+        if in_order:
+            updated.append(row)
+        else:
+            to_recompute.append(habit_id)
+
+    if updated:
+        # Il tasso di completamento dipende dalla finestra: lo si rilegge con una scansione per indice
+        cursor.execute(
+            """
+            SELECT habit_id, count(*) FROM habit_entries
+            WHERE habit_id = ANY(%s) AND status = 'completed' AND entry_date BETWEEN %s AND %s
+            GROUP BY habit_id
+            """,
+            ([row["habit_id"] for row in updated], window_start(today), today),
+        )
+        window = dict(cursor.fetchall())
+        for row in updated:
+            set_window(row, window.get(row["habit_id"], 0))
+        save_rows(cursor, updated)
+
+    if to_recompute:
+        recompute(cursor, to_recompute, today)
+    return len(by_habit)
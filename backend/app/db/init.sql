@@ -57,12 +57,57 @@ CREATE TABLE IF NOT EXISTS group_members (
     UNIQUE(group_id, user_id)
 );
 
+-- Statistiche riassuntive per abitudine (streak e tasso di completamento),
+-- aggiornate in modo incrementale a ogni caricamento di entry
+CREATE TABLE IF NOT EXISTS habit_stats (
+    habit_id INTEGER PRIMARY KEY REFERENCES habits(id) ON DELETE CASCADE,
+    required_count INTEGER NOT NULL,
+    period_days INTEGER NOT NULL,
+    current_streak INTEGER NOT NULL DEFAULT 0,
+    longest_streak INTEGER NOT NULL DEFAULT 0,
+    last_met_bucket INTEGER,
+    open_bucket INTEGER,
+    open_bucket_count INTEGER NOT NULL DEFAULT 0,
+    total_completed INTEGER NOT NULL DEFAULT 0,
+    window_completed INTEGER NOT NULL DEFAULT 0,
+    completion_rate DECIMAL(5,4) NOT NULL DEFAULT 0,
+    last_entry_date DATE,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Classifiche dei gruppi precalcolate: una riga per (gruppo, membro),
+-- aggiornata quando cambiano le statistiche delle abitudini del membro
+CREATE TABLE IF NOT EXISTS group_leaderboard (
+    group_id INTEGER NOT NULL REFERENCES social_groups(id) ON DELETE CASCADE,
+    user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    habits INTEGER NOT NULL DEFAULT 0,
+    score INTEGER NOT NULL DEFAULT 0,
+    total_completed INTEGER NOT NULL DEFAULT 0,
+    best_current_streak INTEGER NOT NULL DEFAULT 0,
+    longest_streak INTEGER NOT NULL DEFAULT 0,
+    completion_rate DECIMAL(5,4) NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (group_id, user_id)
+);
+
+-- Cache persistente delle analisi NLP (condivisa tra worker, sopravvive ai riavvii)
+CREATE TABLE IF NOT EXISTS analysis_cache (
+    cache_key CHAR(40) PRIMARY KEY,
+    language VARCHAR(10) NOT NULL,
+    analysis JSONB NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
 -- Indici per performance
-CREATE INDEX IF NOT EXISTS idx_habits_user_id ON habits(user_id);
+-- Elenchi paginati (keyset su created_at, id): per utente e su tutta la tabella
+CREATE INDEX IF NOT EXISTS idx_habits_user_created ON habits(user_id, created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_habits_created ON habits(created_at DESC, id DESC);
 CREATE INDEX IF NOT EXISTS idx_habit_entries_habit_id ON habit_entries(habit_id);
 CREATE INDEX IF NOT EXISTS idx_habit_entries_date ON habit_entries(entry_date);
 CREATE INDEX IF NOT EXISTS idx_group_members_group_id ON group_members(group_id);
 CREATE INDEX IF NOT EXISTS idx_group_members_user_id ON group_members(user_id);
+CREATE INDEX IF NOT EXISTS idx_analysis_cache_created_at ON analysis_cache(created_at);
+CREATE INDEX IF NOT EXISTS idx_group_leaderboard_rank ON group_leaderboard(group_id, score DESC, best_current_streak DESC, user_id);
 
 -- Inserimento dati di test
 INSERT INTO users (username, email, password_hash) VALUES 
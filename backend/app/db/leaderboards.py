@@ -0,0 +1,229 @@
+"""
+Classifiche dei gruppi precalcolate nella tabella group_leaderboard.
+
+Una riga per (gruppo, membro) con gli aggregati delle abitudini del membro:
+completamenti nella finestra che finisce oggi (il punteggio, contati dalle
+habit_entries), streak correnti ancora vive e più lunghe da habit_stats,
+tasso medio di completamento. Quando arrivano entry vengono aggiornate solo
+le righe dei membri coinvolti, in tutti i loro gruppi; la lettura è un index
+scan su (group_id, score) con LIMIT.
+
+Finestra e streak dipendono dal giorno: refresh_stale ricalcola, una volta al
+giorno, i gruppi con righe di un giorno precedente (chi smette di registrare
+le entry perde punteggio e streak anche senza nuove scritture).
+
+Sopra la tabella c'è una cache in memoria per processo, invalidata per gruppo
+quando le righe cambiano (nello stesso processo) e comunque dopo un TTL.
+"""
+
+import datetime
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from . import habit_stats
+
+# Aggregati per (gruppo, membro) al giorno %(today)s. Un membro senza abitudini ha tutto a zero.
+# Il punteggio si conta dalle entry della finestra (index scan su (habit_id, entry_date)),
+# la streak corrente vale solo se è ancora viva, come in habit_stats.public_stats.
+# Il tasso usa l'obiettivo giornaliero di habit_stats o, se l'abitudine non ha ancora
+# statistiche, quello della sua frequenza (stesso valore di habit_stats.bucket_rule).
+_REFRESH_SELECT = """
+SELECT gm.group_id,
+       gm.user_id,
+       count(h.id) AS habits,
+       coalesce(sum(w.completed), 0) AS score,
+       coalesce(sum(hs.total_completed), 0) AS total_completed,
+       coalesce(max(CASE WHEN hs.last_met_bucket >= %(today_day)s / hs.period_days - 1
+                         THEN hs.current_streak ELSE 0 END), 0) AS best_current_streak,
+       coalesce(max(hs.longest_streak), 0) AS longest_streak,
+       coalesce(avg(least(
+           w.completed / greatest(%(window_days)s * coalesce(
+               hs.required_count::numeric / hs.period_days,
+               (CASE WHEN h.frequency_count > 0 THEN h.frequency_count ELSE 1 END)::numeric
+                   / (CASE WHEN h.frequency_period > 0 THEN h.frequency_period ELSE 1 END)
+           ), 1), 1
+       )), 0) AS completion_rate
+FROM group_members gm
+LEFT JOIN habits h ON h.user_id = gm.user_id
+LEFT JOIN habit_stats hs ON hs.habit_id = h.id
+LEFT JOIN LATERAL (
+    SELECT count(*) AS completed FROM habit_entries e
+    WHERE e.habit_id = h.id AND e.status = 'completed' AND e.entry_date BETWEEN %(window_start)s AND %(today)s
+) w ON TRUE
+WHERE {condition}
+GROUP BY gm.group_id, gm.user_id
+"""
+
+# Chiave dell'advisory lock di refresh_stale: un solo processo alla volta ricalcola
+_REFRESH_LOCK_KEY = 0x6c6462  # "ldb"
+
+def _params(today: Optional[datetime.date] = None, **params) -> Dict[str, Any]:
+    today = today or datetime.date.today()
+    return {
+        "today": today,
+        "today_day": habit_stats.day_number(today),
+        "window_start": habit_stats.window_start(today),
+        "window_days": habit_stats.COMPLETION_WINDOW_DAYS,
+        **params,
+    }
+
+_UPSERT = """
+INSERT INTO group_leaderboard
+    (group_id, user_id, habits, score, total_completed, best_current_streak, longest_streak, completion_rate)
+{select}
+ON CONFLICT (group_id, user_id) DO UPDATE
+SET habits = EXCLUDED.habits,
+    score = EXCLUDED.score,
+    total_completed = EXCLUDED.total_completed,
+    best_current_streak = EXCLUDED.best_current_streak,
+    longest_streak = EXCLUDED.longest_streak,
+    completion_rate = EXCLUDED.completion_rate,
+    updated_at = CURRENT_TIMESTAMP
+RETURNING group_id
+"""
+
+def refresh_users(cursor, user_ids: Iterable[int]) -> List[int]:
+    """Ricalcola le righe dei membri indicati in tutti i loro gruppi; restituisce i gruppi toccati"""
+    user_ids = [user_id for user_id in set(user_ids) if user_id is not None]
+    if not user_ids:
+        return []
+    cursor.execute(
+        _UPSERT.format(select=_REFRESH_SELECT.format(condition="gm.user_id = ANY(%(user_ids)s)")),
+        _params(user_ids=user_ids),
+    )
+    return sorted({row[0] for row in cursor.fetchall()})
+
+def refresh_member(cursor, group_id: int, user_id: int):
+    """Riga di un singolo membro (es. appena entrato nel gruppo)"""
+    cursor.execute(
+        _UPSERT.format(select=_REFRESH_SELECT.format(condition="gm.group_id = %(group_id)s AND gm.user_id = %(user_id)s")),
+        _params(group_id=group_id, user_id=user_id),
+    )
+
+def refresh_habits(cursor, habit_ids: Iterable[int]) -> List[int]:
+    """Come refresh_users, partendo dalle abitudini modificate"""
+    cursor.execute("SELECT DISTINCT user_id FROM habits WHERE id = ANY(%s) AND user_id IS NOT NULL", (list(habit_ids),))
+    return refresh_users(cursor, [row[0] for row in cursor.fetchall()])
+
+def refresh_groups(cursor, group_ids: Optional[List[int]] = None, today: Optional[datetime.date] = None) -> List[int]:
+    """Ricostruzione completa di alcuni gruppi (o di tutti), eliminando le righe di ex membri"""
+    if group_ids is None:
+        cursor.execute("""
+        DELETE FROM group_leaderboard gl
+        WHERE NOT EXISTS (
+            SELECT 1 FROM group_members gm WHERE gm.group_id = gl.group_id AND gm.user_id = gl.user_id
+        )
+        """)
+        cursor.execute(_UPSERT.format(select=_REFRESH_SELECT.format(condition="TRUE")), _params(today))
+    else:
+        cursor.execute("""
+        DELETE FROM group_leaderboard gl
+        WHERE gl.group_id = ANY(%s) AND NOT EXISTS (
+            SELECT 1 FROM group_members gm WHERE gm.group_id = gl.group_id AND gm.user_id = gl.user_id
+        )
+        """, (group_ids,))
+        cursor.execute(
+            _UPSERT.format(select=_REFRESH_SELECT.format(condition="gm.group_id = ANY(%(group_ids)s)")),
+            _params(today, group_ids=group_ids),
+        )
+    return sorted({row[0] for row in cursor.fetchall()})
+
+def refresh_stale(cursor, today: Optional[datetime.date] = None) -> List[int]:
+    """
+    Ricalcola i gruppi con righe aggiornate prima di oggi. Con più processi
+    lo fa solo chi ottiene l'advisory lock; gli altri trovano poi tutto aggiornato.
+    """
+    today = today or datetime.date.today()
+    cursor.execute("SELECT pg_try_advisory_xact_lock(%s)", (_REFRESH_LOCK_KEY,))
+    if not cursor.fetchone()[0]:
+        return []
+    cursor.execute("SELECT DISTINCT group_id FROM group_leaderboard WHERE updated_at < %s", (today,))
+    group_ids = [row[0] for row in cursor.fetchall()]
+    if not group_ids:
+        return []
+    return refresh_groups(cursor, group_ids, today)
+
+class LeaderboardCache:
+    """
+    Cache LRU con TTL delle pagine di classifica, per processo.
+    Le chiavi sono (group_id, limit, offset); invalidate(group_id) rimuove
+    tutte le pagine del gruppo. Con più worker l'invalidazione è locale:
+    negli altri processi la pagina resta valida al più `ttl` secondi.
+    Un contatore di generazione per gruppo evita di salvare una pagina letta
+    prima di un'invalidazione concorrente.
+    """
+
+    def __init__(self, max_size: int = 1000, ttl: float = 30.0):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: "OrderedDict[Tuple[int, int, int], Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._invalidations = 0
+        self._generations: Dict[int, int] = {}
+        self._epoch = 0
+
+    def generation(self, group_id: int) -> Tuple[int, int]:
+        """Da leggere prima della query e passare a set()"""
+        with self._lock:
+            return self._epoch, self._generations.get(group_id, 0)
+
+    def get(self, group_id: int, limit: int, offset: int) -> Optional[Any]:
+        key = (group_id, limit, offset)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or (self.ttl and time.monotonic() - entry[0] > self.ttl):
+                if entry is not None:
+                    del self._entries[key]
+                self._misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return entry[1]
+
+    def set(self, group_id: int, limit: int, offset: int, value: Any, generation: Optional[Tuple[int, int]] = None):
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            if generation is not None and generation != (self._epoch, self._generations.get(group_id, 0)):
+                return
+            self._entries[(group_id, limit, offset)] = (time.monotonic(), value)
+            self._entries.move_to_end((group_id, limit, offset))
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, group_ids: Optional[Iterable[int]] = None):
+        """Rimuove le pagine dei gruppi indicati (tutte se group_ids è None)"""
+        with self._lock:
+            if group_ids is None:
+                self._entries.clear()
+                self._epoch += 1
+            else:
+                groups = set(group_ids)
+                for group_id in groups:
+                    self._generations[group_id] = self._generations.get(group_id, 0) + 1
+                for key in [key for key in self._entries if key[0] in groups]:
+                    del self._entries[key]
+            self._invalidations += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "ttl_s": self.ttl,
+                "hits": self._hits,
+                "misses": self._misses,
+                "invalidations": self._invalidations,
+                "hit_rate": self._hits / lookups if lookups else 0.0,
+            }
+
+leaderboard_cache = LeaderboardCache(
+    max_size=int(os.getenv('LEADERBOARD_CACHE_SIZE', '1000')),
+    ttl=float(os.getenv('LEADERBOARD_CACHE_TTL_S', '30')),
+)
@@ -0,0 +1,243 @@
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Dict, List, Optional
+
+import psycopg2
+
+class WriteQueueFull(Exception):
+    """La coda di scrittura è piena e la policy non consente di attendere"""
+
+class WriteBehindQueue:
+    """
+    Coda di scrittura differita: le righe vengono accodate in memoria e un
+    thread in background le scrive in blocco con `write_fn(rows)` (un solo
+    INSERT multi-riga e un solo commit per batch).
+
+    - il flush parte quando ci sono `batch_size` righe o dopo `flush_interval` secondi
+    - la coda contiene al massimo `max_queue` righe; oltre, `on_full` decide:
+      "block" attende fino a `block_timeout`, "reject" solleva WriteQueueFull,
+      "sync" scrive la riga subito nel thread chiamante
+    - gli errori di connessione vengono ritentati fino a `max_retries` volte;
+      se il batch fallisce per un errore sui dati le righe sono riscritte una
+      alla volta, così una riga non valida non fa perdere le altre
+    - stop() smette di accettare righe e svuota la coda prima di tornare
+
+    Le righe accodate e non ancora scritte si perdono se il processo muore
+    senza passare da stop(): è il compromesso della scrittura differita.
+    """
+
+    def __init__(
+        self,
+        write_fn: Callable[[List[Dict[str, Any]]], Any],
+        batch_size: int = 100,
+        flush_interval: float = 0.2,
+        max_queue: int = 10000,
+        on_full: str = "block",
+        block_timeout: float = 5.0,
+        max_retries: int = 3,
+        retry_backoff: float = 0.5,
+        name: str = "habits",
+    ):
+        if on_full not in ("block", "reject", "sync"):
+            raise ValueError(f"Unknown write-behind overflow policy: {on_full}")
+
+        self.write_fn = write_fn
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_queue = max_queue
+        self.on_full = on_full
+        self.block_timeout = block_timeout
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.name = name
+
+        self._rows: deque = deque()
+        self._cond = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self._closed = False
+        self._writing = 0
+        self._stats = {
+            "enqueued": 0,
+            "written": 0,
+            "batches": 0,
+            "retries": 0,
+            "failed": 0,
+            "rejected": 0,
+            "written_sync": 0,
+            "last_batch_ms": 0.0,
+        }
+
+    def start(self):
+        with self._cond:
+            if self._thread and self._thread.is_alive():
+                return
+            self._closed = False
+            self._thread = threading.Thread(target=self._run, name=f"write-behind-{self.name}", daemon=True)
+            self._thread.start()
+
+    def submit(self, row: Dict[str, Any]):
+        self.submit_many([row])
+
+    def submit_many(self, rows: List[Dict[str, Any]]):
+        """Accoda le righe; ritorna subito salvo coda piena con policy block"""
+        deadline = time.monotonic() + self.block_timeout
+        overflow: List[Dict[str, Any]] = []
+        with self._cond:
+            if self._closed:
+                raise WriteQueueFull(f"Write-behind queue '{self.name}' is stopped")
+            for row in rows:
+                while len(self._rows) >= self.max_queue:
+                    if self.on_full != "block":
+                        break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0 or self._closed:
+                        break
+                    self._cond.wait(remaining)
+                if len(self._rows) >= self.max_queue or self._closed:
+                    overflow.append(row)
+                    continue
+                self._rows.append(row)
+                self._stats["enqueued"] += 1
+            self._cond.notify_all()
+
+        if overflow:
+            if self.on_full == "sync":
+                self._write(overflow)
+                with self._cond:
+                    self._stats["written_sync"] += len(overflow)
+                return
+            with self._cond:
+                self._stats["rejected"] += len(overflow)
+            raise WriteQueueFull(
+                f"Write-behind queue '{self.name}' is full ({self.max_queue} rows), "
+                f"{len(overflow)} rows not saved")
+
+    def stop(self, timeout: Optional[float] = None) -> bool:
+        """Smette di accettare righe e svuota la coda (entro `timeout` secondi)"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        if self._thread is None:
+            # Mai avviata: scrive direttamente quello che c'è
+            self._drain_now()
+            return True
+        self._thread.join(timeout)
+        drained = not self._thread.is_alive()
+        if not drained:
+            print(f"⚠️ Write-behind '{self.name}': {len(self._rows)} rows still queued at shutdown")
+        return drained
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                "pending": len(self._rows),
+                "max_queue": self.max_queue,
+                "batch_size": self.batch_size,
+                **self._stats,
+            }
+
+    def _run(self):
+        while True:
+            with self._cond:
+                # Attende un batch pieno, lo scadere dell'intervallo o la chiusura
+                deadline = time.monotonic() + self.flush_interval
+                while not self._closed and len(self._rows) < self.batch_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                if not self._rows:
+                    if self._closed:
+                        return
+                    continue
+                batch = [self._rows.popleft() for _ in range(min(self.batch_size, len(self._rows)))]
+                self._writing += 1
+                # Libera chi è in attesa di spazio nella coda
+                self._cond.notify_all()
+            try:
+                self._write_batch(batch)
+            finally:
+                with self._cond:
+                    self._writing -= 1
+                    self._cond.notify_all()
+
+    def _drain_now(self):
+        while True:
+            with self._cond:
+                if not self._rows:
+                    return
+                batch = [self._rows.popleft() for _ in range(min(self.batch_size, len(self._rows)))]
+            self._write_batch(batch)
+
+    def _write(self, rows: List[Dict[str, Any]]):
+        attempt = 0
+        while True:
+            try:
+                return self.write_fn(rows)
+            except (psycopg2.OperationalError, psycopg2.InterfaceError):
+                if attempt >= self.max_retries:
+                    raise
+                attempt += 1
+                with self._cond:
+                    self._stats["retries"] += 1
+                time.sleep(self.retry_backoff * (2 ** (attempt - 1)))
+
+    def _write_batch(self, batch: List[Dict[str, Any]]):
+        start = time.perf_counter()
+        written = 0
+        try:
+            self._write(batch)
+            written = len(batch)
+        except psycopg2.DatabaseError as e:
+            if isinstance(e, (psycopg2.OperationalError, psycopg2.InterfaceError)) or len(batch) == 1:
+                print(f"❌ Write-behind '{self.name}': {len(batch)} rows lost: {e}")
+            else:
+                # Errore sui dati: isola le righe non valide scrivendole una alla volta
+                for row in batch:
+                    try:
+                        self._write([row])
+                        written += 1
+                    except Exception as row_error:
+                        print(f"❌ Write-behind '{self.name}': row rejected: {row_error}")
+        except Exception as e:
+            print(f"❌ Write-behind '{self.name}': {len(batch)} rows lost: {e}")
+        with self._cond:
+            self._stats["written"] += written
+            self._stats["failed"] += len(batch) - written
+            self._stats["batches"] += 1
+            self._stats["last_batch_ms"] = (time.perf_counter() - start) * 1000
+
+def write_behind_enabled() -> bool:
+    """DB_WRITE_MODE=write_behind attiva la scrittura differita delle abitudini"""
+    return os.getenv('DB_WRITE_MODE', 'sync') == 'write_behind'
+
+def create_habit_writer(habit_repo) -> WriteBehindQueue:
+    """Coda di scrittura differita per habits, configurata da variabili d'ambiente"""
+    synchronous_commit = os.getenv('DB_WRITE_BEHIND_SYNCHRONOUS_COMMIT', 'on') != 'off'
+    return WriteBehindQueue(
+        lambda rows: habit_repo.create_habits(rows, returning=False, synchronous_commit=synchronous_commit),
+        batch_size=int(os.getenv('DB_WRITE_BEHIND_BATCH_SIZE', '100')),
+        flush_interval=float(os.getenv('DB_WRITE_BEHIND_FLUSH_MS', '200')) / 1000,
+        max_queue=int(os.getenv('DB_WRITE_BEHIND_MAX_QUEUE', '10000')),
+        on_full=os.getenv('DB_WRITE_BEHIND_ON_FULL', 'block'),
+        block_timeout=float(os.getenv('DB_WRITE_BEHIND_BLOCK_TIMEOUT_S', '5')),
+        max_retries=int(os.getenv('DB_WRITE_BEHIND_MAX_RETRIES', '3')),
+        name="habits",
+    )
+
+def create_analysis_cache_writer(cache_repo) -> WriteBehindQueue:
+    """
+    Coda per le voci della cache delle analisi su Postgres: con la coda piena
+    le voci vengono scartate (on_full="reject"), l'inferenza non attende mai.
+    """
+    return WriteBehindQueue(
+        cache_repo.set_many,
+        batch_size=int(os.getenv('ANALYSIS_CACHE_WRITE_BATCH_SIZE', '200')),
+        flush_interval=float(os.getenv('ANALYSIS_CACHE_WRITE_FLUSH_MS', '500')) / 1000,
+        max_queue=int(os.getenv('ANALYSIS_CACHE_WRITE_MAX_QUEUE', '5000')),
+        on_full="reject",
+        max_retries=1,
+        name="analysis_cache",
+    )
@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+"""
+Ri-analisi offline delle abitudini salvate (backfill).
+
+Dopo un aggiornamento dei modelli spaCy/BERT o delle regole di
+HabitExtractorML le abitudini già salvate restano con l'estrazione vecchia.
+Questo job rilegge habits.description con un cursore lato server, la
+analizza con extract_habits_ml_batch (nlp.pipe e NER a batch) in un pool di
+processi e riscrive action, quantity, target, frequency_*, language e
+ml_confidence con UPDATE a blocchi. name e description non vengono toccati.
+
+    python backfill.py --workers 8 --batch-size 256
+    python backfill.py --only-missing                 # solo righe senza azione o frequenza
+    python backfill.py --resume                       # riprende dall'ultimo checkpoint
+    python backfill.py --dry-run --max-rows 1000      # analizza senza scrivere
+
+Gira sul database direttamente, senza passare dai nodi dell'API. Il
+checkpoint (JSON) registra l'ultimo id scritto: dopo un'interruzione
+--resume riparte da lì, e le righe rianalizzate due volte non cambiano.
+"""
+
+import argparse
+import datetime
+import itertools
+import json
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BACKEND_DIR)
+# Il modulo NLM si importa come pacchetto di primo livello (come in app/api/server.py)
+sys.path.insert(0, os.path.join(BACKEND_DIR, "app"))
+
+DEFAULT_CHECKPOINT = os.path.join(BACKEND_DIR, "backfill_checkpoint.json")
+
+# --- worker (processi del pool) ---
+
+_mode: Optional[str] = None
+_language: Optional[str] = None
+
+def _init_worker(languages: List[str], mode: Optional[str], language: Optional[str], torch_threads: int):
+    """Carica i modelli una volta per processo; la cache delle analisi non serve a un job che legge ogni testo una volta"""
+    global _mode, _language
+    os.environ["ANALYSIS_CACHE_SIZE"] = "0"
+    os.environ.setdefault("TOKENIZERS_PARALLELISM", "false")
+    try:
+        import torch
+        torch.set_num_threads(torch_threads)
+    except ImportError:
+        pass
+    from NLM.model_registry import registry
+    registry.warm_up(languages or None)
+    _mode, _language = mode, language
+
+def _update_row(habit_id: int, analysis: dict) -> tuple:
+    from NLM.habit_nalyze import create_habit_object
+    from app.db.database import BACKFILL_COLUMNS
+
+    habit = create_habit_object(analysis).model_dump()
+    return (habit_id, *(habit[column] for column in BACKFILL_COLUMNS))
+
+def analyze_batch(rows: List[Tuple[int, str]]) -> Tuple[List[tuple], List[Tuple[int, str]]]:
+    """Analizza un blocco di (id, description); restituisce (righe da scrivere, errori per id)"""
+    from NLM.habit_nalyze import extract_habits_ml_batch
+
+    try:
+        analyses = extract_habits_ml_batch([text for _, text in rows], language=_language, mode=_mode)
+        return [_update_row(habit_id, analysis) for (habit_id, _), analysis in zip(rows, analyses)], []
+    except Exception:
+        pass
+
+    # Un testo problematico non deve far perdere tutto il blocco: si riprova uno per uno
+    updates, errors = [], []
+    for habit_id, text in rows:
+        try:
+            analysis = extract_habits_ml_batch([text], language=_language, mode=_mode)[0]
+            updates.append(_update_row(habit_id, analysis))
+        except Exception as e:
+            errors.append((habit_id, str(e)))
+    return updates, errors
+
+# --- checkpoint ---
+
+class Checkpoint:
+    """Stato del job salvato dopo ogni blocco scritto (scrittura atomica con os.replace)"""
+
+    def __init__(self, path: str, last_id: int = 0, counters: Optional[Dict[str, int]] = None,
+                 options: Optional[Dict] = None):
+        self.path = path
+        self.last_id = last_id
+        self.counters = counters or {"processed": 0, "updated": 0, "unchanged": 0, "errors": 0}
+        self.options = options or {}
+
+    @classmethod
+    def load(cls, path: str) -> "Checkpoint":
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        return cls(path, data["last_id"], data["counters"], data.get("options"))
+
+    def save(self):
+        data = {
+            "last_id": self.last_id,
+            "counters": self.counters,
+            "options": self.options,
+            "updated_at": datetime.datetime.now().isoformat(timespec="seconds"),
+        }
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=2)
+        os.replace(tmp_path, self.path)
+
+# --- avanzamento ---
+
+class Progress:
+    def __init__(self, total: Optional[int], interval: float):
+        self.total = total
+        self.interval = interval
+        self.start = time.monotonic()
+        self.last_report = self.start
+        self.done = 0
+        self.reported = 0
+
+    def advance(self, rows: int, checkpoint: Checkpoint, force: bool = False):
+        self.done += rows
+        now = time.monotonic()
+        if self.done == self.reported or (not force and now - self.last_report < self.interval):
+            return
+        self.last_report, self.reported = now, self.done
+        elapsed = now - self.start
+        rate = self.done / elapsed if elapsed else 0.0
+        counters = checkpoint.counters
+        line = f"📈 {self.done:,}"
+        if self.total:
+            line += f"/{self.total:,} ({100 * self.done / self.total:.1f}%)"
+            if rate:
+                line += f", ETA {datetime.timedelta(seconds=int((self.total - self.done) / rate))}"
+        line += (f" | {rate:,.0f} habits/s | updated {counters['updated']:,}, unchanged {counters['unchanged']:,},"
+                 f" errors {counters['errors']:,} | last id {checkpoint.last_id}")
+        print(line, flush=True)
+
+# --- job ---
+
+def chunked(rows: Iterable, size: int) -> Iterator[List]:
+    iterator = iter(rows)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+def run(args) -> int:
+    from app.db.database import habit_repo, close_pool
+
+    options = {"mode": args.mode, "language": args.language, "only_missing": args.only_missing}
+    if args.resume and os.path.exists(args.checkpoint):
+        checkpoint = Checkpoint.load(args.checkpoint)
+        if checkpoint.options and checkpoint.options != options:
+            print(f"⚠️ Checkpoint was written with {checkpoint.options}, resuming with {options}")
+        checkpoint.options = options
+        print(f"↩️ Resuming after habit id {checkpoint.last_id} ({checkpoint.counters['processed']:,} already processed)")
+    else:
+        if args.resume:
+            print(f"⚠️ No checkpoint at {args.checkpoint}, starting from the beginning")
+        checkpoint = Checkpoint(args.checkpoint, options=options)
+
+    total = None if args.no_count else habit_repo.count_habit_texts(checkpoint.last_id, args.only_missing)
+    if total is not None and args.max_rows:
+        total = min(total, args.max_rows)
+    print(f"🔁 Backfill with {args.workers} workers, batches of {args.batch_size}"
+          + (f", {total:,} habits to analyze" if total is not None else "")
+          + (" (dry run)" if args.dry_run else ""))
+
+    # Il generatore tiene una connessione del pool con il cursore aperto: va chiuso alla fine
+    texts = habit_repo.iter_habit_texts(checkpoint.last_id, args.only_missing, batch_size=args.batch_size * args.workers * 4)
+    rows = itertools.islice(texts, args.max_rows) if args.max_rows else texts
+
+    progress = Progress(total, args.progress_interval)
+    # Blocchi in volo, in ordine di id: il checkpoint avanza solo sul prefisso già scritto
+    pending: deque = deque()
+    max_pending = args.workers * 2
+    torch_threads = max(1, (os.cpu_count() or 1) // args.workers)
+
+    def write_oldest():
+        last_id, size, future = pending.popleft()
+        updates, errors = future.result()
+        if not args.dry_run:
+            result = habit_repo.update_analyses(updates)
+            checkpoint.counters["updated"] += result["updated"]
+            checkpoint.counters["unchanged"] += result["unchanged"]
+        for habit_id, error in errors:
+            print(f"❌ Habit {habit_id}: {error}")
+        checkpoint.counters["processed"] += size
+        checkpoint.counters["errors"] += len(errors)
+        checkpoint.last_id = last_id
+        if not args.dry_run:
+            checkpoint.save()
+        progress.advance(size, checkpoint)
+
+    pool = ProcessPoolExecutor(
+        max_workers=args.workers,
+        initializer=_init_worker,
+        initargs=(args.languages, args.mode, args.language, torch_threads),
+    )
+    try:
+        for batch in chunked(rows, args.batch_size):
+            pending.append((batch[-1][0], len(batch), pool.submit(analyze_batch, batch)))
+            while len(pending) >= max_pending:
+                write_oldest()
+        while pending:
+            write_oldest()
+    except KeyboardInterrupt:
+        print(f"\n⏸️ Interrupted after habit id {checkpoint.last_id}: rerun with --resume to continue")
+        for _, _, future in pending:
+            future.cancel()
+        return 130
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+        texts.close()
+        close_pool()
+
+    progress.advance(0, checkpoint, force=True)
+    print(f"✅ Backfill complete: {checkpoint.counters}")
+    return 0
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Re-analyze stored habits with the current NLP models and rules")
+    parser.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 2) - 1),
+                        help="analysis processes (default: cores - 1)")
+    parser.add_argument("--batch-size", type=int, default=256, help="texts per nlp.pipe/NER batch")
+    parser.add_argument("--mode", choices=["full", "tiered"], default=None,
+                        help="extraction mode (default: NLP_EXTRACTION_MODE)")
+    parser.add_argument("--language", default=None, help="language hint for every text (default: detected)")
+    parser.add_argument("--languages", default="", help="comma-separated languages to preload in each worker")
+    parser.add_argument("--only-missing", action="store_true", help="only habits without action or frequency")
+    parser.add_argument("--max-rows", type=int, default=None, help="stop after this many habits")
+    parser.add_argument("--dry-run", action="store_true", help="analyze without writing (no checkpoint)")
+    parser.add_argument("--checkpoint", default=DEFAULT_CHECKPOINT, help="checkpoint file")
+    parser.add_argument("--resume", action="store_true", help="continue after the id in the checkpoint")
+    parser.add_argument("--no-count", action="store_true", help="skip the initial count(*) (no percentage/ETA)")
+    parser.add_argument("--progress-interval", type=float, default=5.0, help="seconds between progress lines")
+    args = parser.parse_args()
+    args.languages = [lang.strip() for lang in args.languages.split(",") if lang.strip()]
+    if args.workers < 1 or args.batch_size < 1:
+        parser.error("--workers and --batch-size must be positive")
+    return run(args)
+
+if __name__ == "__main__":
+    sys.exit(main())
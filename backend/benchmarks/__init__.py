@@ -0,0 +1,6 @@
+# Benchmarks package
+import os
+import sys
+
+# I moduli NLP importano i loro pacchetti relativamente alla cartella app
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'app'))
@@ -0,0 +1,135 @@
+"""
+Load test in-process dell'app FastAPI: le richieste passano da httpx direttamente
+all'app ASGI (nessun socket) e il database è sostituito da uno stub in memoria,
+così si misura solo il costo di API + NLP.
+"""
+
+import asyncio
+import itertools
+import os
+import time
+from typing import Dict, List, Optional
+
+import httpx
+
+from app.db.habit_cache import HabitCache
+from benchmarks.common import distinct_texts, summarize
+
+class StubConnectionPool:
+    def fill(self):
+        pass
+
+class StubDatabaseConnection:
+    def __init__(self):
+        self.pool = StubConnectionPool()
+
+    def pool_stats(self) -> Dict:
+        return {"stub": True}
+
+class StubHabitRepository:
+    """Sostituto di HabitRepository che tiene le abitudini in una lista"""
+
+    def __init__(self):
+        self.db = StubDatabaseConnection()
+        # Cache disattivata: le letture andrebbero comunque allo stub
+        self.cache = HabitCache(max_size=0)
+        self.habits: List[Dict] = []
+        self._ids = itertools.count(1)
+
+    def create_habit(self, **kwargs) -> int:
+        habit_id = next(self._ids)
+        self.habits.append({"id": habit_id, **kwargs})
+        return habit_id
+
+    def create_habits(self, rows: List[Dict], returning: bool = True, synchronous_commit: bool = True) -> List[int]:
+        return [self.create_habit(**row) for row in rows]
+
+async def _worker(client: httpx.AsyncClient, requests: asyncio.Queue, latencies: List[float], errors: Dict[int, int]):
+    while True:
+        try:
+            path, payload = requests.get_nowait()
+        except asyncio.QueueEmpty:
+            return
+        start = time.perf_counter()
+        response = await client.post(path, json=payload)
+        latencies.append(time.perf_counter() - start)
+        if response.status_code != 200:
+            errors[response.status_code] = errors.get(response.status_code, 0) + 1
+
+async def _load_test(app, payloads: List[tuple], concurrency: int) -> Dict:
+    requests: asyncio.Queue = asyncio.Queue()
+    for item in payloads:
+        requests.put_nowait(item)
+
+    latencies: List[float] = []
+    errors: Dict[int, int] = {}
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        start = time.perf_counter()
+        await asyncio.gather(*(_worker(client, requests, latencies, errors) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+
+    stats = summarize(latencies)
+    stats["concurrency"] = concurrency
+    stats["wall_time_s"] = elapsed
+    stats["requests_per_sec"] = len(latencies) / elapsed if elapsed else 0.0
+    stats["errors"] = errors
+    return stats
+
+async def _run(corpus: Dict[str, List[str]], requests: int, concurrency_levels: List[int], batch_size: int) -> Dict:
+    from app.api import server
+
+    # Database sostituito dallo stub (senza i job periodici che lo userebbero)
+    server.habit_repo = StubHabitRepository()
+    os.environ.setdefault('LEADERBOARD_REFRESH_INTERVAL_S', '0')
+
+    # httpx non esegue gli eventi di startup/shutdown dell'app: li chiamiamo noi
+    for handler in server.app.router.on_startup:
+        await handler()
+    try:
+        texts = [text for lang_texts in corpus.values() for text in lang_texts]
+        # Warm-up: carica i modelli prima di misurare
+        await _load_test(server.app, [("/habits/analyze", {"text": text}) for text in texts], concurrency=1)
+
+        results = {}
+        single = [("/habits/analyze", {"text": text}) for text in distinct_texts(texts, requests)]
+        for concurrency in concurrency_levels:
+            results[f"analyze[c={concurrency}]"] = await _load_test(server.app, single, concurrency)
+
+        # Risposta compatta: stessi testi, solo azione, quantità e frequenza
+        compact = [("/habits/analyze?verbosity=compact", payload) for _, payload in single]
+        results[f"analyze_compact[c={concurrency_levels[-1]}]"] = await _load_test(
+            server.app, compact, concurrency_levels[-1])
+
+        batch_texts = iter(distinct_texts(texts, max(1, requests // batch_size) * batch_size))
+        batches = [
+            ("/habits/analyze/batch", {"texts": list(itertools.islice(batch_texts, batch_size))})
+            for _ in range(max(1, requests // batch_size))
+        ]
+        results[f"analyze_batch[size={batch_size}]"] = await _load_test(server.app, batches, concurrency_levels[0])
+        return results
+    finally:
+        for handler in server.app.router.on_shutdown:
+            await handler()
+
+def run_api_benchmarks(
+    corpus: Dict[str, List[str]],
+    requests: int = 200,
+    concurrency_levels: Optional[List[int]] = None,
+    batch_size: int = 8,
+    use_cache: bool = False,
+) -> Dict[str, Dict]:
+    """
+    Misura latenza e throughput di /habits/analyze a vari livelli di concorrenza
+    e di /habits/analyze/batch. Di default la cache delle analisi è disattivata,
+    altrimenti dopo il warm-up ogni richiesta sarebbe un hit.
+    """
+    from NLM.habit_nalyze import analysis_cache
+
+    max_size = analysis_cache.max_size
+    if not use_cache:
+        analysis_cache.max_size = 0
+    try:
+        return asyncio.run(_run(corpus, requests, concurrency_levels or [1, 8, 32], batch_size))
+    finally:
+        analysis_cache.max_size = max_size
@@ -0,0 +1,56 @@
+import json
+import os
+import statistics
+import time
+from typing import Callable, Dict, List
+
+DEFAULT_CORPUS_PATH = os.path.join(os.path.dirname(__file__), "data", "corpus.json")
+
+def load_corpus(path: str = DEFAULT_CORPUS_PATH) -> Dict[str, List[str]]:
+    """Corpus bilingue: {"en": [...], "it": [...]}"""
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+def distinct_texts(texts: List[str], count: int) -> List[str]:
+    """
+    `count` testi tutti diversi dal corpus: al giro k ogni testo ha k spazi in
+    coda. L'analisi non cambia, ma richieste concorrenti con lo stesso testo
+    non vengono unite dal single-flight dell'AdmissionController, che
+    altrimenti gonfierebbe il throughput misurato.
+    """
+    return [f"{texts[i % len(texts)]}{' ' * (i // len(texts))}" for i in range(count)]
+
+def percentile(sorted_samples: List[float], pct: float) -> float:
+    if not sorted_samples:
+        return 0.0
+    index = min(len(sorted_samples) - 1, max(0, round(pct / 100 * (len(sorted_samples) - 1))))
+    return sorted_samples[index]
+
+def summarize(samples: List[float]) -> Dict[str, float]:
+    """Statistiche di latenza in millisecondi da una lista di durate in secondi"""
+    ms = sorted(s * 1000 for s in samples)
+    total = sum(samples)
+    return {
+        "count": len(ms),
+        "mean_ms": statistics.fmean(ms) if ms else 0.0,
+        "p50_ms": percentile(ms, 50),
+        "p95_ms": percentile(ms, 95),
+        "p99_ms": percentile(ms, 99),
+        "min_ms": ms[0] if ms else 0.0,
+        "max_ms": ms[-1] if ms else 0.0,
+        "ops_per_sec": len(ms) / total if total else 0.0,
+    }
+
+def time_calls(fn: Callable, inputs: List, iterations: int, warmup: int = 1) -> Dict[str, float]:
+    """Esegue fn su ogni input `iterations` volte (dopo `warmup` giri a vuoto) e ne misura la latenza"""
+    for _ in range(warmup):
+        for item in inputs:
+            fn(item)
+
+    samples = []
+    for _ in range(iterations):
+        for item in inputs:
+            start = time.perf_counter()
+            fn(item)
+            samples.append(time.perf_counter() - start)
+    return summarize(samples)
@@ -0,0 +1,78 @@
+"""
+Microbenchmark per le singole fasi di extract_habits_ml.
+Ogni fase è misurata separatamente, su input già preparati dalle fasi precedenti.
+"""
+
+from typing import Dict, List
+
+from benchmarks.common import time_calls
+from NLM.habit_nalyze import analysis_cache, detect_language_code, extract_habits_ml_batch, get_extractor
+from NLM.language_detect import get_detector
+from NLM.segmentation import extract_habits_segmented
+from NLM.model_registry import registry
+
+def run_pipeline_benchmarks(corpus: Dict[str, List[str]], iterations: int = 20) -> Dict[str, Dict]:
+    """Restituisce {fase: statistiche} per ogni fase e lingua del corpus"""
+    extractor = get_extractor()
+    results: Dict[str, Dict] = {}
+
+    # Caricamento modelli escluso dalle misure (i tempi sono in registry.status())
+    registry.warm_up(list(corpus))
+
+    all_texts = [text for texts in corpus.values() for text in texts]
+    # detect_language senza cache, per misurare il costo reale del rilevamento
+    detector = get_detector()
+    results["detect_language"] = _time(lambda text: detector._detect(" ".join(text.lower().split())), all_texts, iterations)
+    results["detect_language_cached"] = _time(detect_language_code, all_texts, iterations)
+
+    for lang, texts in corpus.items():
+        nlp = registry.get_spacy(lang)
+        if nlp is None:
+            continue
+        docs = [nlp(text) for text in texts]
+
+        results[f"spacy_parse[{lang}]"] = _time(nlp, texts, iterations)
+        results[f"spacy_pipe[{lang}]"] = _time_batch(lambda batch: list(nlp.pipe(batch)), texts, iterations)
+        results[f"extract_with_transformer[{lang}]"] = _time(
+            lambda text: extractor.extract_with_transformer(text, lang), texts, iterations)
+        results[f"extract_with_transformer_batch[{lang}]"] = _time_batch(
+            lambda batch: extractor.extract_with_transformer_batch(batch, lang), texts, iterations)
+        results[f"extract_numbers_and_units[{lang}]"] = _time(extractor.extract_numbers_and_units, docs, iterations)
+        results[f"extract_frequency_with_ml[{lang}]"] = _time(
+            lambda doc: extractor.extract_frequency_with_ml(doc.text, doc), docs, iterations)
+
+    # Pipeline completa, senza cache dei risultati
+    results["extract_habits_ml_batch"] = _time_batch(
+        lambda batch: extract_habits_ml_batch(batch), all_texts, iterations, disable_cache=True)
+    # Solo i campi compatti: niente elenco entità, NER solo se manca il target
+    results["extract_habits_ml_batch[detail=core]"] = _time_batch(
+        lambda batch: extract_habits_ml_batch(batch, detail="core"), all_texts, iterations, disable_cache=True)
+
+    # Paragrafo con tutte le abitudini della lingua: testo intero contro un'analisi per segmento
+    for lang, texts in corpus.items():
+        if registry.get_spacy(lang) is None:
+            continue
+        paragraph = " ".join(text.rstrip(".") + "." for text in texts)
+        results[f"paragraph_whole[{lang}]"] = _time_batch(
+            lambda batch: extract_habits_ml_batch(batch, language=lang), [paragraph], iterations, disable_cache=True)
+        results[f"paragraph_segmented[{lang}]"] = _time_batch(
+            lambda batch: [extract_habits_segmented(text, language=lang) for text in batch],
+            [paragraph], iterations, disable_cache=True)
+    return results
+
+def _time(fn, inputs, iterations):
+    return time_calls(fn, inputs, iterations)
+
+def _time_batch(fn, inputs, iterations, disable_cache=False):
+    """Misura fn chiamata una volta sull'intero batch; texts_per_sec è in testi al secondo"""
+    max_size = analysis_cache.max_size
+    if disable_cache:
+        analysis_cache.max_size = 0
+    try:
+        stats = time_calls(fn, [inputs], iterations)
+    finally:
+        analysis_cache.max_size = max_size
+
+    stats["batch_size"] = len(inputs)
+    stats["texts_per_sec"] = stats["ops_per_sec"] * len(inputs)
+    return stats
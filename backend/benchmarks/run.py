@@ -0,0 +1,144 @@
+"""
+Esegue i benchmark e salva i risultati in JSON, opzionalmente confrontandoli con una baseline.
+
+Uso (dalla cartella backend):
+    python -m benchmarks.run --suite all --output benchmarks/results/current.json
+    python -m benchmarks.run --suite pipeline --baseline benchmarks/results/baseline.json --fail-threshold 0.15
+    python -m benchmarks.run --suite workers --workers 1,2,4 --compare-preload
+
+La suite workers avvia gunicorn e richiede un database (non fa parte di "all").
+"""
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+from typing import Dict, List
+
+from benchmarks.common import DEFAULT_CORPUS_PATH, load_corpus
+
+# Metriche confrontate con la baseline: per le latenze più basso è meglio, per il throughput più alto
+LOWER_IS_BETTER = ("mean_ms", "p50_ms", "p95_ms", "p99_ms")
+HIGHER_IS_BETTER = ("ops_per_sec", "texts_per_sec", "requests_per_sec")
+
+def _git_commit() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], text=True, stderr=subprocess.DEVNULL).strip()
+    except Exception:
+        return "unknown"
+
+def _metadata(args) -> Dict:
+    env = {name: value for name, value in os.environ.items()
+           if name.startswith(("NLP_", "ANALYSIS_CACHE_", "DB_", "GUNICORN_", "WEB_CONCURRENCY"))}
+    env.pop("DB_PASSWORD", None)
+    return {
+        "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "git_commit": _git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "suite": args.suite,
+        "iterations": args.iterations,
+        "requests": args.requests,
+        "env": env,
+    }
+
+def compare(current: Dict[str, Dict], baseline: Dict[str, Dict]) -> List[Dict]:
+    """Variazione relativa di ogni metrica rispetto alla baseline (positiva = peggioramento)"""
+    rows = []
+    for name, stats in current.items():
+        base = baseline.get(name)
+        if not isinstance(stats, dict) or not isinstance(base, dict):
+            continue
+        for metric in LOWER_IS_BETTER + HIGHER_IS_BETTER:
+            if metric not in stats or not base.get(metric):
+                continue
+            change = (stats[metric] - base[metric]) / base[metric]
+            regression = change if metric in LOWER_IS_BETTER else -change
+            rows.append({
+                "benchmark": name,
+                "metric": metric,
+                "baseline": base[metric],
+                "current": stats[metric],
+                "regression": regression,
+            })
+    return rows
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="HabitForge analysis benchmarks")
+    parser.add_argument("--suite", choices=["pipeline", "api", "workers", "all"], default="all")
+    parser.add_argument("--corpus", default=DEFAULT_CORPUS_PATH)
+    parser.add_argument("--iterations", type=int, default=20, help="iterations per stage (pipeline suite)")
+    parser.add_argument("--requests", type=int, default=200, help="requests per concurrency level (api suite)")
+    parser.add_argument("--concurrency", default="1,8,32", help="comma-separated concurrency levels (api suite)")
+    parser.add_argument("--workers", default="1,2,4", help="comma-separated worker counts (workers suite)")
+    parser.add_argument("--compare-preload", action="store_true",
+                        help="also run every worker count without preloading the models (workers suite)")
+    parser.add_argument("--use-cache", action="store_true", help="keep the analysis cache enabled in the api suite")
+    parser.add_argument("--output", default=None, help="where to write the JSON results")
+    parser.add_argument("--baseline", default=None, help="previous results JSON to compare against")
+    parser.add_argument("--fail-threshold", type=float, default=None,
+                        help="exit with 1 if any metric regresses more than this fraction (e.g. 0.15)")
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.corpus)
+    results: Dict[str, Dict] = {}
+
+    if args.suite in ("pipeline", "all"):
+        from benchmarks.pipeline_bench import run_pipeline_benchmarks
+        results.update({f"pipeline.{k}": v for k, v in run_pipeline_benchmarks(corpus, args.iterations).items()})
+
+    if args.suite in ("api", "all"):
+        from benchmarks.api_bench import run_api_benchmarks
+        levels = [int(level) for level in args.concurrency.split(",") if level.strip()]
+        results.update({f"api.{k}": v for k, v in run_api_benchmarks(
+            corpus, requests=args.requests, concurrency_levels=levels, use_cache=args.use_cache).items()})
+
+    if args.suite == "workers":
+        from benchmarks.workers_bench import run_workers_benchmarks
+        results.update(run_workers_benchmarks(
+            corpus,
+            worker_counts=[int(n) for n in args.workers.split(",") if n.strip()],
+            requests=args.requests,
+            concurrency=int(args.concurrency.split(",")[-1]),
+            compare_preload=args.compare_preload,
+        ))
+
+    from NLM.model_registry import registry
+    report = {"metadata": _metadata(args), "models": registry.status(), "results": results}
+
+    output = args.output or os.path.join(
+        os.path.dirname(__file__), "results", f"{datetime.datetime.now():%Y%m%d-%H%M%S}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, default=str)
+    print(f"✅ Results written to {output}")
+
+    for name, stats in results.items():
+        line = f"{name:55s} mean {stats.get('mean_ms', 0):9.2f} ms   p95 {stats.get('p95_ms', 0):9.2f} ms"
+        if "memory_loaded" in stats:
+            memory = stats["memory_loaded"]
+            line += (f"   {stats['requests_per_sec']:8.1f} req/s   total PSS {memory['total_pss_mb']:8.1f} MB"
+                     f"   per-worker private {memory['worker_private_mb']:7.1f} MB")
+        print(line)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)["results"]
+        rows = compare(results, baseline)
+        print("\nComparison with baseline (positive = slower):")
+        for row in rows:
+            print(f"{row['benchmark']:55s} {row['metric']:16s} {row['regression'] * 100:+7.1f}%")
+
+        if args.fail_threshold is not None:
+            regressions = [row for row in rows if row["regression"] > args.fail_threshold]
+            if regressions:
+                print(f"❌ {len(regressions)} metrics regressed more than {args.fail_threshold * 100:.0f}%")
+                return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,174 @@
+"""
+Scalabilità della modalità produzione: avvia gunicorn (gunicorn.conf.py) con
+un numero crescente di worker, con e senza preload dei modelli nel master,
+e per ogni configurazione misura:
+
+- memoria di master e worker da /proc/<pid>/smaps_rollup (solo Linux):
+  PSS (la memoria condivisa divisa tra i processi che la usano, quindi la
+  somma è la memoria realmente occupata), privata e condivisa per worker
+- throughput e latenza di /habits/analyze via HTTP reale
+
+Serve un database raggiungibile (variabili DB_*), perché /habits/analyze salva
+le abitudini; la cache delle analisi viene disattivata.
+"""
+
+import asyncio
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+from typing import Dict, List
+
+import httpx
+
+from benchmarks.common import distinct_texts, summarize
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def _children(pid: int) -> List[int]:
+    children = []
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                # Il nome del processo può contenere spazi: i campi dopo ')' sono fissi
+                fields = f.read().rsplit(")", 1)[1].split()
+        except OSError:
+            continue
+        if int(fields[1]) == pid:
+            children.append(int(entry))
+    return children
+
+def _memory_kb(pid: int) -> Dict[str, int]:
+    values: Dict[str, int] = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) >= 3 and parts[2] == "kB":
+                values[parts[0].rstrip(":")] = int(parts[1])
+    return {
+        "rss": values.get("Rss", 0),
+        "pss": values.get("Pss", 0),
+        "private": values.get("Private_Clean", 0) + values.get("Private_Dirty", 0),
+        "shared": values.get("Shared_Clean", 0) + values.get("Shared_Dirty", 0),
+    }
+
+def _memory_report(master_pid: int) -> Dict:
+    workers = [_memory_kb(pid) for pid in _children(master_pid)]
+    master = _memory_kb(master_pid)
+    mb = lambda kb: round(kb / 1024, 1)
+    return {
+        "workers_found": len(workers),
+        "total_pss_mb": mb(master["pss"] + sum(w["pss"] for w in workers)),
+        "master_rss_mb": mb(master["rss"]),
+        "worker_rss_mb": mb(sum(w["rss"] for w in workers) / len(workers)) if workers else 0.0,
+        "worker_pss_mb": mb(sum(w["pss"] for w in workers) / len(workers)) if workers else 0.0,
+        "worker_private_mb": mb(sum(w["private"] for w in workers) / len(workers)) if workers else 0.0,
+        "worker_shared_mb": mb(sum(w["shared"] for w in workers) / len(workers)) if workers else 0.0,
+    }
+
+async def _wait_ready(base_url: str, timeout: float) -> bool:
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient(base_url=base_url, timeout=5) as client:
+        while time.monotonic() < deadline:
+            try:
+                if (await client.get("/ready")).status_code == 200:
+                    return True
+            except httpx.TransportError:
+                pass
+            await asyncio.sleep(0.5)
+    return False
+
+async def _load(base_url: str, texts: List[str], requests: int, concurrency: int) -> Dict:
+    queue: asyncio.Queue = asyncio.Queue()
+    # Testi tutti diversi: il single-flight non unisce richieste concorrenti
+    for text in distinct_texts(texts, requests):
+        queue.put_nowait(text)
+    latencies: List[float] = []
+    errors: Dict[int, int] = {}
+
+    async def worker(client: httpx.AsyncClient):
+        while True:
+            try:
+                text = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            start = time.perf_counter()
+            response = await client.post("/habits/analyze", json={"text": text})
+            latencies.append(time.perf_counter() - start)
+            if response.status_code != 200:
+                errors[response.status_code] = errors.get(response.status_code, 0) + 1
+
+    limits = httpx.Limits(max_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, timeout=None, limits=limits) as client:
+        start = time.perf_counter()
+        await asyncio.gather(*(worker(client) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+
+    stats = summarize(latencies)
+    stats["concurrency"] = concurrency
+    stats["requests_per_sec"] = len(latencies) / elapsed if elapsed else 0.0
+    stats["errors"] = errors
+    return stats
+
+def _run_config(texts: List[str], workers: int, preload: bool, requests: int, concurrency: int,
+                ready_timeout: float) -> Dict:
+    port = _free_port()
+    env = {
+        **os.environ,
+        "WEB_CONCURRENCY": str(workers),
+        "GUNICORN_BIND": f"127.0.0.1:{port}",
+        "GUNICORN_PRELOAD": "1" if preload else "0",
+        "ANALYSIS_CACHE_SIZE": "0",
+    }
+    process = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "app.api.server:app"],
+        cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        started = time.perf_counter()
+        if not asyncio.run(_wait_ready(base_url, ready_timeout)):
+            raise RuntimeError(f"Server with {workers} workers not ready after {ready_timeout}s")
+        result = {"workers": workers, "preload": preload, "startup_s": time.perf_counter() - started}
+        result["memory_idle"] = _memory_report(process.pid)
+
+        # Warm-up: ogni worker carica i modelli (senza preload) o tocca le pagine condivise
+        asyncio.run(_load(base_url, texts, max(len(texts), workers * 4), concurrency))
+        result.update(asyncio.run(_load(base_url, texts, requests, concurrency)))
+        result["memory_loaded"] = _memory_report(process.pid)
+        return result
+    finally:
+        process.send_signal(signal.SIGTERM)
+        try:
+            process.wait(timeout=60)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+def run_workers_benchmarks(
+    corpus: Dict[str, List[str]],
+    worker_counts: List[int],
+    requests: int = 200,
+    concurrency: int = 16,
+    compare_preload: bool = False,
+    ready_timeout: float = 300.0,
+) -> Dict[str, Dict]:
+    """{"workers[n=..,preload=..]": statistiche} per ogni configurazione"""
+    if not os.path.exists("/proc/self/smaps_rollup"):
+        raise RuntimeError("The workers benchmark needs Linux (/proc/<pid>/smaps_rollup)")
+
+    texts = [text for lang_texts in corpus.values() for text in lang_texts]
+    results = {}
+    for preload in ([True, False] if compare_preload else [True]):
+        for workers in worker_counts:
+            results[f"workers[n={workers},preload={preload}]"] = _run_config(
+                texts, workers, preload, requests, concurrency, ready_timeout)
+    return results
@@ -0,0 +1,87 @@
+"""
+Configurazione gunicorn per la modalità produzione (python main.py --prod).
+
+Con preload_app l'app e i modelli NLP vengono caricati una sola volta nel
+processo master, prima del fork: i worker condividono i pesi copy-on-write
+invece di caricarne una copia ciascuno. Ogni worker usa poi un numero
+limitato di thread torch, così N worker non si contendono gli stessi core.
+
+Variabili d'ambiente:
+    GUNICORN_BIND        indirizzo di ascolto (default 0.0.0.0:8000)
+    WEB_CONCURRENCY      numero di worker (default: metà dei core, almeno 2)
+    GUNICORN_PRELOAD     0 per caricare app e modelli in ogni worker (per confronto)
+    NLP_TORCH_THREADS    thread intra-op torch per worker (default: core / worker)
+    PROMETHEUS_MULTIPROC_DIR  directory dei file delle metriche condivise tra i worker
+                              (default: <tmp>/habitforge-prometheus, svuotata all'avvio)
+    GUNICORN_TIMEOUT, GUNICORN_GRACEFUL_TIMEOUT, GUNICORN_MAX_REQUESTS
+"""
+
+import gc
+import glob
+import os
+import tempfile
+
+cpu_count = os.cpu_count() or 1
+
+bind = os.getenv("GUNICORN_BIND", "0.0.0.0:8000")
+workers = int(os.getenv("WEB_CONCURRENCY", str(max(2, cpu_count // 2))))
+worker_class = "uvicorn.workers.UvicornWorker"
+preload_app = os.getenv("GUNICORN_PRELOAD", "1") != "0"
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "60"))
+# Lascia il tempo allo shutdown di svuotare la coda di scrittura differita
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", "30"))
+keepalive = 5
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", "0"))
+max_requests_jitter = max_requests // 10
+accesslog = "-"
+
+torch_threads = int(os.getenv("NLP_TORCH_THREADS", str(max(1, cpu_count // workers))))
+
+# Devono essere impostate prima che torch venga importato (cioè prima del preload dell'app)
+os.environ.setdefault("OMP_NUM_THREADS", str(torch_threads))
+os.environ.setdefault("MKL_NUM_THREADS", str(torch_threads))
+# Un batch di inferenza alla volta per worker: il parallelismo lo danno i worker e i thread torch
+os.environ.setdefault("NLP_EXECUTOR_WORKERS", "1")
+# I tokenizer fast creano un pool di thread che non sopravvive al fork
+os.environ.setdefault("TOKENIZERS_PARALLELISM", "false")
+
+# Metriche Prometheus in modalità multiprocesso: ogni worker scrive i propri
+# valori in questa directory e /metrics li aggrega, qualunque worker risponda.
+# Va impostata prima che prometheus_client venga importato (preload dell'app);
+# i file di un'esecuzione precedente vanno rimossi, non al reload della config.
+prometheus_dir = os.environ.setdefault(
+    "PROMETHEUS_MULTIPROC_DIR", os.path.join(tempfile.gettempdir(), "habitforge-prometheus"))
+if not os.environ.get("_HABITFORGE_PROMETHEUS_READY"):
+    os.makedirs(prometheus_dir, exist_ok=True)
+    for path in glob.glob(os.path.join(prometheus_dir, "*.db")):
+        os.remove(path)
+    os.environ["_HABITFORGE_PROMETHEUS_READY"] = "1"
+
+def on_starting(server):
+    """Nel master, prima del fork: carica i modelli e congela gli oggetti nel GC"""
+    if not preload_app:
+        return
+    from app.api import server as api_server
+
+    if api_server.NLP_AVAILABLE:
+        loaded = api_server.registry.warm_up()
+        server.log.info(f"Models loaded in the master process: {loaded}")
+
+    # Il GC non deve riscrivere le pagine degli oggetti ereditati (romperebbe il copy-on-write)
+    gc.collect()
+    gc.freeze()
+    server.log.info(f"Frozen {gc.get_freeze_count()} objects before forking {workers} workers")
+
+def post_fork(server, worker):
+    try:
+        import torch
+    except ImportError:
+        return
+    torch.set_num_threads(torch_threads)
+    server.log.info(f"Worker {worker.pid}: torch intra-op threads = {torch_threads}")
+
+def child_exit(server, worker):
+    """Nel master, all'uscita di un worker: i suoi gauge non contano più tra i vivi"""
+    from prometheus_client import multiprocess
+
+    multiprocess.mark_process_dead(worker.pid)
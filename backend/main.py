@@ -1,16 +1,37 @@
 #!/usr/bin/env python3
 """
 HabitForge Backend Entry Point
+
+    python main.py          sviluppo: uvicorn con reload, un solo processo
+    python main.py --prod   produzione: gunicorn con più worker e modelli
+                            precaricati nel master (vedi gunicorn.conf.py)
 """
 
+import argparse
+import os
+import sys
+
 import uvicorn
-from app.api.server import app
+
+def run_production():
+    """Sostituisce il processo corrente con gunicorn, configurato da gunicorn.conf.py"""
+    backend_dir = os.path.dirname(os.path.abspath(__file__))
+    os.chdir(backend_dir)
+    config = os.path.join(backend_dir, "gunicorn.conf.py")
+    os.execvp(sys.executable, [sys.executable, "-m", "gunicorn", "-c", config, "app.api.server:app"])
 
 if __name__ == "__main__":
-    uvicorn.run(
-        "app.api.server:app",
-        host="0.0.0.0",
-        port=8000,
-        reload=True,
-        log_level="info"
-    )
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="HabitForge backend")
+    parser.add_argument("--prod", action="store_true", help="multi-worker production server (gunicorn)")
+    args = parser.parse_args()
+
+    if args.prod:
+        run_production()
+    else:
+        uvicorn.run(
+            "app.api.server:app",
+            host="0.0.0.0",
+            port=8000,
+            reload=True,
+            log_level="info"
+        )
@@ -0,0 +1,23 @@
+import os
+import sys
+
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+# Il modulo NLM si importa come pacchetto di primo livello (come in app/api/server.py)
+sys.path.insert(0, os.path.join(BACKEND_DIR, "app"))
+
+
+@pytest.fixture
+def cursor():
+    """Cursore su Postgres (variabili DB_*); tutto viene annullato a fine test"""
+    from app.db.database import DatabaseConnection
+
+    db = DatabaseConnection()
+    if not db.test_connection():
+        pytest.skip("Postgres not reachable (DB_* variables)")
+    with db.get_connection() as conn:
+        with conn.cursor() as cursor:
+            yield cursor
+        conn.rollback()
@@ -0,0 +1,139 @@
+import asyncio
+
+import pytest
+
+from app.api.admission import AdmissionController, AdmissionRejected, DeadlineExceeded
+
+
+class StubAnalysis:
+    """submit_fn that waits until its text is released and records calls and cancellations"""
+
+    def __init__(self):
+        self.calls = []
+        self.cancelled = []
+        self._gates = {}
+
+    def _gate(self, text) -> asyncio.Event:
+        return self._gates.setdefault(text, asyncio.Event())
+
+    def release(self, text):
+        self._gate(text).set()
+
+    async def __call__(self, text, **options):
+        self.calls.append((text, options))
+        try:
+            await self._gate(text).wait()
+        except asyncio.CancelledError:
+            self.cancelled.append(text)
+            raise
+        return f"analysis:{text}"
+
+
+def in_ms(ms: float) -> float:
+    return asyncio.get_running_loop().time() + ms / 1000
+
+
+def test_identical_requests_share_one_analysis():
+    stub = StubAnalysis()
+    admission = AdmissionController(stub)
+
+    async def scenario():
+        waiting = [
+            asyncio.ensure_future(admission.submit("a", language="en")),
+            asyncio.ensure_future(admission.submit("a", language="en")),
+            asyncio.ensure_future(admission.submit("a", language="it")),
+        ]
+        await asyncio.sleep(0)
+        stub.release("a")
+        return await asyncio.gather(*waiting)
+
+    assert asyncio.run(scenario()) == ["analysis:a"] * 3
+    assert stub.calls == [("a", {"language": "en"}), ("a", {"language": "it"})]
+    stats = admission.stats()
+    assert (stats["admitted"], stats["coalesced"], stats["in_flight"]) == (2, 1, 0)
+
+
+def test_new_work_beyond_max_inflight_is_rejected():
+    stub = StubAnalysis()
+    admission = AdmissionController(stub, max_inflight=1, retry_after=2.5)
+
+    async def scenario():
+        running = asyncio.ensure_future(admission.submit("a"))
+        await asyncio.sleep(0)
+        with pytest.raises(AdmissionRejected) as rejected:
+            await admission.submit("b")
+        assert rejected.value.retry_after == 2.5
+        # A batch is admitted all together or not at all
+        with pytest.raises(AdmissionRejected):
+            await admission.submit_many(["a", "b"])
+        # Joining the running analysis adds no work
+        joined = asyncio.ensure_future(admission.submit("a"))
+        await asyncio.sleep(0)
+        stub.release("a")
+        return await asyncio.gather(running, joined)
+
+    assert asyncio.run(scenario()) == ["analysis:a", "analysis:a"]
+    assert stub.calls == [("a", {})]
+    assert admission.stats()["rejected"] == 2
+    assert admission.retry_after_header == "3"
+
+
+def test_deadline_cancels_an_analysis_nobody_waits_for():
+    stub = StubAnalysis()
+    admission = AdmissionController(stub)
+
+    async def scenario():
+        with pytest.raises(DeadlineExceeded):
+            await admission.submit("a", deadline=in_ms(20))
+        await asyncio.sleep(0)
+        # Already expired: rejected before any work starts
+        with pytest.raises(DeadlineExceeded):
+            await admission.submit("b", deadline=in_ms(-1))
+
+    asyncio.run(scenario())
+    assert stub.cancelled == ["a"]
+    assert [text for text, _ in stub.calls] == ["a"]
+    stats = admission.stats()
+    assert (stats["deadline_exceeded"], stats["cancelled"], stats["in_flight"]) == (2, 1, 0)
+
+
+def test_analysis_survives_until_its_last_waiter_leaves():
+    stub = StubAnalysis()
+    admission = AdmissionController(stub)
+
+    async def scenario():
+        patient = asyncio.ensure_future(admission.submit("a"))
+        await asyncio.sleep(0)
+        with pytest.raises(DeadlineExceeded):
+            await admission.submit("a", deadline=in_ms(20))
+        # The other request still waits: the analysis goes on
+        assert stub.cancelled == []
+        assert admission.stats()["in_flight"] == 1
+
+        stub.release("a")
+        assert await patient == "analysis:a"
+
+        # Once everybody has gone, the next request starts a new analysis
+        impatient = [asyncio.ensure_future(admission.submit("b", deadline=in_ms(20))) for _ in range(2)]
+        results = await asyncio.gather(*impatient, return_exceptions=True)
+        assert all(isinstance(result, DeadlineExceeded) for result in results)
+        await asyncio.sleep(0)
+        assert stub.cancelled == ["b"]
+
+        retry = asyncio.ensure_future(admission.submit("b"))
+        await asyncio.sleep(0)
+        stub.release("b")
+        assert await retry == "analysis:b"
+
+    asyncio.run(scenario())
+    assert [text for text, _ in stub.calls] == ["a", "b", "b"]
+    assert admission.stats()["cancelled"] == 1
+
+
+def test_overload_errors_map_to_503_and_504():
+    from app.api import server
+
+    rejected = server.overloaded_error(AdmissionRejected("busy", 1.0))
+    assert rejected.status_code == 503
+    assert rejected.headers["Retry-After"] == (server.admission.retry_after_header if server.admission else "1")
+    assert server.overloaded_error(DeadlineExceeded("late")).status_code == 504
@@ -0,0 +1,18 @@
+from NLM.analysis_cache import AnalysisCache, make_cache_key
+
+
+def test_differently_cased_texts_do_not_share_an_entry():
+    cache = AnalysisCache(max_size=10)
+    cache.set("Read Dune daily", "en", {"text": "Read Dune daily", "target": "Dune"})
+
+    assert cache.get("read dune daily", "en") is None
+    assert make_cache_key("Read Dune daily", "en") != make_cache_key("read dune daily", "en")
+
+
+def test_unicode_and_whitespace_variants_share_an_entry():
+    cache = AnalysisCache(max_size=10)
+    cache.set("Read  Dune\tdaily ", "en", {"text": "Read  Dune\tdaily ", "target": "Dune"})
+
+    result = cache.get("Read Dune daily", "en")
+    assert result == {"text": "Read Dune daily", "target": "Dune"}
+    assert make_cache_key("ﬁve km", "en") == make_cache_key("five km", "en")
@@ -0,0 +1,134 @@
+import argparse
+import json
+from concurrent.futures import Future
+
+import pytest
+
+import backfill
+from backfill import Checkpoint, analyze_batch, chunked
+from NLM import habit_nalyze
+from app.db import database
+
+
+def fake_extract(texts, language=None, mode=None):
+    """extract_habits_ml_batch senza modelli: fallisce se un testo del blocco contiene "boom" """
+    if any("boom" in text for text in texts):
+        raise ValueError("bad text")
+    return [{"action": text, "frequency_count": 1, "frequency_period": 7, "language": "en", "ml_confidence": 0.5}
+            for text in texts]
+
+
+@pytest.fixture(autouse=True)
+def stub_extractor(monkeypatch):
+    monkeypatch.setattr(habit_nalyze, "extract_habits_ml_batch", fake_extract)
+
+
+def test_chunked():
+    assert list(chunked(range(5), 2)) == [[0, 1], [2, 3], [4]]
+    assert list(chunked([], 2)) == []
+
+
+def test_checkpoint_round_trip(tmp_path):
+    path = str(tmp_path / "checkpoint.json")
+    checkpoint = Checkpoint(path, options={"mode": None})
+    checkpoint.last_id = 42
+    checkpoint.counters["processed"] = 10
+
+    checkpoint.save()
+    loaded = Checkpoint.load(path)
+
+    assert (loaded.last_id, loaded.counters["processed"], loaded.options) == (42, 10, {"mode": None})
+    assert [p.name for p in tmp_path.iterdir()] == ["checkpoint.json"]
+
+
+def test_failed_save_keeps_the_previous_checkpoint(tmp_path, monkeypatch):
+    path = str(tmp_path / "checkpoint.json")
+    checkpoint = Checkpoint(path, last_id=1)
+    checkpoint.save()
+
+    def crash(data, f, **kwargs):
+        f.write('{"last_id": ')
+        raise OSError("disk full")
+
+    monkeypatch.setattr(backfill.json, "dump", crash)
+    checkpoint.last_id = 2
+    with pytest.raises(OSError):
+        checkpoint.save()
+
+    assert Checkpoint.load(path).last_id == 1
+
+
+def test_bad_text_does_not_lose_the_batch():
+    updates, errors = analyze_batch([(1, "run"), (2, "boom"), (3, "read")])
+
+    assert [row[0] for row in updates] == [1, 3]
+    assert updates[0][1:] == ("run", None, None, 1, 7, "en", 0.5)
+    assert errors == [(2, "bad text")]
+
+
+class InlinePool:
+    """ProcessPoolExecutor che analizza nel processo del test"""
+
+    def __init__(self, max_workers, initializer, initargs):
+        pass
+
+    def submit(self, fn, *args):
+        future = Future()
+        future.set_result(fn(*args))
+        return future
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        pass
+
+
+class StubRepo:
+    """habit_repo con i testi in memoria; update_analyses fallisce al blocco `fail_at`"""
+
+    def __init__(self, texts, fail_at=None):
+        self.texts = texts
+        self.fail_at = fail_at
+        self.writes = []
+
+    def count_habit_texts(self, after_id=0, only_missing=False):
+        return sum(1 for habit_id, _ in self.texts if habit_id > after_id)
+
+    def iter_habit_texts(self, after_id=0, only_missing=False, batch_size=5000):
+        return (row for row in self.texts if row[0] > after_id)
+
+    def update_analyses(self, rows):
+        if len(self.writes) == self.fail_at:
+            raise RuntimeError("connection lost")
+        self.writes.append([row[0] for row in rows])
+        return {"updated": len(rows), "unchanged": 0}
+
+
+def run_backfill(monkeypatch, tmp_path, repo, resume=False):
+    monkeypatch.setattr(backfill, "ProcessPoolExecutor", InlinePool)
+    monkeypatch.setattr(database, "habit_repo", repo)
+    monkeypatch.setattr(database, "close_pool", lambda: None)
+    args = argparse.Namespace(
+        workers=2, batch_size=2, mode=None, language=None, languages=[], only_missing=False,
+        max_rows=None, dry_run=False, checkpoint=str(tmp_path / "checkpoint.json"), resume=resume,
+        no_count=False, progress_interval=60.0,
+    )
+    return backfill.run(args)
+
+
+def test_checkpoint_covers_only_the_written_prefix(monkeypatch, tmp_path):
+    texts = [(i, f"habit {i}") for i in range(1, 8)]
+    # Quattro blocchi in volo: la scrittura del secondo fallisce
+    failing = StubRepo(texts, fail_at=1)
+
+    with pytest.raises(RuntimeError):
+        run_backfill(monkeypatch, tmp_path, failing)
+
+    with open(tmp_path / "checkpoint.json", encoding="utf-8") as f:
+        saved = json.load(f)
+    assert failing.writes == [[1, 2]]
+    assert (saved["last_id"], saved["counters"]["processed"]) == (2, 2)
+
+    # La ripresa riparte dopo l'ultimo blocco scritto
+    repo = StubRepo(texts)
+    assert run_backfill(monkeypatch, tmp_path, repo, resume=True) == 0
+    assert repo.writes == [[3, 4], [5, 6], [7]]
+    assert Checkpoint.load(str(tmp_path / "checkpoint.json")).counters["processed"] == 7
@@ -0,0 +1,114 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from app.api.batching import MicroBatcher
+from app.api.executor import BoundedExecutor, WorkerPoolFull
+
+
+class FakeBatch:
+    """batch_fn that records its calls and tags each text with its language option"""
+
+    def __init__(self, delay: float = 0.0, release: threading.Event = None):
+        self.calls = []
+        self.delay = delay
+        self.release = release
+        self.running = 0
+        self.max_running = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, texts, **options):
+        with self._lock:
+            self.calls.append((list(texts), options))
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+        if self.release is not None:
+            self.release.wait(5)
+        time.sleep(self.delay)
+        with self._lock:
+            self.running -= 1
+        return [f"{options.get('language', '-')}:{text}" for text in texts]
+
+
+def run_with(batcher, scenario):
+    async def main():
+        try:
+            return await scenario()
+        finally:
+            await batcher.stop()
+    return asyncio.run(main())
+
+
+def test_requests_are_grouped_by_options():
+    batch_fn = FakeBatch()
+    batcher = MicroBatcher(batch_fn, max_batch_size=16, max_wait_ms=50)
+
+    async def scenario():
+        return await asyncio.gather(
+            batcher.submit("a", language="en"),
+            batcher.submit("b", language="it"),
+            batcher.submit("c", language="en"),
+            # None options are left to the defaults of batch_fn
+            batcher.submit("d", language=None),
+        )
+
+    assert run_with(batcher, scenario) == ["en:a", "it:b", "en:c", "-:d"]
+    assert sorted(batch_fn.calls, key=lambda call: call[0]) == [
+        (["a", "c"], {"language": "en"}),
+        (["b"], {"language": "it"}),
+        (["d"], {}),
+    ]
+
+
+def test_full_queue_rejects_new_requests():
+    release = threading.Event()
+    batch_fn = FakeBatch(release=release)
+    executor = BoundedExecutor("test", max_workers=1)
+    batcher = MicroBatcher(batch_fn, executor=executor, max_batch_size=1, max_wait_ms=0, max_queue=2)
+
+    async def scenario():
+        # One batch running, one waiting for the worker, two left in the queue
+        waiting = []
+        for text in "abcd":
+            waiting.append(asyncio.ensure_future(batcher.submit(text)))
+            await asyncio.sleep(0.02)
+        with pytest.raises(WorkerPoolFull):
+            await batcher.submit("e")
+        release.set()
+        return await asyncio.gather(*waiting)
+
+    try:
+        assert run_with(batcher, scenario) == ["-:a", "-:b", "-:c", "-:d"]
+    finally:
+        release.set()
+        executor.shutdown()
+
+
+def test_batches_in_flight_are_bounded_by_the_workers():
+    batch_fn = FakeBatch(delay=0.02)
+    executor = BoundedExecutor("test", max_workers=2)
+    batcher = MicroBatcher(batch_fn, executor=executor, max_batch_size=1, max_wait_ms=0)
+
+    async def scenario():
+        return await batcher.submit_many([str(i) for i in range(8)])
+
+    try:
+        assert run_with(batcher, scenario) == [f"-:{i}" for i in range(8)]
+        assert batch_fn.max_running == 2
+    finally:
+        executor.shutdown()
+
+
+def test_batch_errors_reach_every_request():
+    def failing(texts, **options):
+        raise RuntimeError("model crashed")
+
+    batcher = MicroBatcher(failing, max_wait_ms=50)
+
+    async def scenario():
+        return await asyncio.gather(batcher.submit("a"), batcher.submit("b"), return_exceptions=True)
+
+    results = run_with(batcher, scenario)
+    assert [str(result) for result in results] == ["model crashed", "model crashed"]
@@ -0,0 +1,46 @@
+import datetime
+import io
+
+import pytest
+
+from app.api.checkins import CheckinUploadTooLarge, parse_csv, parse_ndjson, parse_upload
+
+
+def test_csv_quoted_fields_may_contain_newlines():
+    body = io.BytesIO(
+        b'habit_id,entry_date,status,notes\r\n'
+        b'1,2024-05-01,completed,"ran\nin the rain"\r\n'
+        b'\r\n'
+        b'2,2024-05-02,bogus,\r\n'
+    )
+    upload = parse_csv(body)
+
+    assert upload.received == 2
+    assert upload.rows == [(1, 1, datetime.date(2024, 5, 1), "completed", "ran\nin the rain")]
+    assert upload.rejected == [{"row": 2, "error": "status must be one of completed, missed, partial"}]
+
+
+def test_ndjson_reports_invalid_lines():
+    body = io.BytesIO(
+        b'\xef\xbb\xbf{"habit_id": 3, "entry_date": "2024-05-01", "status": "missed"}\n'
+        b'\n'
+        b'{not json}\r\n'
+        b'{"habit_id": 4, "entry_date": "2024-05-02", "status": "partial", "notes": "half"}'
+    )
+    upload = parse_ndjson(body)
+
+    assert upload.received == 3
+    assert [(row[0], row[1], row[3]) for row in upload.rows] == [(1, 3, "missed"), (3, 4, "partial")]
+    assert [reject["row"] for reject in upload.rejected] == [2]
+
+
+def test_parse_upload_closes_the_body(monkeypatch):
+    body = io.BytesIO(b'{"habit_id": 3, "entry_date": "2024-05-01", "status": "missed"}\n')
+    assert parse_upload(body, "ndjson").received == 1
+    assert body.closed
+
+    monkeypatch.setattr("app.api.checkins.MAX_CHECKIN_ROWS", 0)
+    body = io.BytesIO(b'habit_id,entry_date,status\r\n1,2024-05-01,completed\r\n')
+    with pytest.raises(CheckinUploadTooLarge):
+        parse_upload(body, "csv")
+    assert body.closed
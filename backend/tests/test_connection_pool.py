@@ -0,0 +1,63 @@
+import time
+
+import psycopg2.extensions
+import pytest
+
+from app.db.database import ConnectionPool
+
+
+class FakeConnection:
+    closed = 0
+
+    def get_transaction_status(self):
+        return psycopg2.extensions.TRANSACTION_STATUS_IDLE
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        self.closed = 1
+
+
+@pytest.fixture
+def make_pool(monkeypatch):
+    opened = []
+
+    def connect(self):
+        conn = FakeConnection()
+        self._created_at[id(conn)] = time.monotonic()
+        opened.append(conn)
+        return conn
+
+    monkeypatch.setattr(ConnectionPool, "_connect", connect)
+
+    def make(**kwargs):
+        return ConnectionPool({}, **kwargs), opened
+
+    return make
+
+
+@pytest.mark.parametrize("min_size", [1, 2, 4, 5, 8])
+def test_fill_opens_min_size_connections(make_pool, min_size):
+    pool, opened = make_pool(min_size=min_size, max_size=10)
+    pool.fill()
+
+    stats = pool.stats()
+    assert len(opened) == min_size
+    assert stats["size"] == min_size
+    assert stats["idle"] == min_size
+    assert stats["in_use"] == 0
+
+
+def test_fill_counts_connections_already_open(make_pool):
+    pool, opened = make_pool(min_size=4, max_size=10)
+    in_use = [pool.getconn(), pool.getconn()]
+    pool.putconn(in_use[0])
+
+    pool.fill()
+
+    assert len(opened) == 4
+    assert pool.stats()["size"] == 4
+
+    pool.fill()
+    assert len(opened) == 4
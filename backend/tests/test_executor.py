@@ -0,0 +1,88 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from app.api.executor import BoundedExecutor, WorkerPoolFull, WorkerTimeout
+
+
+def test_run_returns_the_result_and_releases_the_slot():
+    executor = BoundedExecutor("test", max_workers=2)
+
+    async def scenario():
+        return await executor.run(lambda a, b: a + b, 2, 3)
+
+    try:
+        assert asyncio.run(scenario()) == 5
+        assert executor.pending == 0
+    finally:
+        executor.shutdown()
+
+
+def test_tasks_beyond_max_pending_are_rejected():
+    executor = BoundedExecutor("test", max_workers=1, max_pending=1)
+    release = threading.Event()
+
+    async def scenario():
+        running = asyncio.ensure_future(executor.run(release.wait))
+        await asyncio.sleep(0.01)
+        with pytest.raises(WorkerPoolFull):
+            await executor.run(lambda: None)
+        release.set()
+        assert await running is True
+
+    try:
+        asyncio.run(scenario())
+        assert executor.pending == 0
+    finally:
+        release.set()
+        executor.shutdown()
+
+
+def test_running_task_keeps_its_slot_until_it_finishes():
+    executor = BoundedExecutor("test", max_workers=1, timeout=0.05)
+    release = threading.Event()
+
+    async def scenario():
+        with pytest.raises(WorkerTimeout):
+            await executor.run(release.wait)
+        # The thread cannot be interrupted: it still counts as pending
+        assert executor.pending == 1
+        release.set()
+        for _ in range(100):
+            if executor.pending == 0:
+                break
+            await asyncio.sleep(0.01)
+
+    try:
+        asyncio.run(scenario())
+        assert executor.pending == 0
+    finally:
+        release.set()
+        executor.shutdown()
+
+
+def test_queued_task_that_times_out_never_runs():
+    executor = BoundedExecutor("test", max_workers=1, max_pending=4)
+    release = threading.Event()
+    calls = []
+
+    async def scenario():
+        running = asyncio.ensure_future(executor.run(release.wait))
+        await asyncio.sleep(0.01)
+        with pytest.raises(WorkerTimeout):
+            await executor.run(calls.append, "dropped", timeout=0.05)
+        # Dropped from the queue: its slot is released right away
+        assert executor.pending == 1
+        release.set()
+        await running
+
+    try:
+        asyncio.run(scenario())
+        time.sleep(0.05)
+        assert calls == []
+        assert executor.pending == 0
+    finally:
+        release.set()
+        executor.shutdown()
@@ -0,0 +1,66 @@
+import datetime
+import decimal
+import json
+
+from app.db.habit_cache import HabitCache, LocalCacheBackend
+
+ROW = {
+    "id": 5,
+    "name": "run",
+    "ml_confidence": decimal.Decimal("0.87"),
+    "created_at": datetime.datetime(2024, 6, 30, 8, 15, 2, 123456),
+    "last_entry_date": datetime.date(2024, 6, 29),
+    "user_id": None,
+}
+
+
+def _workers():
+    """Due processi che condividono il backend, ciascuno con la sua LRU locale"""
+    backend = LocalCacheBackend()
+    return HabitCache(backend=backend), HabitCache(backend=backend), backend
+
+
+def test_shared_values_are_json_and_keep_types():
+    worker_a, worker_b, backend = _workers()
+    key = worker_a.habit_key(5)
+    worker_a.set(key, ROW, worker_a.version(5))
+
+    assert json.loads(backend.get(key))["id"] == 5
+    found, value = worker_b.get(key)
+    assert found and value == ROW
+
+
+def test_read_started_before_other_worker_invalidation_is_not_stored():
+    worker_a, worker_b, backend = _workers()
+    key = worker_a.habit_key(5)
+
+    # A legge la versione e interroga il database; intanto B scrive e invalida
+    version = worker_a.version(5)
+    worker_b.invalidate(habit_ids=[5])
+    worker_a.set(key, ROW, version)
+
+    assert backend.get(key) is None
+    assert worker_b.get(key) == (False, None)
+    assert worker_a.get(key) == (False, None)
+    assert worker_a.stats()["stale_sets"] == 1
+
+
+def test_other_habit_invalidation_does_not_block_set():
+    worker_a, worker_b, _ = _workers()
+    key = worker_a.habit_key(5)
+
+    version = worker_a.version(5)
+    worker_b.invalidate(habit_ids=[6])
+    worker_a.set(key, ROW, version)
+
+    assert worker_b.get(key) == (True, ROW)
+
+
+def test_list_pages_follow_shared_generation():
+    worker_a, worker_b, _ = _workers()
+    key = worker_a.list_key(7, (50, None))
+    worker_a.set(key, ([ROW], None), worker_a.version())
+
+    assert worker_b.get(worker_b.list_key(7, (50, None)))[0]
+    worker_b.invalidate(user_ids=[7])
+    assert worker_a.list_key(7, (50, None)) != key
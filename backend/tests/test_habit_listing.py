@@ -0,0 +1,86 @@
+import base64
+import datetime
+import decimal
+
+import orjson
+import pytest
+
+from app.db.database import HabitRepository, decode_cursor, encode_cursor
+
+
+def test_cursor_round_trip():
+    created_at = datetime.datetime(2024, 6, 30, 12, 30, 15, 123456, tzinfo=datetime.timezone.utc)
+
+    cursor = encode_cursor(created_at, 42)
+
+    assert "=" not in cursor
+    assert decode_cursor(cursor) == (created_at, 42)
+
+
+@pytest.mark.parametrize("cursor", [
+    "not a cursor",
+    encode_cursor(datetime.datetime(2024, 6, 30), 42)[:-3],
+    base64.urlsafe_b64encode(b'["2024-06-30T00:00:00"]').decode(),
+    base64.urlsafe_b64encode(b'["yesterday", 42]').decode(),
+    base64.urlsafe_b64encode(b'["2024-06-30T00:00:00", "42; DROP TABLE habits"]').decode(),
+    base64.urlsafe_b64encode(b'{"created_at": 1}').decode(),
+])
+def test_tampered_cursor_is_rejected(cursor):
+    with pytest.raises(ValueError):
+        decode_cursor(cursor)
+
+
+def test_pages_cover_every_habit_once():
+    repo = HabitRepository()
+    if not repo.db.test_connection():
+        pytest.skip("Postgres not reachable (DB_* variables)")
+    with repo.db.get_connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute(
+                "INSERT INTO users (username, email, password_hash) "
+                "VALUES ('test_pages', 'test_pages@example.com', 'x') RETURNING id")
+            user_id = cursor.fetchone()[0]
+        conn.commit()
+
+    try:
+        # Stessa transazione, stesso created_at: l'ordine lo decide l'id
+        ids = repo.create_habits([{"name": f"h{i}", "description": "d", "user_id": user_id} for i in range(5)])
+        pages, cursor = [], None
+        while True:
+            rows, cursor = repo.get_habits_page(user_id, limit=2, cursor=cursor, columns=["name"], use_cache=False)
+            pages.append([row["id"] for row in rows])
+            if cursor is None:
+                break
+
+        assert pages == [sorted(ids, reverse=True)[i:i + 2] for i in (0, 2, 4)]
+        with pytest.raises(ValueError):
+            repo.get_habits_page(user_id, cursor="garbage", use_cache=False)
+    finally:
+        repo.db.execute_update("DELETE FROM users WHERE id = %s", (user_id,))
+
+
+ROWS = [
+    {"id": i, "created_at": datetime.datetime(2024, 6, 30, 12, 0, i), "score": decimal.Decimal("0.5")}
+    for i in range(5)
+]
+
+
+def test_export_json_array():
+    from app.api.server import _export_chunks
+
+    chunks = list(_export_chunks(iter(ROWS), ndjson=False, rows_per_chunk=2))
+
+    assert all(isinstance(chunk, bytes) for chunk in chunks)
+    assert orjson.loads(b"".join(chunks)) == [
+        {"id": i, "created_at": f"2024-06-30T12:00:0{i}", "score": 0.5} for i in range(5)
+    ]
+
+
+def test_export_ndjson_and_empty():
+    from app.api.server import _export_chunks
+
+    lines = b"".join(_export_chunks(iter(ROWS), ndjson=True, rows_per_chunk=2)).splitlines()
+
+    assert [orjson.loads(line)["id"] for line in lines] == list(range(5))
+    assert b"".join(_export_chunks(iter([]), ndjson=False)) == b"[]"
+    assert list(_export_chunks(iter([]), ndjson=True)) == []
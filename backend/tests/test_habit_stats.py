@@ -0,0 +1,88 @@
+import datetime
+
+import numpy as np
+import pytest
+
+from app.db import habit_stats
+
+TODAY = datetime.date(2024, 6, 30)
+
+# Completamenti con pause lunghe: giorni rispetto a TODAY
+IDLE_GAPS = [
+    # 29 giorni di fila, poi 70 giorni di pausa
+    [-99 + i for i in range(29)],
+    # due periodi attivi separati da una pausa, l'ultimo appena finito
+    [-120 + i for i in range(10)] + [-40 + i for i in range(12)],
+    # settimane alterne
+    [-84 + 14 * week + day for week in range(6) for day in (0, 2, 4)],
+    # attiva fino a ieri
+    [-20 + i for i in range(20)],
+]
+RULES = [(1, 1), (3, 7), (1, 2)]
+
+
+def _date(offset: int) -> datetime.date:
+    return TODAY + datetime.timedelta(days=offset)
+
+
+def _comparable(stats):
+    # last_entry_date e updated_at vengono dalle scritture, non dal calcolo
+    return {key: value for key, value in stats.items() if key not in ("updated_at", "last_entry_date")}
+
+
+def _public(row, today):
+    return _comparable(habit_stats.public_stats(row, today))
+
+
+def _full(rule, days, today, habit_id=1):
+    """Statistiche del ricalcolo completo, come le vede il client"""
+    days = np.array([habit_stats.day_number(_date(offset)) for offset in days], dtype=np.int64)
+    row = habit_stats.compute_stats({habit_id: rule}, np.full(len(days), habit_id, dtype=np.int64), days, today)[habit_id]
+    return _public(row, today)
+
+
+@pytest.mark.parametrize("rule", RULES)
+@pytest.mark.parametrize("days", IDLE_GAPS)
+def test_incremental_matches_full_recompute_after_idle_gap(rule, days):
+    row = habit_stats.empty_stats(1, *rule)
+    for offset in days:
+        assert habit_stats.apply_completion(row, habit_stats.day_number(_date(offset)))
+    # La finestra si riconta il giorno della lettura, come in read_stats
+    start = habit_stats.window_start(TODAY)
+    habit_stats.set_window(row, sum(start <= _date(offset) <= TODAY for offset in days))
+
+    assert _public(row, TODAY) == _full(rule, days, TODAY)
+
+
+def _write_entries(cursor, habit_id, offsets, today):
+    cursor.execute(
+        """
+        INSERT INTO habit_entries (habit_id, entry_date, status)
+        SELECT %s, unnest(%s::date[]), 'completed'
+        RETURNING habit_id, entry_date, status, (xmax = 0)
+        """,
+        (habit_id, [_date(offset) for offset in offsets]),
+    )
+    habit_stats.apply_entries(cursor, cursor.fetchall(), today)
+
+
+@pytest.mark.parametrize("rule", RULES)
+def test_stored_stats_are_read_against_today(cursor, rule):
+    cursor.execute(
+        "INSERT INTO habits (name, description, frequency_count, frequency_period) VALUES (%s, %s, %s, %s) RETURNING id",
+        ("test", "test", *rule),
+    )
+    habit_id = cursor.fetchone()[0]
+    days = IDLE_GAPS[0] + [-30, -29]
+
+    # Scritture incrementali nei giorni delle entry, poi una lettura 70 giorni dopo l'ultima
+    _write_entries(cursor, habit_id, IDLE_GAPS[0][:15], _date(IDLE_GAPS[0][14]))
+    _write_entries(cursor, habit_id, IDLE_GAPS[0][15:], _date(IDLE_GAPS[0][-1]))
+    for read_offset in (-71, -40):
+        stats = habit_stats.read_stats(cursor, [habit_id], _date(read_offset))[habit_id]
+        assert _comparable(stats) == _full(rule, IDLE_GAPS[0], _date(read_offset), habit_id)
+
+    _write_entries(cursor, habit_id, [-30, -29], _date(-29))
+    stats = habit_stats.read_stats(cursor, [habit_id], TODAY)[habit_id]
+    assert stats["window_completed"] == 1
+    assert _comparable(stats) == _full(rule, days, TODAY, habit_id)
@@ -0,0 +1,26 @@
+import pytest
+
+from NLM.language_detect import DEFAULT_PROFILES_PATH, NgramLanguageDetector
+
+
+@pytest.fixture(scope="module")
+def detector():
+    return NgramLanguageDetector.from_file(DEFAULT_PROFILES_PATH)
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("Bere 2 litri di acqua al giorno", "it"),
+    ("Corro 5km tutti i giorni", "it"),
+    ("Meditare 10 minuti", "it"),
+    ("Leggo un libro", "it"),
+    ("Correre", "it"),
+    ("Read 20 pages every day", "en"),
+    ("I run every morning", "en"),
+    ("Walk the dog", "en"),
+    ("Drink water", "en"),
+    # Nessuna lettera: nessuna lingua
+    ("123 !!", None),
+    ("", None),
+])
+def test_detect_short_texts(detector, text, expected):
+    assert detector.detect(text) == expected
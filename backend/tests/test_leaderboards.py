@@ -0,0 +1,95 @@
+import datetime
+
+import pytest
+
+from app.db import habit_stats, leaderboards
+from app.db.database import HabitRepository
+
+TODAY = datetime.date(2024, 6, 30)
+
+
+def _member(cursor, group_id, name, offsets, frequency=(1, 1)):
+    cursor.execute(
+        "INSERT INTO users (username, email, password_hash) VALUES (%s, %s, 'x') RETURNING id",
+        (name, f"{name}@example.com"),
+    )
+    user_id = cursor.fetchone()[0]
+    cursor.execute(
+        "INSERT INTO habits (user_id, name, description, frequency_count, frequency_period) "
+        "VALUES (%s, 'run', 'run', %s, %s) RETURNING id",
+        (user_id, *frequency),
+    )
+    habit_id = cursor.fetchone()[0]
+    cursor.execute(
+        "INSERT INTO habit_entries (habit_id, entry_date, status) SELECT %s, unnest(%s::date[]), 'completed'",
+        (habit_id, [TODAY + datetime.timedelta(days=offset) for offset in offsets]),
+    )
+    cursor.execute("INSERT INTO group_members (group_id, user_id) VALUES (%s, %s)", (group_id, user_id))
+    return user_id, habit_id
+
+
+def test_idle_member_loses_score_and_streak(cursor):
+    cursor.execute("INSERT INTO social_groups (name) VALUES ('test') RETURNING id")
+    group_id = cursor.fetchone()[0]
+    idle, idle_habit = _member(cursor, group_id, "test_idle", range(-99, -70))
+    active, active_habit = _member(cursor, group_id, "test_active", range(-5, 1))
+    # Statistiche scritte il giorno dell'ultima entry di ciascuno
+    habit_stats.recompute(cursor, [idle_habit], TODAY - datetime.timedelta(days=71))
+    habit_stats.recompute(cursor, [active_habit], TODAY)
+
+    assert leaderboards.refresh_groups(cursor, [group_id], TODAY) == [group_id]
+    cursor.execute(
+        "SELECT user_id, score, best_current_streak, longest_streak, completion_rate "
+        "FROM group_leaderboard WHERE group_id = %s",
+        (group_id,),
+    )
+    rows = {row[0]: row[1:] for row in cursor.fetchall()}
+    assert rows[idle] == (0, 0, 29, 0)
+    assert rows[active][:3] == (6, 6, 6)
+    assert float(rows[active][3]) == habit_stats.completion_rate(6, 1, 1)
+
+
+def test_habit_without_stats_uses_its_frequency(cursor):
+    cursor.execute("INSERT INTO social_groups (name) VALUES ('test') RETURNING id")
+    group_id = cursor.fetchone()[0]
+    # Entry registrate ma nessuna riga habit_stats: 6 completamenti con obiettivo 3 su 7
+    user_id, _ = _member(cursor, group_id, "test_nostats", range(-5, 1), frequency=(3, 7))
+
+    leaderboards.refresh_groups(cursor, [group_id], TODAY)
+    cursor.execute("SELECT score, completion_rate FROM group_leaderboard WHERE user_id = %s", (user_id,))
+    score, rate = cursor.fetchone()
+    assert score == 6
+    assert float(rate) == habit_stats.completion_rate(6, *habit_stats.bucket_rule(3, 7))
+    assert float(rate) < 1
+
+
+def test_new_habits_count_at_once():
+    repo = HabitRepository()
+    if not repo.db.test_connection():
+        pytest.skip("Postgres not reachable (DB_* variables)")
+    with repo.db.get_connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute(
+                "INSERT INTO users (username, email, password_hash) "
+                "VALUES ('test_counted', 'test_counted@example.com', 'x') RETURNING id")
+            user_id = cursor.fetchone()[0]
+            cursor.execute("INSERT INTO social_groups (name, created_by) VALUES ('test', %s) RETURNING id", (user_id,))
+            group_id = cursor.fetchone()[0]
+            cursor.execute("INSERT INTO group_members (group_id, user_id) VALUES (%s, %s)", (group_id, user_id))
+            leaderboards.refresh_groups(cursor, [group_id])
+        conn.commit()
+
+    def habits_in_leaderboard():
+        rows = repo.db.execute_query(
+            "SELECT habits FROM group_leaderboard WHERE group_id = %s AND user_id = %s", (group_id, user_id))
+        return rows[0]["habits"]
+
+    try:
+        assert habits_in_leaderboard() == 0
+        repo.create_habit("run", "run", user_id=user_id)
+        assert habits_in_leaderboard() == 1
+        repo.create_habits([{"name": "read", "description": "read", "user_id": user_id}] * 2, returning=False)
+        assert habits_in_leaderboard() == 3
+    finally:
+        # Cancella a cascata abitudini, gruppo e classifica
+        repo.db.execute_update("DELETE FROM users WHERE id = %s", (user_id,))
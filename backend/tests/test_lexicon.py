@@ -0,0 +1,46 @@
+import pytest
+
+from NLM.lexicon import DEFAULT_LEXICON_PATH, LexiconEngine
+
+
+@pytest.fixture(scope="module")
+def lexicon():
+    return LexiconEngine.from_file(DEFAULT_LEXICON_PATH)
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("corro 3 volte alla settimana", (3, 7, 0.9)),
+    ("corro 3 volte a settimana", (3, 7, 0.9)),
+    ("read 2 times per month", (2, 30, 0.9)),
+    ("tutti i giorni", (7, 7, 0.8)),
+    ("run every day", (7, 7, 0.8)),
+    ("ogni mese", (1, 30, 0.8)),
+    # Nella baseline "week"/"month" da soli cadevano nell'alternativa senza gruppo: int(None)
+    ("i run every week", (1, 7, 0.8)),
+    ("read twice a month", None),
+    ("a week of running", None),
+    ("nothing here", None),
+])
+def test_match_frequency(lexicon, text, expected):
+    match = lexicon.match_frequency(text)
+
+    if expected is None:
+        assert match is None
+    else:
+        assert (match["count"], match["period"], match["confidence"]) == expected
+
+
+@pytest.mark.parametrize("unit, language, expected", [
+    ("km", None, "physical_measure"),
+    ("kms.", None, "physical_measure"),
+    ("Pagine", "it", "time_or_quantity"),
+    ("minuti", "it", "time_or_quantity"),
+    ("€", None, "money"),
+    # Unità di un'altra lingua: si ricade sull'indice di tutte le lingue
+    ("pages", "it", "time_or_quantity"),
+    # Confronto esatto, non per sottostringa
+    ("kmx", None, None),
+    ("minutini", "it", None),
+])
+def test_unit_context(lexicon, unit, language, expected):
+    assert lexicon.unit_context(unit, language) == expected
@@ -0,0 +1,33 @@
+import os
+import subprocess
+import sys
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Two forked "workers" record samples; the parent scrapes like the /metrics handler
+SCRAPE = """
+import os
+from app.api import metrics
+
+for _ in range(2):
+    pid = os.fork()
+    if pid == 0:
+        metrics.NLP_EVENTS.labels("analysis_cache", "hit").inc(5)
+        metrics.db_observer("create_habit", 0.01, False)
+        os._exit(0)
+    os.waitpid(pid, 0)
+
+metrics.register_stats("demo", lambda: {"size": 3}, "Demo")
+print(metrics.render_metrics()[0].decode())
+"""
+
+
+def test_metrics_are_aggregated_across_worker_processes(tmp_path):
+    env = dict(os.environ, PROMETHEUS_MULTIPROC_DIR=str(tmp_path), PYTHONPATH=os.pathsep.join([BACKEND, os.path.join(BACKEND, "app")]))
+    result = subprocess.run([sys.executable, "-c", SCRAPE], env=env, cwd=BACKEND, capture_output=True, text=True, check=True)
+    body = result.stdout
+
+    assert 'habitforge_nlp_events_total{event="analysis_cache",result="hit"} 10.0' in body
+    assert 'habitforge_db_operation_duration_seconds_count{operation="create_habit"} 2.0' in body
+    # In-memory stats belong to the process that served the scrape
+    assert 'habitforge_demo_size{pid="' in body
@@ -0,0 +1,49 @@
+from NLM.model_registry import ModelRegistry
+
+
+def test_failed_load_is_not_ready():
+    registry = ModelRegistry(spacy_models={"xx": ["xx_missing_model"]}, ner_models={})
+
+    assert registry.warm_up(["xx"]) == {"xx": False}
+    assert registry.get_spacy("xx") is None
+    assert registry.is_ready(["xx"]) is False
+
+
+def test_loaded_models_are_ready(monkeypatch):
+    registry = ModelRegistry(spacy_models={"xx": ["xx_model"]}, ner_models={"xx": "xx-ner"})
+    monkeypatch.setattr(registry, "_load_spacy", lambda lang: object())
+    monkeypatch.setattr(registry, "_load_ner", lambda lang: object())
+
+    assert registry.is_ready(["xx"]) is False
+    registry.warm_up(["xx"])
+    assert registry.is_ready(["xx"]) is True
+
+
+def test_failed_load_is_retried(monkeypatch):
+    registry = ModelRegistry(spacy_models={"xx": ["xx_model"]}, ner_models={}, retry_after=60)
+    attempts = []
+
+    def flaky_load(lang):
+        attempts.append(lang)
+        return None if len(attempts) == 1 else object()
+
+    monkeypatch.setattr(registry, "_load_spacy", flaky_load)
+
+    assert registry.get_spacy("xx") is None
+    # Within retry_after a request does not pay for another failing load
+    assert registry.get_spacy("xx") is None
+    assert len(attempts) == 1
+
+    # An explicit warm-up retries at once
+    assert registry.warm_up(["xx"]) == {"xx": False}  # no NER model configured for "xx"
+    assert registry.get_spacy("xx") is not None
+    assert len(attempts) == 2
+
+
+def test_failed_load_is_retried_after_the_interval(monkeypatch):
+    registry = ModelRegistry(spacy_models={"xx": ["xx_model"]}, ner_models={}, retry_after=0)
+    results = iter([None, "model"])
+    monkeypatch.setattr(registry, "_load_spacy", lambda lang: next(results))
+
+    assert registry.get_spacy("xx") is None
+    assert registry.get_spacy("xx") == "model"
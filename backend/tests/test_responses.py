@@ -0,0 +1,64 @@
+import numpy as np
+import orjson
+import pytest
+
+from app.api.models.HabitInput import HabitAnalysisResponse, HabitBatchAnalysisResponse
+from app.api.responses import (
+    VERBOSITY_FIELDS, FastJSONResponse, analysis_payload, batch_analysis_payload, resolve_analysis_fields,
+)
+
+# An analysis as extract_habits_ml_batch returns it in full detail (transformer scores are float32)
+ANALYSIS = {
+    "text": "Voglio correre 5km tutti i giorni",
+    "language": "it",
+    "action": "correre",
+    "action_confidence": np.float32(0.91),
+    "quantities": [{"value": 5.0, "unit": "km", "context": "physical_measure"}],
+    "main_quantity": {"value": 5.0, "unit": "km", "context": "physical_measure"},
+    "quantity": "5.0 km",
+    "target": None,
+    "frequency_count": 7,
+    "frequency_period": 7,
+    "frequency_confidence": 0.8,
+    "frequency_text": "7 su 7",
+    "entities_detected": {"PER": [], "ORG": [], "LOC": [{"text": "Roma", "score": np.float32(0.99), "start": 0, "end": 4}],
+                          "MISC": []},
+    "ml_confidence": np.float32(0.855),
+    "extraction_tier": "transformer",
+}
+
+
+def rendered(payload):
+    """The payload as a client receives it"""
+    return orjson.loads(FastJSONResponse(payload).body)
+
+
+def assert_matches(model, body):
+    # Unknown keys would be dropped and wrong types coerced: the round trip must be exact
+    assert model.model_validate(body).model_dump(exclude_unset=True) == body
+
+
+@pytest.mark.parametrize("verbosity", list(VERBOSITY_FIELDS))
+def test_analysis_payload_matches_the_response_model(verbosity):
+    fields = resolve_analysis_fields(None, verbosity)
+
+    body = rendered(analysis_payload("success", "Habit analyzed successfully", ANALYSIS["text"], ANALYSIS, fields))
+
+    assert set(body["analysis"]) == set(fields)
+    assert_matches(HabitAnalysisResponse, body)
+
+
+def test_error_payload_matches_the_response_model():
+    body = rendered(analysis_payload("error", "NLP module not available", "x", None, VERBOSITY_FIELDS["full"]))
+
+    assert_matches(HabitAnalysisResponse, body)
+
+
+def test_batch_payload_matches_the_response_model():
+    fields = resolve_analysis_fields("action,ml_confidence", None)
+
+    body = rendered(batch_analysis_payload(["a", "b"], [ANALYSIS, ANALYSIS], fields))
+
+    assert body["message"] == "2 habits analyzed successfully"
+    assert [result["original_text"] for result in body["results"]] == ["a", "b"]
+    assert_matches(HabitBatchAnalysisResponse, body)
@@ -0,0 +1,114 @@
+import pytest
+
+spacy = pytest.importorskip("spacy")
+from spacy.tokens import Doc
+from spacy.vocab import Vocab
+
+from NLM import segmentation
+from NLM.segmentation import Segment, TooManySegments, segment_doc, segment_text, share_sentence_frequency
+
+
+def parsed(tokens):
+    """Doc built from (text, pos, dep, head) tuples, as a parser would annotate it"""
+    words, pos, deps, heads = zip(*tokens)
+    return Doc(Vocab(), words=list(words), pos=list(pos), deps=list(deps), heads=list(heads))
+
+
+# "Corro 5 km e leggo 20 pagine ogni giorno. Meditazione 10 minuti la sera."
+TWO_SENTENCES = [
+    ("Corro", "VERB", "ROOT", 0),
+    ("5", "NUM", "nummod", 2),
+    ("km", "NOUN", "obj", 0),
+    ("e", "CCONJ", "cc", 4),
+    ("leggo", "VERB", "conj", 0),
+    ("20", "NUM", "nummod", 6),
+    ("pagine", "NOUN", "obj", 4),
+    ("ogni", "DET", "det", 8),
+    ("giorno", "NOUN", "obl", 4),
+    (".", "PUNCT", "punct", 0),
+    ("Meditazione", "NOUN", "ROOT", 10),
+    ("10", "NUM", "nummod", 12),
+    ("minuti", "NOUN", "nmod", 10),
+    ("la", "DET", "det", 14),
+    ("sera", "NOUN", "obl", 10),
+    (".", "PUNCT", "punct", 10),
+]
+
+
+def test_clauses_are_split_and_trimmed():
+    segments = segment_doc(parsed(TWO_SENTENCES))
+
+    assert segments[:2] == [Segment("Corro 5 km", 0), Segment("leggo 20 pagine ogni giorno", 0)]
+
+
+def test_verbless_sentence_is_its_own_segment():
+    segments = segment_doc(parsed(TWO_SENTENCES))
+
+    assert segments[2:] == [Segment("Meditazione 10 minuti la sera", 1)]
+
+
+def test_verbless_piece_joins_the_following_clause():
+    # "nuoto" is a conjunct of "pedalo", which owns the leading "in piscina":
+    # the piece between the two clause starts has no verb of its own
+    doc = parsed([
+        ("Corro", "VERB", "ROOT", 0),
+        ("e", "CCONJ", "cc", 5),
+        ("in", "ADP", "case", 3),
+        ("piscina", "NOUN", "obl", 5),
+        ("nuoto", "VERB", "conj", 5),
+        ("pedalo", "VERB", "conj", 0),
+    ])
+
+    assert segment_doc(doc) == [Segment("Corro", 0), Segment("in piscina nuoto pedalo", 0)]
+
+
+def test_long_clauses_are_chunked():
+    segments = segment_doc(parsed(TWO_SENTENCES[:3]), max_tokens=2)
+
+    assert segments == [Segment("Corro 5", 0), Segment("km", 0)]
+
+
+def test_too_many_segments(monkeypatch):
+    doc = parsed(TWO_SENTENCES)
+
+    class StubRegistry:
+        def get_spacy(self, lang):
+            return lambda text: doc
+
+    monkeypatch.setattr(segmentation, "registry", StubRegistry())
+    monkeypatch.setattr(segmentation, "detect_language_code", lambda text, hint=None: hint)
+    monkeypatch.setattr(segmentation, "MAX_SEGMENTS", 2)
+
+    with pytest.raises(TooManySegments):
+        segment_text(doc.text, language="it")
+
+    monkeypatch.setattr(segmentation, "MAX_SEGMENTS", 3)
+    assert segment_text(doc.text, language="it") == ("it", segment_doc(doc))
+
+
+def analysis(count=None, period=None, confidence=0.0):
+    return {
+        "frequency_count": count,
+        "frequency_period": period,
+        "frequency_text": f"{count} su {period}" if count else None,
+        "frequency_confidence": confidence,
+    }
+
+
+def test_sentence_frequency_is_shared_with_its_clauses():
+    segments = [Segment("Corro 5 km", 0), Segment("leggo 20 pagine ogni giorno", 0), Segment("Meditazione", 1)]
+    analyses = [analysis(), analysis(7, 7, 0.8), analysis()]
+
+    results = share_sentence_frequency(segments, analyses)
+
+    assert results[0] == analysis(7, 7, 0.4)
+    # Other sentences keep their own (missing) frequency, inputs are not modified
+    assert results[2] == analysis()
+    assert analyses[0] == analysis()
+
+
+def test_conflicting_frequencies_are_not_shared():
+    segments = [Segment("a", 0), Segment("b", 0), Segment("c", 0)]
+    analyses = [analysis(), analysis(7, 7, 0.8), analysis(1, 7, 0.8)]
+
+    assert share_sentence_frequency(segments, analyses) == analyses
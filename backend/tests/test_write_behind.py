@@ -0,0 +1,130 @@
+import threading
+
+import psycopg2
+import pytest
+
+from app.db.write_behind import WriteBehindQueue, WriteQueueFull
+
+
+class FakeWriter:
+    """write_fn che fallisce le prime `failures` chiamate e rifiuta i batch con righe "bad" """
+
+    def __init__(self, failures=0, error=psycopg2.OperationalError):
+        self.failures = failures
+        self.error = error
+        self.calls = 0
+        self.written = []
+        self._lock = threading.Lock()
+
+    def __call__(self, rows):
+        with self._lock:
+            self.calls += 1
+            if self.failures:
+                self.failures -= 1
+                raise self.error("connection lost")
+            if any(row.get("bad") for row in rows):
+                raise psycopg2.DataError("invalid row")
+            self.written.extend(row["id"] for row in rows)
+
+
+def rows(*ids):
+    return [{"id": i} for i in ids]
+
+
+def test_connection_errors_are_retried():
+    writer = FakeWriter(failures=2)
+    queue = WriteBehindQueue(writer, max_retries=2, retry_backoff=0)
+
+    queue.submit_many(rows(1, 2))
+    assert queue.stop()
+
+    assert writer.written == [1, 2]
+    stats = queue.stats()
+    assert (stats["written"], stats["retries"], stats["failed"]) == (2, 2, 0)
+
+
+def test_batch_is_lost_after_max_retries():
+    writer = FakeWriter(failures=3)
+    queue = WriteBehindQueue(writer, max_retries=2, retry_backoff=0)
+
+    queue.submit_many(rows(1, 2))
+    queue.stop()
+
+    assert writer.calls == 3
+    assert (queue.stats()["written"], queue.stats()["failed"]) == (0, 2)
+
+
+def test_invalid_row_does_not_lose_the_batch():
+    writer = FakeWriter()
+    queue = WriteBehindQueue(writer, retry_backoff=0)
+
+    queue.submit_many([{"id": 1}, {"id": 2, "bad": True}, {"id": 3}])
+    queue.stop()
+
+    assert writer.written == [1, 3]
+    assert (queue.stats()["written"], queue.stats()["failed"]) == (2, 1)
+
+
+def test_full_queue_rejects():
+    queue = WriteBehindQueue(FakeWriter(), max_queue=2, on_full="reject")
+
+    with pytest.raises(WriteQueueFull):
+        queue.submit_many(rows(1, 2, 3))
+
+    stats = queue.stats()
+    assert (stats["pending"], stats["enqueued"], stats["rejected"]) == (2, 2, 1)
+
+
+def test_full_queue_writes_the_overflow_in_the_caller():
+    writer = FakeWriter()
+    queue = WriteBehindQueue(writer, max_queue=2, on_full="sync")
+
+    queue.submit_many(rows(1, 2, 3))
+
+    # La riga in eccesso è già scritta, le altre attendono il flush
+    assert writer.written == [3]
+    assert queue.stats()["written_sync"] == 1
+    queue.stop()
+    assert writer.written == [3, 1, 2]
+
+
+def test_full_queue_blocks_until_timeout():
+    queue = WriteBehindQueue(FakeWriter(), max_queue=1, on_full="block", block_timeout=0.05)
+    queue.submit(rows(1)[0])
+
+    with pytest.raises(WriteQueueFull):
+        queue.submit(rows(2)[0])
+    assert queue.stats()["rejected"] == 1
+
+
+def test_full_queue_blocks_until_the_writer_frees_space():
+    writer = FakeWriter()
+    queue = WriteBehindQueue(writer, max_queue=1, on_full="block", block_timeout=5, flush_interval=0.01)
+    queue.submit(rows(1)[0])
+    # Il thread di scrittura parte mentre il chiamante è in attesa
+    threading.Timer(0.05, queue.start).start()
+
+    queue.submit(rows(2)[0])
+    assert queue.stop(timeout=5)
+
+    assert writer.written == [1, 2]
+    assert queue.stats()["rejected"] == 0
+
+
+def test_stop_drains_the_queue():
+    writer = FakeWriter()
+    queue = WriteBehindQueue(writer, batch_size=2, flush_interval=60)
+    queue.start()
+
+    queue.submit_many(rows(1, 2, 3, 4, 5))
+    assert queue.stop(timeout=5)
+
+    assert sorted(writer.written) == [1, 2, 3, 4, 5]
+    assert queue.stats()["pending"] == 0
+    with pytest.raises(WriteQueueFull):
+        queue.submit(rows(6)[0])
+
+
+def test_unknown_policy():
+    with pytest.raises(ValueError):
+        WriteBehindQueue(FakeWriter(), on_full="drop")